@@ -2,49 +2,188 @@
 """
 YOLOアノテーターのメインエントリーポイント
 Djangoサーバーを起動します。
+
+    yolo-annotator                 開発サーバー（runserver）で起動
+    yolo-annotator --production    複数ワーカーの本番用サーバー（gunicorn / uvicorn）で起動
+
+本番モードの設定はコマンドライン引数のほか、環境変数
+YOLO_BIND / YOLO_WORKERS / YOLO_THREADS / YOLO_INTERFACE / YOLO_SERVER でも指定できます。
 """
+import argparse
 import os
+import secrets
+import socket
 import sys
 import subprocess
 from pathlib import Path
 
+# YOLO_SECRET_KEY が未設定の場合に本番モードで生成・保存する秘密鍵のファイル
+SECRET_KEY_FILE = Path(__file__).parent / "yolo_annotator" / ".secret_key"
+
+
+def default_worker_count():
+    """本番モードのワーカープロセス数の既定値（CPUコア数×2+1、gunicornの推奨値）"""
+    return (os.cpu_count() or 1) * 2 + 1
+
+
+def default_server():
+    """gunicornはWindowsで動作しないため、Windowsではuvicornを使用"""
+    return 'uvicorn' if sys.platform == 'win32' else 'gunicorn'
+
+
+def load_or_create_secret_key(path=SECRET_KEY_FILE):
+    """秘密鍵をファイルから読み込む（初回は生成して所有者のみ読み書きできるファイルに保存し、再起動後も同じ鍵を使う）"""
+    try:
+        key = path.read_text(encoding="utf-8").strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    key = secrets.token_urlsafe(50)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(key)
+    return key
+
+
+def default_allowed_hosts(host):
+    """ALLOWED_HOSTS の既定値：localhost と待ち受けアドレス（0.0.0.0 の場合はこのマシンのホスト名とIPアドレス）"""
+    hosts = ["localhost", "127.0.0.1"]
+    if host in ("0.0.0.0", "::"):
+        try:
+            name, aliases, addresses = socket.gethostbyname_ex(socket.gethostname())
+            hosts += [name, *aliases, *addresses]
+        except OSError:
+            hosts.append(socket.gethostname())
+    elif host:
+        hosts.append(host)
+    return list(dict.fromkeys(hosts))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='YOLO Annotator を起動します')
+    parser.add_argument('--production', action='store_true',
+                        default=os.environ.get('YOLO_PRODUCTION') == '1',
+                        help='DEBUGを無効にし、複数ワーカーの本番用サーバーで起動（環境変数 YOLO_PRODUCTION=1）')
+    parser.add_argument('--bind', default=os.environ.get('YOLO_BIND', '127.0.0.1:8000'),
+                        help='待ち受けるアドレス:ポート（環境変数 YOLO_BIND、既定: 127.0.0.1:8000）')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('YOLO_WORKERS', default_worker_count())),
+                        help='ワーカープロセス数（環境変数 YOLO_WORKERS、既定: CPUコア数×2+1）')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('YOLO_THREADS', '4')),
+                        help='WSGIワーカーあたりのスレッド数（環境変数 YOLO_THREADS、既定: 4）')
+    parser.add_argument('--interface', choices=('wsgi', 'asgi'), default=os.environ.get('YOLO_INTERFACE', 'asgi'),
+                        help='gunicornで使用するアプリケーション（wsgi.py / asgi.py、環境変数 YOLO_INTERFACE）')
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default=os.environ.get('YOLO_SERVER', default_server()),
+                        help='本番用サーバー（環境変数 YOLO_SERVER、既定: gunicorn / Windowsではuvicorn）')
+    parser.add_argument('--no-job-worker', action='store_true',
+                        help='ジョブワーカーを起動しない（別のホスト・サービスで実行する場合）')
+    return parser.parse_args(argv)
+
 
-def main():
+def production_command(args):
+    """本番用サーバーの起動コマンドを作成"""
+    if args.server == 'uvicorn':
+        # uvicornはASGIアプリケーションのみ使用
+        host, _, port = args.bind.rpartition(':')
+        return [
+            sys.executable, "-m", "uvicorn", "yolo_annotator.asgi:application",
+            "--host", host or '127.0.0.1', "--port", port,
+            "--workers", str(args.workers),
+            "--no-access-log",
+        ]
+
+    app = f"yolo_annotator.{args.interface}:application"
+    command = [
+        sys.executable, "-m", "gunicorn", app,
+        "--bind", args.bind,
+        "--workers", str(args.workers),
+        # 大きな画像の配信やエクスポートの開始でワーカーが打ち切られないよう長めに設定
+        "--timeout", "120",
+    ]
+    if args.interface == 'asgi':
+        command += ["--worker-class", "uvicorn_worker.UvicornWorker"]
+    else:
+        command += ["--worker-class", "gthread", "--threads", str(args.threads)]
+    return command
+
+
+def main(argv=None):
     """Djangoサーバーを起動します。"""
+    args = parse_args(argv)
     print("🚀 YOLO Annotator を起動しています...")
-    
+
     # プロジェクトのルートディレクトリ
     project_root = Path(__file__).parent
     django_project_dir = project_root / "yolo_annotator"
-    
+
     # Djangoプロジェクトディレクトリに移動
     os.chdir(django_project_dir)
-    
+
     # manage.pyのパス
     manage_py = django_project_dir / "manage.py"
-    
+
     if not manage_py.exists():
         print("❌ manage.py が見つかりません。")
         print(f"   期待されるパス: {manage_py}")
         sys.exit(1)
-    
+
+    if args.production:
+        # 子プロセス（サーバー・ジョブワーカー・collectstatic）にも本番設定を引き継ぐ
+        os.environ["YOLO_DEBUG"] = "0"
+        os.environ["YOLO_INTERFACE"] = 'asgi' if args.server == 'uvicorn' else args.interface
+        if not os.environ.get("YOLO_SECRET_KEY"):
+            # 既定の秘密鍵は公開されているため、生成した鍵をファイルに保存して使う
+            os.environ["YOLO_SECRET_KEY"] = load_or_create_secret_key()
+            print(f"🔑 秘密鍵: {SECRET_KEY_FILE}（YOLO_SECRET_KEY で指定することもできます）")
+        if not os.environ.get("YOLO_ALLOWED_HOSTS"):
+            host = args.bind.rpartition(':')[0].strip('[]') or '127.0.0.1'
+            os.environ["YOLO_ALLOWED_HOSTS"] = ",".join(default_allowed_hosts(host))
+            print(f"🔒 許可するホスト: {os.environ['YOLO_ALLOWED_HOSTS']}")
+            print("   別の名前でアクセスする場合は YOLO_ALLOWED_HOSTS（カンマ区切り）で指定してください。")
+
+        print("📦 静的ファイルを収集・圧縮中...")
+        try:
+            subprocess.run([sys.executable, "manage.py", "collectstatic", "--noinput", "-v", "0"], check=True)
+        except subprocess.CalledProcessError as e:
+            print(f"❌ 静的ファイルの収集に失敗しました: {e}")
+            sys.exit(1)
+
+        command = production_command(args)
+        mode = f"{args.server} ({os.environ['YOLO_INTERFACE']}, ワーカー{args.workers}個)"
+    else:
+        command = [sys.executable, "manage.py", "runserver", args.bind]
+        mode = "開発サーバー"
+
+    address = f"http://{args.bind}/"
     print(f"📁 プロジェクトディレクトリ: {django_project_dir}")
-    print("🌐 サーバーを起動中...")
-    print("   アクセス先: http://127.0.0.1:8000/")
-    print("   管理画面: http://127.0.0.1:8000/admin/")
+    print(f"🌐 サーバーを起動中... [{mode}]")
+    print(f"   アクセス先: {address}")
+    print(f"   管理画面: {address}admin/")
     print("   停止: Ctrl+C")
     print("-" * 50)
-    
+
+    # 画像読み込み・データセット分割を処理するジョブワーカーを起動
+    worker = None
+    if not args.no_job_worker:
+        print("⚙️  ジョブワーカーを起動中...")
+        worker = subprocess.Popen([
+            sys.executable, "manage.py", "run_worker"
+        ])
+
     try:
         # Djangoサーバーを起動
-        subprocess.run([
-            sys.executable, "manage.py", "runserver"
-        ], check=True)
+        subprocess.run(command, check=True)
     except KeyboardInterrupt:
         print("\n✋ サーバーを停止しました。")
     except subprocess.CalledProcessError as e:
         print(f"❌ サーバーの起動に失敗しました: {e}")
+        if args.production:
+            print("   本番用サーバーは `uv sync --extra production` でインストールしてください。")
         sys.exit(1)
+    finally:
+        if worker:
+            worker.terminate()
+            worker.wait()
 
 
 if __name__ == "__main__":
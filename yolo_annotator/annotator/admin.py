@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Label, ImageFile, Annotation
+from .models import Label, ImageFile, Annotation, Job
 
 
 @admin.register(Label)
@@ -23,3 +23,10 @@ class AnnotationAdmin(admin.ModelAdmin):
     list_filter = ('label', 'created_at')
     search_fields = ('image__filename', 'label__name')
     readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress_done', 'progress_total', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class AnnotatorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'annotator'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+        from PIL import Image
+
+        from .db import configure_sqlite
+
+        # 巨大画像の読み込みを許可
+        Image.MAX_IMAGE_PIXELS = settings.IMAGE_MAX_PIXELS
+
+        # SQLiteの接続ごとにWALモードなどのPRAGMAを設定
+        connection_created.connect(configure_sqlite, dispatch_uid='annotator.configure_sqlite')
@@ -0,0 +1,164 @@
+"""
+出力したデータセットのアーカイブ配信
+ZIP / tar をジェネレーターで少しずつ作成しながら送信します。アーカイブ全体をメモリや一時ファイルに
+保持することはなく、一度に保持するのは読み込み中のチャンクと圧縮処理のバッファだけです。
+JPEG・PNGは既に圧縮されているため、既定（auto）では無圧縮で格納し、CPUではなくディスクとネットワークの速度で配信します。
+"""
+import os
+import re
+import tarfile
+import zipfile
+
+from django.conf import settings
+
+CHUNK_SIZE = 256 * 1024
+
+EXPORT_DIR_PREFIX = 'output_'
+_TIMESTAMP_RE = re.compile(r'^\d{8}_\d{6}$')
+
+# 圧縮しても小さくならない形式
+COMPRESSED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+ARCHIVE_FORMATS = ('zip', 'tar')
+COMPRESSION_MODES = ('auto', 'stored', 'deflate')
+
+
+def exports_root():
+    return settings.PROJECT_ROOT / 'output'
+
+
+def export_dir(timestamp):
+    """出力フォルダのパスを返す（存在しない・不正な名前の場合はNone）"""
+    if not _TIMESTAMP_RE.match(timestamp):
+        return None
+    path = exports_root() / f'{EXPORT_DIR_PREFIX}{timestamp}'
+    return path if path.is_dir() else None
+
+
+def list_exports():
+    """出力済みのデータセットを新しい順に返す"""
+    root = exports_root()
+    if not root.is_dir():
+        return []
+    exports = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            timestamp = entry.name[len(EXPORT_DIR_PREFIX):]
+            if entry.is_dir() and entry.name.startswith(EXPORT_DIR_PREFIX) and _TIMESTAMP_RE.match(timestamp):
+                yaml_files = sorted(name for name in os.listdir(entry.path) if name.endswith('.yaml'))
+                exports.append({'timestamp': timestamp, 'yaml_filename': yaml_files[0] if yaml_files else None})
+    exports.sort(key=lambda export: export['timestamp'], reverse=True)
+    return exports
+
+
+def iter_files(root):
+    """フォルダ内のファイルを (アーカイブ内の名前, パス, os.stat) で名前順に返す（シンボリックリンクは含めない）"""
+    stack = [('', str(root))]
+    while stack:
+        prefix, directory = stack.pop()
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append((prefix + entry.name + '/', entry.path))
+            elif entry.is_file(follow_symlinks=False):
+                yield prefix + entry.name, entry.path, entry.stat(follow_symlinks=False)
+        stack.extend(reversed(subdirs))
+
+
+def _read_chunks(path):
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+class _StreamBuffer:
+    """zipfileの出力先（シークできないストリームとして扱われ、書き込まれたデータを取り出すまで保持する）"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_compress_type(arcname, compression):
+    if compression == 'stored':
+        return zipfile.ZIP_STORED
+    if compression == 'deflate':
+        return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED if arcname.lower().endswith(COMPRESSED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+
+def stream_zip(root, base_name, compression='auto'):
+    """フォルダをZIPとして少しずつ作成し、バイト列を順に返すジェネレーター
+
+    シークできない出力先に書くため、各エントリのサイズとCRCはデータの後ろ（データディスクリプタ）に書き込まれます。
+    """
+    buffer = _StreamBuffer()
+    archive = zipfile.ZipFile(buffer, 'w', allowZip64=True)
+    for arcname, path, stat in iter_files(root):
+        info = zipfile.ZipInfo.from_file(path, f'{base_name}/{arcname}')
+        info.compress_type = _zip_compress_type(arcname, compression)
+        with archive.open(info, 'w') as dest:
+            for chunk in _read_chunks(path):
+                dest.write(chunk)
+                if data := buffer.pop():
+                    yield data
+        # データディスクリプタ
+        if data := buffer.pop():
+            yield data
+    # 中央ディレクトリ
+    archive.close()
+    yield buffer.pop()
+
+
+def _tar_header(arcname, stat):
+    info = tarfile.TarInfo(arcname)
+    info.size = stat.st_size
+    info.mtime = int(stat.st_mtime)
+    info.mode = 0o644
+    return info.tobuf(tarfile.PAX_FORMAT)
+
+
+def tar_size(root, base_name):
+    """stream_tar が出力するバイト数（Content-Length 用）"""
+    total = 0
+    for arcname, _, stat in iter_files(root):
+        total += len(_tar_header(f'{base_name}/{arcname}', stat))
+        total += -(-stat.st_size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+    total += 2 * tarfile.BLOCKSIZE
+    return -(-total // tarfile.RECORDSIZE) * tarfile.RECORDSIZE
+
+
+def stream_tar(root, base_name):
+    """フォルダを無圧縮のtarとして少しずつ作成し、バイト列を順に返すジェネレーター"""
+    total = 0
+    for arcname, path, stat in iter_files(root):
+        header = _tar_header(f'{base_name}/{arcname}', stat)
+        yield header
+        written = 0
+        for chunk in _read_chunks(path):
+            # 一覧を取得した後にファイルが伸びてもヘッダーのサイズを超えて書かない
+            chunk = chunk[:stat.st_size - written]
+            if not chunk:
+                break
+            written += len(chunk)
+            yield chunk
+        # ファイルが縮んだ場合はヘッダーのサイズまで0で埋める
+        padded = -(-stat.st_size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        yield b'\0' * (padded - written)
+        total += len(header) + padded
+    # 終端の2ブロックと、レコードサイズまでの埋め草
+    end = total + 2 * tarfile.BLOCKSIZE
+    yield b'\0' * (-(-end // tarfile.RECORDSIZE) * tarfile.RECORDSIZE - total)
@@ -0,0 +1,35 @@
+"""
+データベース接続の調整
+SQLiteは接続ごとの設定（PRAGMA）が多いため、接続を作成するたびに settings.SQLITE_PRAGMAS を適用します。
+WALモードにすると読み込みと書き込みが互いを待たなくなり、複数人で同時に保存しても「database is locked」になりにくくなります。
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created シグナルのハンドラ（SQLite以外の接続では何もしない）"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    logger.debug('SQLiteのPRAGMAを設定しました: %s', pragmas)
+
+
+def sqlite_status(connection):
+    """現在の接続に適用されているPRAGMAの値を返す（SQLite以外はNone）"""
+    if connection.vendor != 'sqlite':
+        return None
+    status = {}
+    with connection.cursor() as cursor:
+        for name in ('journal_mode', 'busy_timeout', 'synchronous', 'mmap_size'):
+            cursor.execute(f'PRAGMA {name}')
+            status[name] = cursor.fetchone()[0]
+    return status
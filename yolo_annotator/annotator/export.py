@@ -0,0 +1,400 @@
+"""
+データセットエクスポートエンジン
+対象の選択 → 分割 → 画像の変換 → ラベルの書き出し → マニフェストの書き出し のパイプラインで出力し、
+各段階の処理時間などを計測します（export_report.py）。
+画像のリサイズ・エンコードをプロセスプールで並列に実行し、
+ラベルは一括取得したアノテーションから出力形式ごとのライター（formats.py）で書き出します。
+変換済みの画像はエクスポートキャッシュから出力フォルダへリンクし、変更のない画像は再エンコードしません。
+ラベルの座標変換は全画像のボックスをまとめてNumPyの配列演算で行います。
+"""
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from . import export_cache
+from .export_report import ExportReport
+from .formats import EXPORT_FORMATS
+from .imaging import _letterbox_task, letterbox_options, output_filename
+from .splitting import split_images
+from .models import ImageFile, Label, Annotation
+
+logger = logging.getLogger(__name__)
+
+# 見積もり（dry run）で実際に変換・書き出しを行う画像の枚数
+DRY_RUN_SAMPLE_SIZE = 50
+
+# 見積もりで画像の枚数に比例させる処理段階（select・split・fetch_boxes は全件分を実行した時間をそのまま使う）
+PER_IMAGE_STAGES = ('transform_boxes', 'write_labels', 'write_manifest')
+
+
+def default_worker_count():
+    """ホストのCPUコア数からワーカー数を決定"""
+    return os.cpu_count() or 1
+
+
+# 1クエリで取得したボックスの配列の型
+BOX_DTYPE = np.dtype([
+    ('image_id', np.int64), ('label_id', np.int64),
+    ('x_center', np.float64), ('y_center', np.float64), ('width', np.float64), ('height', np.float64),
+])
+
+
+def fetch_boxes(image_ids):
+    """対象画像のアノテーションを1クエリで取得し、画像ID順の構造化配列で返す
+
+    IDを並べた IN 句はSQLiteの変数の上限を超えるため、アノテーション済みの画像を結合で絞り込み、
+    取得後に image_ids に含まれる画像のボックスだけを残します（選択後に状態が変わった画像を除く）。
+    """
+    rows = (
+        Annotation.objects
+        .filter(image__is_annotated=True)
+        .order_by('image_id', 'id')
+        .values_list('image_id', 'label_id', 'x_center', 'y_center', 'width', 'height')
+    )
+    boxes = np.fromiter(rows.iterator(chunk_size=2000), dtype=BOX_DTYPE)
+    return boxes[np.isin(boxes['image_id'], np.asarray(image_ids, dtype=np.int64))]
+
+
+def transform_boxes(boxes, geometry, target_size):
+    """全ボックスの座標をレターボックス後の正規化座標にまとめて変換
+
+    geometry は画像IDから letterbox_image の戻り値 (元画像サイズ, リサイズ後サイズ, 貼り付け位置) への辞書です。
+    戻り値は (ボックス数, 4) の配列で、範囲外の座標は 0〜1 にクリップします。
+    """
+    # ボックスごとに、所属する画像の変換パラメータを並べる
+    image_ids = np.fromiter(geometry.keys(), dtype=np.int64, count=len(geometry))
+    params = np.array(
+        [(*original, *resized, *paste) for original, resized, paste in geometry.values()],
+        dtype=np.float64
+    ).reshape(-1, 6)
+    order = np.argsort(image_ids)
+    index = order[np.searchsorted(image_ids, boxes['image_id'], sorter=order)]
+    original_width, original_height, resized_width, resized_height, paste_x, paste_y = params[index].T
+
+    scale_x = resized_width / original_width
+    scale_y = resized_height / original_height
+
+    coords = np.empty((len(boxes), 4), dtype=np.float64)
+    coords[:, 0] = (boxes['x_center'] * original_width * scale_x + paste_x) / target_size
+    coords[:, 1] = (boxes['y_center'] * original_height * scale_y + paste_y) / target_size
+    coords[:, 2] = boxes['width'] * original_width * scale_x / target_size
+    coords[:, 3] = boxes['height'] * original_height * scale_y / target_size
+    np.clip(coords, 0, 1, out=coords)
+    return coords
+
+
+def iter_image_boxes(image_ids, boxes, coords):
+    """画像ごとに (画像ID, ラベルIDの配列, 座標の配列) を image_ids の順に返す
+
+    boxes は画像ID順のボックス、coords は transform_boxes の戻り値です。ボックスのない画像は空の配列になります。
+    """
+    # 画像IDでソート済みなので、各画像のボックスは連続した範囲になる
+    unique_ids, starts, counts = np.unique(boxes['image_id'], return_index=True, return_counts=True)
+    ranges = {
+        image_id: (start, start + count)
+        for image_id, start, count in zip(unique_ids.tolist(), starts.tolist(), counts.tolist())
+    }
+    label_ids = boxes['label_id']
+    for image_id in image_ids:
+        start, end = ranges.get(image_id, (0, 0))
+        yield image_id, label_ids[start:end], coords[start:end]
+
+
+def _iter_results(tasks, workers):
+    """画像タスクを実行し、(結果, 計測値) をタスク順に返す（workers=1の場合はプロセスを使わない）"""
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _letterbox_task(task)
+        return
+
+    # プロセス間通信のオーバーヘッドを抑えるため、ある程度まとめて渡す
+    chunksize = max(1, min(64, len(tasks) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_letterbox_task, tasks, chunksize=chunksize)
+
+
+def select_images():
+    """対象の画像を選ぶ：アノテーション済みの画像の (画像ID, ファイル名)（モデルインスタンスは生成しない）"""
+    images_list = list(
+        ImageFile.objects.filter(is_annotated=True).values_list('id', 'filename')
+    )
+    if not images_list:
+        raise ValueError('アノテーション済みの画像がありません')
+    return images_list
+
+
+def transform_images(entries, target_size, options, workers, use_cache=True, progress=None, report=None):
+    """画像をレターボックスして出力フォルダに配置する
+
+    entries は (画像ID, 元画像, 出力画像) のリスト、options は imaging.letterbox_options の戻り値です。
+    キャッシュにある画像はリンクするだけで済ませ、
+    残りをプロセスプールで変換します。戻り値は (画像IDごとの letterbox_image の戻り値, 変換した枚数, リンク方法ごとの枚数) です。
+    report（export_report.ExportReport）を指定した場合、画像ごとの処理時間と読み書きしたバイト数を記録します。
+    """
+    total = len(entries)
+    done = 0
+    link_counts = defaultdict(int)
+    geometry = {}
+
+    def finish(entry, result, timings, bytes_read=0, bytes_written=0):
+        nonlocal done
+        geometry[entry[0]] = result
+        done += 1
+        if report:
+            report.add_image(
+                os.path.relpath(entry[1], settings.BASE_IMAGES_DIR), timings, bytes_read, bytes_written
+            )
+        if progress:
+            progress(done, total)
+
+    def place(cached_path, dst_path):
+        """キャッシュから出力フォルダへ配置し、(かかった時間, 書き込んだバイト数) を返す"""
+        started = time.perf_counter()
+        method = export_cache.link_or_copy(cached_path, dst_path)
+        link_counts[method] += 1
+        return time.perf_counter() - started, os.path.getsize(dst_path) if method == 'copy' else 0
+
+    pending = []
+    for entry in entries:
+        _, src_path, dst_path = entry
+        key = export_cache.export_key(src_path, target_size, options) if use_cache else None
+        cached = export_cache.lookup(key, dst_path) if key else None
+        if cached:
+            cached_path, result = cached
+            try:
+                seconds, written = place(cached_path, dst_path)
+            except FileNotFoundError:
+                # 確認した後に他のエクスポートの削除処理で消えた場合は変換し直す
+                logger.info('キャッシュから削除されたため変換し直します: %s', src_path)
+            else:
+                finish(entry, result, {'link': seconds}, bytes_written=written)
+                continue
+        write_path = export_cache.temp_path(key, dst_path) if key else dst_path
+        pending.append((entry, key, write_path))
+
+    tasks = [(entry[1], write_path, target_size, options) for entry, _, write_path in pending]
+    for (entry, key, write_path), (result, stats) in zip(pending, _iter_results(tasks, workers)):
+        timings = stats['timings']
+        written = stats['bytes_written']
+        if key:
+            _, _, dst_path = entry
+            started = time.perf_counter()
+            method = export_cache.store(key, dst_path, write_path, result)
+            link_counts[method] += 1
+            timings['link'] = time.perf_counter() - started
+            if method == 'copy':
+                written += os.path.getsize(dst_path)
+        finish(entry, result, timings, stats['bytes_read'], written)
+
+    if report:
+        report.counters['images_encoded'] += len(pending)
+        report.counters['images_cached'] += total - len(pending)
+    return geometry, len(pending), dict(link_counts)
+
+
+def output_sizes(output_dir):
+    """出力フォルダの直下の項目ごとの合計サイズ（バイト）"""
+    sizes = {}
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.is_file():
+                sizes[entry.name] = entry.stat().st_size
+                continue
+            total = 0
+            for root, _, files in os.walk(entry.path):
+                total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+            sizes[entry.name] = total
+    return sizes
+
+
+def _write_dataset(output_dir, splits, target_size, options, formats, workers, use_cache, progress, report, timestamp):
+    """分割済みの画像を output_dir に出力する（画像の変換 → ラベルの書き出し → マニフェストの書き出し）"""
+    # (画像ID, 元画像, 出力画像)
+    entries = []
+    # 出力形式を変える場合は拡張子も変わるため、ライターには出力したファイル名を渡す
+    output_names = {}
+    for split_name, images in splits:
+        target_img_dir = output_dir / 'images' / split_name
+        os.makedirs(target_img_dir, exist_ok=True)
+        for image_id, filename in images:
+            # サブフォルダから取り込んだ画像はフォルダ構成を保って出力
+            if '/' in filename:
+                os.makedirs(target_img_dir / os.path.dirname(filename), exist_ok=True)
+            output_names[image_id] = output_filename(filename, options)
+            entries.append((
+                image_id,
+                os.path.join(settings.BASE_IMAGES_DIR, filename),
+                os.path.join(target_img_dir, output_names[image_id]),
+            ))
+
+    with report.stage('transform_images'):
+        geometry, encoded_count, link_counts = transform_images(
+            entries, target_size, options, workers, use_cache, progress, report
+        )
+
+    # 全アノテーションを一括で取得してまとめて座標変換し、画像ごとに各形式のライターへ渡す
+    with report.stage('fetch_boxes'):
+        boxes = fetch_boxes([image_id for image_id, _, _ in entries])
+        labels = list(Label.objects.order_by('id').values_list('id', 'name'))
+    with report.stage('transform_boxes'):
+        coords = transform_boxes(boxes, geometry, target_size)
+    report.counters['boxes'] += len(boxes)
+
+    writers = [EXPORT_FORMATS[name](output_dir, labels, target_size) for name in formats]
+    with report.stage('write_labels'):
+        for split_name, images in splits:
+            for writer in writers:
+                writer.begin_split(split_name)
+            image_ids = [image_id for image_id, _ in images]
+            for image_id, label_ids, image_coords in iter_image_boxes(image_ids, boxes, coords):
+                for writer in writers:
+                    writer.write_image(split_name, image_id, output_names[image_id], label_ids, image_coords)
+            for writer in writers:
+                writer.end_split(split_name)
+
+    result = {
+        'yaml_filename': None,
+        'encoded_count': encoded_count,
+        'cached_count': len(entries) - encoded_count,
+        'link_counts': link_counts,
+    }
+    with report.stage('write_manifest'):
+        for writer in writers:
+            result.update(writer.finish(timestamp))
+
+    sizes = output_sizes(output_dir)
+    report.bytes['labels_written'] += sum(size for name, size in sizes.items() if name != 'images')
+    result['output_bytes'] = sizes
+    return result
+
+
+def estimate_export(splits, target_size, options, formats, workers, use_cache, seed, sample_size, report):
+    """分割の一部の画像で実際に変換・書き出しを行い、全体の出力サイズと処理時間を見積もる
+
+    抽出した画像は一時フォルダに1プロセスで変換・書き出しし、出力フォルダとエクスポートキャッシュには何も書き込みません。
+    画像の変換時間は、キャッシュ済みの割合（抽出した画像で確認）を除いた枚数をワーカー数で割って見積もります。
+    キャッシュからのリンクにかかる時間は含みません。
+    """
+    total = sum(len(images) for _, images in splits)
+    rng = random.Random(seed)
+    # 各分割から枚数に比例した数を抽出（空でない分割からは最低1枚）
+    sample_splits = [
+        (name, rng.sample(images, min(len(images), math.ceil(sample_size * len(images) / total))))
+        for name, images in splits
+    ]
+    sampled = sum(len(images) for _, images in sample_splits)
+    scale = total / sampled
+
+    hits = 0
+    if use_cache:
+        for _, images in sample_splits:
+            for _, filename in images:
+                key = export_cache.export_key(os.path.join(settings.BASE_IMAGES_DIR, filename), target_size, options)
+                hits += export_cache.lookup(key, output_filename(filename, options), touch=False) is not None
+    hit_ratio = hits / sampled
+
+    with tempfile.TemporaryDirectory(prefix='export_dry_run_') as tmpdir:
+        sample_result = _write_dataset(
+            Path(tmpdir), sample_splits, target_size, options, formats, 1, False, None, report, 'dry_run'
+        )
+
+    per_image = report.image_summary('total')['mean_ms'] / 1000
+    stage_seconds = {}
+    for name, stats in report.stages.items():
+        if name == 'transform_images':
+            seconds = total * (1 - hit_ratio) * per_image / workers
+        elif name in PER_IMAGE_STAGES:
+            seconds = stats['seconds'] * scale
+        else:
+            seconds = stats['seconds']
+        stage_seconds[name] = round(seconds, 3)
+
+    return {
+        'sample_count': sampled,
+        'cache_hit_ratio': round(hit_ratio, 3),
+        'estimated_encoded_count': round(total * (1 - hit_ratio)),
+        'estimated_seconds': round(sum(stage_seconds.values()), 1),
+        'estimated_stage_seconds': stage_seconds,
+        # 出力フォルダ直下のファイル（YAML）以外は画像の枚数に比例させる
+        'estimated_output_bytes': {
+            name: size if '.' in name else round(size * scale)
+            for name, size in sample_result['output_bytes'].items()
+        },
+    }
+
+
+def export_dataset(split_ratio=0.8, target_size=640, workers=None, progress=None, use_cache=True, formats=('yolo',),
+                   test_ratio=0.0, seed=0, stratify=False, letterbox=None, dry_run=False,
+                   sample_size=DRY_RUN_SAMPLE_SIZE):
+    """アノテーション済み画像をtrain/valid（/test）に分割してデータセットを出力
+
+    対象の選択 → 分割 → 画像の変換 → ラベルの書き出し → マニフェストの書き出し の順に処理します。
+    formats には formats.EXPORT_FORMATS の名前（yolo / coco / voc）を複数指定でき、画像の変換は1回で全形式に共有します。
+    progress が指定された場合、画像を1枚処理するごとに progress(done, total) を呼び出します。
+    use_cache=False の場合はエクスポートキャッシュを使わず、全ての画像を変換し直します。
+    分割は seed とファイル名から決まり（splitting.py）、stratify=True の場合はラベルの偏りを考慮して分けます。
+    letterbox には settings.EXPORT_LETTERBOX を上書きする画像の変換設定（imaging.letterbox_options の引数）を指定します。
+
+    処理段階ごとの時間・クエリ数や画像ごとの処理時間は戻り値の 'report' に含め、
+    データセットのYAMLと同じフォルダに export_report_<日時>.json として保存します。
+    dry_run=True の場合は sample_size 枚だけで変換・書き出しを試し、何も出力せずに出力サイズと処理時間を見積もります。
+    """
+    workers = workers or default_worker_count()
+    options = letterbox_options(**{**settings.EXPORT_LETTERBOX, **(letterbox or {})})
+    formats = list(dict.fromkeys(formats))
+    unknown = [name for name in formats if name not in EXPORT_FORMATS]
+    if unknown or not formats:
+        raise ValueError(f'未知の出力形式です: {", ".join(unknown)}')
+    if dry_run and sample_size < 1:
+        raise ValueError('見積もりに使う画像の枚数は1以上を指定してください')
+
+    report = ExportReport()
+    with report.capture_queries():
+        with report.stage('select'):
+            images_list = select_images()
+        with report.stage('split'):
+            splits = split_images(images_list, split_ratio, test_ratio, seed, stratify)
+
+        result = {
+            'dry_run': dry_run,
+            'formats': formats,
+            'seed': seed,
+            'stratified': stratify,
+            'train_count': len(splits[0][1]),
+            'valid_count': len(splits[1][1]),
+            'test_count': len(splits[2][1]) if len(splits) > 2 else 0,
+            'image_size': target_size,
+            'letterbox': options,
+            'workers': workers,
+        }
+        if dry_run:
+            result.update(estimate_export(
+                splits, target_size, options, formats, workers, use_cache, seed, sample_size, report
+            ))
+            result['report'] = report.as_dict()
+            return result
+
+        # 現在の日時を取得してフォルダ名に使用
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        dated_output_dir = settings.PROJECT_ROOT / 'output' / f'output_{timestamp}'
+        result.update(timestamp=timestamp, output_dir=str(dated_output_dir))
+        result.update(_write_dataset(
+            dated_output_dir, splits, target_size, options, formats, workers, use_cache, progress, report, timestamp
+        ))
+
+    result['report'] = report.as_dict()
+    result['report_filename'] = f'export_report_{timestamp}.json'
+    with open(dated_output_dir / result['report_filename'], 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
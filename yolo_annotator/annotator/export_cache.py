@@ -0,0 +1,194 @@
+"""
+エクスポート用にリサイズした画像のディスクキャッシュ
+元画像のパス・更新時刻・ファイルサイズと変換の設定（出力サイズ・リサンプリング・パディング・画質・出力形式など）から
+求めたキーで変換後の画像を保存し、エクスポート時は出力フォルダへハードリンク（できなければreflink・コピー）します。
+アノテーションだけを変更して再エクスポートした場合、画像の再エンコードは行われずラベルファイルだけが作り直されます。
+ラベルの座標変換に必要なサイズ情報は、画像と同じ名前のJSONファイルに保存します。
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+from django.conf import settings
+
+from .imaging import letterbox_settings
+
+logger = logging.getLogger(__name__)
+
+# 容量超過時は上限のこの割合まで削除する
+EVICT_TARGET_RATIO = 0.9
+
+# このプロセスで把握しているキャッシュ容量（初回の書き込み時にディレクトリを走査して求める）
+_cache_bytes = None
+
+try:
+    import fcntl
+    # Linux の FICLONE（Btrfs・XFSなどでブロックを共有したコピーを作成）
+    _FICLONE = 0x40049409
+except ImportError:  # Windows
+    fcntl = None
+
+
+def export_key(src_path, target_size, options):
+    """元画像の状態と変換の設定（imaging.letterbox_options の戻り値）からキャッシュキーを作成"""
+    stat = os.stat(src_path)
+    raw = f"{src_path}|{stat.st_mtime_ns}|{stat.st_size}|{target_size}|{letterbox_settings(options)}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _cache_paths(key, dst_path):
+    """変換後の画像（出力画像と同じ拡張子）とサイズ情報のJSONのパス"""
+    base = os.path.join(settings.EXPORT_CACHE_DIR, key[:2], key)
+    return base + os.path.splitext(dst_path)[1].lower(), base + '.json'
+
+
+def lookup(key, dst_path, touch=True):
+    """キャッシュにあれば (画像のパス, letterbox_imageの戻り値) を返す
+
+    touch=False の場合は最終アクセス時刻を更新しません（見積もりなど、キャッシュを使わない確認用）。
+    """
+    image_path, meta_path = _cache_paths(key, dst_path)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if not os.path.exists(image_path):
+        return None
+    # LRU判定のため最終アクセス時刻としてJSONの更新時刻を更新
+    if touch:
+        now = time.time()
+        os.utime(meta_path, (now, now))
+    return image_path, (tuple(meta['original_size']), tuple(meta['resized_size']), tuple(meta['paste_position']))
+
+
+def temp_path(key, dst_path):
+    """変換処理の書き込み先（store で確定するまで他から参照されない）"""
+    image_path, _ = _cache_paths(key, dst_path)
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    return f"{image_path}.{os.getpid()}.tmp{os.path.splitext(image_path)[1]}"
+
+
+def store(key, dst_path, tmp_path, result):
+    """変換した画像を出力先に配置してからキャッシュに登録し、リンク方法（link_or_copy の戻り値）を返す
+
+    一時ファイルは削除処理の対象外なので、先に出力先へ配置しておけば、登録後の容量超過で
+    このエントリ自体が削除されても出力には影響しません。
+    """
+    image_path, meta_path = _cache_paths(key, dst_path)
+    original_size, resized_size, paste_position = result
+    method = link_or_copy(tmp_path, dst_path)
+    os.replace(tmp_path, image_path)
+    # 画像を置いてからJSONを置くので、JSONがあれば画像は必ず揃っている
+    meta_tmp = f"{meta_path}.{os.getpid()}.tmp"
+    with open(meta_tmp, 'w', encoding='utf-8') as f:
+        json.dump({
+            'original_size': original_size,
+            'resized_size': resized_size,
+            'paste_position': paste_position,
+        }, f)
+    os.replace(meta_tmp, meta_path)
+    _record_write(os.path.getsize(image_path) + os.path.getsize(meta_path))
+    return method
+
+
+def link_or_copy(src, dst):
+    """ハードリンクを作成（別のファイルシステムなどで作れない場合はreflink、それも無理ならコピー）
+
+    戻り値は 'link' / 'reflink' / 'copy' のいずれかです。
+    """
+    try:
+        os.link(src, dst)
+        return 'link'
+    except OSError:
+        pass
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return 'reflink'
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+def _is_temp(name):
+    """書き込み中の一時ファイル（temp_path・store が作成）か"""
+    return '.tmp' in name
+
+
+def _iter_entries():
+    """キャッシュ内のエントリを (JSONのパス, 画像とJSONの合計サイズ, 最終アクセス時刻) で返す"""
+    cache_dir = settings.EXPORT_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        return
+    with os.scandir(cache_dir) as subdirs:
+        for subdir in subdirs:
+            if not subdir.is_dir():
+                continue
+            sizes = {}
+            metas = []
+            with os.scandir(subdir.path) as entries:
+                for entry in entries:
+                    if not entry.is_file() or _is_temp(entry.name):
+                        continue
+                    stat = entry.stat()
+                    key, ext = os.path.splitext(entry.name)
+                    sizes[key] = sizes.get(key, 0) + stat.st_size
+                    if ext == '.json':
+                        metas.append((entry.path, key, stat.st_mtime))
+            for meta_path, key, mtime in metas:
+                yield meta_path, sizes[key], mtime
+
+
+def cache_usage():
+    """キャッシュの合計容量（バイト）"""
+    return sum(size for _, size, _ in _iter_entries())
+
+
+def evict(max_bytes=None):
+    """容量上限を超えている場合、最終アクセスの古いエントリから削除
+
+    出力済みのデータセットからハードリンクされている画像は、削除してもそのデータセットには残ります。
+    """
+    global _cache_bytes
+    max_bytes = settings.EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = list(_iter_entries())
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total > max_bytes:
+        target = max_bytes * EVICT_TARGET_RATIO
+        for meta_path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= target:
+                break
+            base = os.path.splitext(meta_path)[0]
+            # JSONを先に消して、画像だけが残っても参照されないようにする
+            # （他のエクスポートが書き込み中の一時ファイルは残し、os.replace で確定できるようにする）
+            for path in [meta_path] + [
+                os.path.join(os.path.dirname(base), name) for name in os.listdir(os.path.dirname(base))
+                if name.startswith(os.path.basename(base) + '.') and not name.endswith('.json') and not _is_temp(name)
+            ]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        logger.info('エクスポートキャッシュを%d件削除しました', removed)
+    _cache_bytes = total
+    return removed
+
+
+def _record_write(nbytes):
+    """新しく書き込んだ容量を加算し、上限を超えたら削除処理を実行"""
+    global _cache_bytes
+    if _cache_bytes is None:
+        _cache_bytes = cache_usage()
+    else:
+        _cache_bytes += nbytes
+    if _cache_bytes > settings.EXPORT_CACHE_MAX_BYTES:
+        evict()
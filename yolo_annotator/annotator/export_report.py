@@ -0,0 +1,146 @@
+"""
+エクスポートの計測レポート
+処理段階ごとの時間・クエリ数、画像ごとの処理時間（デコード・リサンプリング・エンコード・リンク）の分布と外れ値、
+読み書きしたバイト数を集計します。結果はジョブの結果とデータセットのYAMLと同じフォルダのJSONに出力されます。
+画像ごとの時間は配列に保持するため、100万枚でも数十MB程度で収まります。
+"""
+import heapq
+import time
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+from django.db import connection
+
+# 画像ごとの処理時間の項目
+IMAGE_METRICS = ('decode', 'resample', 'encode', 'link', 'total')
+
+# ヒストグラムの区切り（ミリ秒）
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# レポートに含める処理時間の長い画像の件数
+OUTLIER_COUNT = 10
+
+
+def summarize(seconds):
+    """処理時間の配列（秒）から件数・平均・パーセンタイル・ヒストグラム（ミリ秒）を求める"""
+    values = np.frombuffer(seconds, dtype=np.float64) * 1000 if len(seconds) else np.empty(0)
+    if not len(values):
+        return {'count': 0}
+    edges = (0,) + HISTOGRAM_BOUNDS_MS + (np.inf,)
+    counts, _ = np.histogram(values, bins=edges)
+    labels = [f'<{HISTOGRAM_BOUNDS_MS[0]}ms'] + [
+        f'{low}-{high}ms' for low, high in zip(HISTOGRAM_BOUNDS_MS, HISTOGRAM_BOUNDS_MS[1:])
+    ] + [f'>={HISTOGRAM_BOUNDS_MS[-1]}ms']
+    p50, p95, p99 = np.percentile(values, (50, 95, 99)).tolist()
+    return {
+        'count': len(values),
+        'total_seconds': round(float(values.sum()) / 1000, 3),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(p95, 3),
+        'p99_ms': round(p99, 3),
+        'max_ms': round(float(values.max()), 3),
+        'histogram': {label: int(count) for label, count in zip(labels, counts) if count},
+    }
+
+
+def format_stages(stage_seconds):
+    """処理段階ごとの秒数を「合計 (段階 秒, ...)」の1行にまとめる"""
+    total = sum(stage_seconds.values())
+    details = ', '.join(f'{name} {seconds:.1f}秒' for name, seconds in stage_seconds.items())
+    return f'{total:.1f}秒 ({details})'
+
+
+def format_bytes(nbytes):
+    """バイト数を読みやすい単位で表す"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if nbytes < 1024:
+            return f'{nbytes:.1f}{unit}' if unit != 'B' else f'{nbytes}B'
+        nbytes /= 1024
+    return f'{nbytes:.1f}TB'
+
+
+class ExportReport:
+    """エクスポート1回分の計測結果"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = Counter()
+        self.bytes = Counter()
+        self._image_seconds = {metric: array('d') for metric in IMAGE_METRICS}
+        self._outliers = []
+        self._stage = None
+
+    @contextmanager
+    def stage(self, name):
+        """処理段階の時間を計測（この間に実行したクエリもこの段階に集計する）"""
+        stats = self.stages.setdefault(name, {'seconds': 0.0, 'queries': 0, 'query_seconds': 0.0})
+        previous, self._stage = self._stage, stats
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats['seconds'] += time.perf_counter() - started
+            self._stage = previous
+
+    def _record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if self._stage is not None:
+                self._stage['queries'] += 1
+                self._stage['query_seconds'] += time.perf_counter() - started
+
+    @contextmanager
+    def capture_queries(self):
+        """この間に実行したクエリを処理段階ごとに数える"""
+        with connection.execute_wrapper(self._record_query):
+            yield
+
+    def add_image(self, filename, seconds, bytes_read=0, bytes_written=0):
+        """画像1枚分の処理時間（項目名 → 秒）と読み書きしたバイト数を記録"""
+        total = sum(seconds.values())
+        for metric in IMAGE_METRICS[:-1]:
+            if metric in seconds:
+                self._image_seconds[metric].append(seconds[metric])
+        self._image_seconds['total'].append(total)
+        self.bytes['images_read'] += bytes_read
+        self.bytes['images_written'] += bytes_written
+
+        # 処理時間の長い画像を OUTLIER_COUNT 件だけ保持する
+        outlier = (total, filename, seconds)
+        if len(self._outliers) < OUTLIER_COUNT:
+            heapq.heappush(self._outliers, outlier)
+        elif total > self._outliers[0][0]:
+            heapq.heapreplace(self._outliers, outlier)
+
+    def image_summary(self, metric):
+        return summarize(self._image_seconds[metric])
+
+    def as_dict(self):
+        return {
+            'elapsed_seconds': round(time.perf_counter() - self.started, 3),
+            'stages': {
+                name: {
+                    'seconds': round(stats['seconds'], 3),
+                    'queries': stats['queries'],
+                    'query_seconds': round(stats['query_seconds'], 3),
+                }
+                for name, stats in self.stages.items()
+            },
+            'counters': dict(self.counters),
+            'bytes': dict(self.bytes),
+            'images': {metric: self.image_summary(metric) for metric in IMAGE_METRICS},
+            'outliers': [
+                {
+                    'filename': filename,
+                    'total_ms': round(total * 1000, 3),
+                    **{f'{metric}_ms': round(value * 1000, 3) for metric, value in seconds.items()},
+                }
+                for total, filename, seconds in sorted(self._outliers, key=lambda outlier: outlier[0], reverse=True)
+            ],
+        }
@@ -0,0 +1,244 @@
+"""
+データセットの出力形式（ラベル・マニフェストの書き出し）
+エクスポートのパイプラインは画像の変換を1回だけ行い、変換後の座標を画像ごとに各形式のライターへ渡します。
+ライターは受け取った画像の分をすぐにファイルへ書き出すため、画像数が増えてもメモリに出力を溜めません。
+画像は全形式で共通の images/<split>/ に出力され、ライターはラベルとマニフェストだけを書き出します。
+"""
+import json
+import os
+import shutil
+import tempfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+LABEL_LINE_FORMAT = "%d %.6f %.6f %.6f %.6f\n"
+
+COCO_ANNOTATION_FORMAT = '{"id": %d, "image_id": %d, "category_id": %d, "bbox": [%r, %r, %r, %r], "area": %r, "iscrowd": 0}'
+
+VOC_OBJECT_FORMAT = """  <object>
+    <name>%s</name>
+    <pose>Unspecified</pose>
+    <truncated>0</truncated>
+    <difficult>0</difficult>
+    <bndbox>
+      <xmin>%d</xmin>
+      <ymin>%d</ymin>
+      <xmax>%d</xmax>
+      <ymax>%d</ymax>
+    </bndbox>
+  </object>
+"""
+
+
+class ExportWriter:
+    """出力形式ごとのライターの基底クラス
+
+    エクスポートは begin_split → (画像ごとに) write_image → end_split を分割ごとに繰り返し、最後に finish を呼び出します。
+    write_image の coords はレターボックス後の正規化座標 (x_center, y_center, width, height) の (ボックス数, 4) の配列です。
+    """
+    name = None
+
+    def __init__(self, output_dir, labels, target_size):
+        self.output_dir = output_dir
+        self.labels = labels  # [(ラベルID, ラベル名), ...]（ID順）
+        self.target_size = target_size
+        self._created_dirs = set()
+
+    def _makedirs(self, path):
+        """フォルダを作成（作成済みのフォルダには何もしない）"""
+        directory = os.path.dirname(path)
+        if directory not in self._created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._created_dirs.add(directory)
+
+    def begin_split(self, split):
+        pass
+
+    def write_image(self, split, image_id, filename, label_ids, coords):
+        raise NotImplementedError
+
+    def end_split(self, split):
+        pass
+
+    def finish(self, timestamp):
+        """マニフェストを書き出し、結果に追加する情報を返す"""
+        return {}
+
+    def pixel_boxes(self, coords):
+        """正規化座標を出力画像のピクセル座標 (x_min, y_min, x_max, y_max) に変換"""
+        size = self.target_size
+        boxes = np.empty_like(coords)
+        boxes[:, 0] = (coords[:, 0] - coords[:, 2] / 2) * size
+        boxes[:, 1] = (coords[:, 1] - coords[:, 3] / 2) * size
+        boxes[:, 2] = (coords[:, 0] + coords[:, 2] / 2) * size
+        boxes[:, 3] = (coords[:, 1] + coords[:, 3] / 2) * size
+        np.clip(boxes, 0, size, out=boxes)
+        return boxes
+
+
+def yolo_label_text(label_ids, coords):
+    """YOLO形式のラベルファイルの内容（1行1ボックス、クラスIDはラベルID）"""
+    rows = np.column_stack([label_ids, coords])
+    # 行数分の書式をまとめて1回で文字列にする
+    return (LABEL_LINE_FORMAT * len(rows)) % tuple(rows.ravel().tolist())
+
+
+def build_yaml(dataset_root, labels, has_test=False):
+    """学習用YAMLファイルの内容を作成"""
+    test_dir = ' images/test' if has_test else ''
+    yaml_content = f"""# Train/val/test sets as 1) dir: path/to/imgs, 2) file: path/to/imgs.txt, or 3) list: [path/to/imgs1, path/to/imgs2, ..]
+path: {dataset_root} # dataset root dir
+train: images/train # train images
+val: images/valid # val images
+test:{test_dir} # test images (optional)
+
+# Classes
+names:
+"""
+    # クラス名の部分を追加
+    for label_id, label_name in labels:
+        yaml_content += f"  {label_id}: {label_name}\n"
+    return yaml_content
+
+
+class YoloWriter(ExportWriter):
+    """YOLO形式: labels/<split>/<画像名>.txt と学習用YAML"""
+    name = 'yolo'
+
+    def __init__(self, output_dir, labels, target_size):
+        super().__init__(output_dir, labels, target_size)
+        self._splits = []
+
+    def begin_split(self, split):
+        self._splits.append(split)
+
+    def write_image(self, split, image_id, filename, label_ids, coords):
+        label_path = os.path.join(self.output_dir, 'labels', split, os.path.splitext(filename)[0] + '.txt')
+        self._makedirs(label_path)
+        # ボックスのない画像は空のファイルになる
+        with open(label_path, 'w') as f:
+            f.write(yolo_label_text(label_ids, coords))
+
+    def finish(self, timestamp):
+        # YAMLファイルを生成（ファイル名に日時を含める）
+        yaml_filename = f"dataset_{self.target_size}x{self.target_size}_{timestamp}.yaml"
+        # データセットのルートパスはmanage.pyからの相対パスで設定
+        dataset_root = f"../output/{os.path.basename(self.output_dir)}"
+        with open(os.path.join(self.output_dir, yaml_filename), 'w', encoding='utf-8') as f:
+            f.write(build_yaml(dataset_root, self.labels, 'test' in self._splits))
+        return {'yaml_filename': yaml_filename}
+
+
+class CocoWriter(ExportWriter):
+    """COCO形式: annotations/instances_<split>.json
+
+    images と annotations の配列を1画像ずつ書き足していきます。annotations は一時ファイルに書き出しておき、
+    分割の終わりに images の後ろへ連結するため、JSON全体をメモリに組み立てることはありません。
+    image_id は ImageFile のID、file_name は images/<split>/ からの相対パス、category_id はラベルIDです。
+    """
+    name = 'coco'
+
+    def __init__(self, output_dir, labels, target_size):
+        super().__init__(output_dir, labels, target_size)
+        self._annotation_id = 0
+
+    def begin_split(self, split):
+        path = os.path.join(self.output_dir, 'annotations', f'instances_{split}.json')
+        self._makedirs(path)
+        self._file = open(path, 'w', encoding='utf-8')
+        self._annotations = tempfile.TemporaryFile('w+', encoding='utf-8', dir=os.path.dirname(path))
+        categories = [{'id': label_id, 'name': name, 'supercategory': 'none'} for label_id, name in self.labels]
+        self._file.write('{"info": %s, "licenses": [], "categories": %s, "images": [' % (
+            json.dumps({'description': os.path.basename(self.output_dir)}, ensure_ascii=False),
+            json.dumps(categories, ensure_ascii=False),
+        ))
+        self._first_image = True
+        self._first_annotation = True
+
+    def write_image(self, split, image_id, filename, label_ids, coords):
+        image = {'id': image_id, 'file_name': filename, 'width': self.target_size, 'height': self.target_size}
+        self._file.write(('' if self._first_image else ', ') + json.dumps(image, ensure_ascii=False))
+        self._first_image = False
+        if not len(label_ids):
+            return
+
+        # bbox は [x_min, y_min, 幅, 高さ]（ピクセル、小数2桁）
+        boxes = self.pixel_boxes(coords)
+        boxes[:, 2:] -= boxes[:, :2]
+        area = np.round(boxes[:, 2] * boxes[:, 3], 2)
+        np.round(boxes, 2, out=boxes)
+        first_id = self._annotation_id + 1
+        self._annotation_id += len(label_ids)
+        # 数値だけの要素なので json.dumps を使わず書式で組み立てる（%r はJSONと同じ浮動小数点表記）
+        values = [
+            (annotation_id, image_id, label_id, *bbox, annotation_area)
+            for annotation_id, label_id, bbox, annotation_area in zip(
+                range(first_id, self._annotation_id + 1), label_ids.tolist(), boxes.tolist(), area.tolist()
+            )
+        ]
+        text = ', '.join(COCO_ANNOTATION_FORMAT % value for value in values)
+        self._annotations.write(('' if self._first_annotation else ', ') + text)
+        self._first_annotation = False
+
+    def end_split(self, split):
+        self._file.write('], "annotations": [')
+        self._annotations.seek(0)
+        shutil.copyfileobj(self._annotations, self._file)
+        self._file.write(']}\n')
+        self._annotations.close()
+        self._file.close()
+
+
+class VocWriter(ExportWriter):
+    """Pascal VOC形式: Annotations/<画像名>.xml と ImageSets/Main/<split>.txt
+
+    座標はVOCの慣例に合わせて1始まりのピクセル座標（xmin・yminを含み、xmax・ymaxまでを含む範囲）です。
+    """
+    name = 'voc'
+
+    def __init__(self, output_dir, labels, target_size):
+        super().__init__(output_dir, labels, target_size)
+        self._names = {label_id: escape(name) for label_id, name in labels}
+
+    def begin_split(self, split):
+        path = os.path.join(self.output_dir, 'ImageSets', 'Main', f'{split}.txt')
+        self._makedirs(path)
+        self._image_set = open(path, 'w', encoding='utf-8')
+
+    def write_image(self, split, image_id, filename, label_ids, coords):
+        stem = os.path.splitext(filename)[0]
+        xml_path = os.path.join(self.output_dir, 'Annotations', stem + '.xml')
+        self._makedirs(xml_path)
+
+        # 1始まりに変換し、xmax・ymax が xmin・ymin より小さくならないようにする
+        boxes = np.rint(self.pixel_boxes(coords)).astype(np.int64)
+        boxes[:, :2] = np.minimum(boxes[:, :2] + 1, self.target_size)
+        boxes[:, 2:] = np.maximum(boxes[:, 2:], boxes[:, :2])
+        objects = ''.join(
+            VOC_OBJECT_FORMAT % (self._names.get(label_id) or escape(str(label_id)), *box)
+            for label_id, box in zip(label_ids.tolist(), boxes.tolist())
+        )
+
+        with open(xml_path, 'w', encoding='utf-8') as f:
+            f.write(
+                "<annotation>\n"
+                f"  <folder>{escape(os.path.dirname(f'images/{split}/{filename}'))}</folder>\n"
+                f"  <filename>{escape(os.path.basename(filename))}</filename>\n"
+                "  <size>\n"
+                f"    <width>{self.target_size}</width>\n"
+                f"    <height>{self.target_size}</height>\n"
+                "    <depth>3</depth>\n"
+                "  </size>\n"
+                "  <segmented>0</segmented>\n"
+                + objects +
+                "</annotation>\n"
+            )
+        self._image_set.write(stem + '\n')
+
+    def end_split(self, split):
+        self._image_set.close()
+
+
+# 出力形式の名前とライターの対応表
+EXPORT_FORMATS = {writer.name: writer for writer in (YoloWriter, CocoWriter, VocWriter)}
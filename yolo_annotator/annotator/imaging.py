@@ -0,0 +1,232 @@
+"""
+エクスポート用の画像変換処理
+プロセスプールのワーカーから呼び出されるため、Djangoに依存しない純粋なPIL処理のみを置きます。
+"""
+import math
+import os
+import time
+
+from PIL import Image, ImageColor, ImageOps
+
+# 選択できるリサンプリングフィルター（上ほど高速、下ほど高品質）
+RESAMPLE_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
+
+# リサイズした画像を貼り付ける位置
+PADDING_MODES = ('top-left', 'center')
+
+# 出力形式（keep は元画像と同じ形式）と拡張子
+OUTPUT_FORMATS = {
+    'keep': None,
+    'jpeg': ('JPEG', '.jpg'),
+    'png': ('PNG', '.png'),
+    'webp': ('WEBP', '.webp'),
+}
+
+# 既定の変換設定（settings.EXPORT_LETTERBOX で上書き）
+# draft と reducing_gap=2.0 は、以前使用していた Image.thumbnail が内部で行っていた処理と同じです。
+DEFAULT_LETTERBOX = {
+    'resample': 'lanczos',
+    'padding': 'top-left',
+    'fill': '#FFFFFF',
+    'quality': 95,
+    'draft': True,
+    'reducing_gap': 2.0,
+    'output_format': 'keep',
+}
+
+
+def letterbox_options(**overrides):
+    """変換設定を検証して正規化した辞書を返す（不正な値は ValueError）
+
+    resample     リサンプリングフィルター（RESAMPLE_FILTERS のキー）
+    padding      貼り付け位置（top-left: 左上 / center: 中央）
+    fill         パディングの色（'#RRGGBB' などPILの色指定、または (R, G, B)）
+    quality      JPEG・WebPの画質（1〜100）
+    draft        JPEGを縮小した解像度で直接デコードする
+    reducing_gap 指定した場合、出力サイズのこの倍率までは整数分の1の縮小（reduce）で高速に縮め、残りをリサンプリングする（None で無効）
+    output_format 出力形式（OUTPUT_FORMATS のキー）
+    """
+    unknown = set(overrides) - set(DEFAULT_LETTERBOX)
+    if unknown:
+        raise ValueError(f'未知の変換設定です: {", ".join(sorted(unknown))}')
+    options = {**DEFAULT_LETTERBOX, **overrides}
+
+    if options['resample'] not in RESAMPLE_FILTERS:
+        raise ValueError(f'リサンプリングフィルターが正しくありません: {options["resample"]}')
+    if options['padding'] not in PADDING_MODES:
+        raise ValueError(f'パディング位置が正しくありません: {options["padding"]}')
+    if options['output_format'] not in OUTPUT_FORMATS:
+        raise ValueError(f'出力形式が正しくありません: {options["output_format"]}')
+    fill = options['fill']
+    options['fill'] = tuple(fill) if isinstance(fill, (list, tuple)) else ImageColor.getrgb(fill)[:3]
+    options['quality'] = int(options['quality'])
+    if not 1 <= options['quality'] <= 100:
+        raise ValueError(f'画質は1〜100で指定してください: {options["quality"]}')
+    options['draft'] = bool(options['draft'])
+    if options['reducing_gap'] is not None:
+        options['reducing_gap'] = float(options['reducing_gap'])
+        if options['reducing_gap'] < 1:
+            raise ValueError(f'reducing_gap は1以上で指定してください: {options["reducing_gap"]}')
+    return options
+
+
+def letterbox_settings(options):
+    """エクスポートキャッシュのキーに含める変換設定の文字列"""
+    return '|'.join(f'{key}={options[key]}' for key in sorted(options))
+
+
+def output_filename(filename, options):
+    """出力形式に合わせて拡張子を変えたファイル名"""
+    output_format = OUTPUT_FORMATS[options['output_format']]
+    if output_format is None:
+        return filename
+    return os.path.splitext(filename)[0] + output_format[1]
+
+
+def fit_size(width, height, target_size):
+    """アスペクト比を保ってtarget_size四方に収まるサイズ（拡大はしない、Image.thumbnail と同じ丸め）"""
+    if width <= target_size and height <= target_size:
+        return width, height
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    x = y = target_size
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+def letterbox_image(src_path, dst_path, target_size, options=None, timings=None):
+    """画像をリサイズして正方形キャンバスに配置し保存する
+
+    options は letterbox_options の戻り値です（省略時は既定の設定）。
+    timings に辞書を渡すと、decode / resample / encode の処理時間（秒）を書き込みます。
+    戻り値は (元画像サイズ, リサイズ後サイズ, 貼り付け位置) のタプルです。
+    """
+    options = options or letterbox_options()
+    resample = RESAMPLE_FILTERS[options['resample']]
+    reducing_gap = options['reducing_gap']
+    started = time.perf_counter()
+
+    with Image.open(src_path) as img:
+        original_size = img.size
+        resized_size = fit_size(*original_size, target_size)
+
+        if options['draft'] and resized_size != original_size:
+            # JPEGはDCTの段階で1/2〜1/8に縮小してデコードする（リサンプリング前の画素数が減る）
+            gap = reducing_gap or 1
+            img.draft('RGB', (round(resized_size[0] * gap), round(resized_size[1] * gap)))
+
+        # RGBに変換（必要に応じて）
+        img.load()
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        decoded = time.perf_counter()
+
+        # 画像をターゲットサイズに合わせてリサイズ（アスペクト比を保持）
+        if img.size != resized_size:
+            img = img.resize(resized_size, resample, reducing_gap=reducing_gap)
+
+        # 正方形のキャンバスを作成してパディング
+        new_img = Image.new('RGB', (target_size, target_size), options['fill'])
+        if options['padding'] == 'center':
+            paste_position = ((target_size - resized_size[0]) // 2, (target_size - resized_size[1]) // 2)
+        else:
+            paste_position = (0, 0)
+        new_img.paste(img, paste_position)
+        resampled = time.perf_counter()
+
+        # リサイズした画像を保存
+        output_format = OUTPUT_FORMATS[options['output_format']]
+        if output_format is None:
+            new_img.save(dst_path, quality=options['quality'])
+        else:
+            new_img.save(dst_path, output_format[0], quality=options['quality'])
+
+    if timings is not None:
+        timings.update(decode=decoded - started, resample=resampled - decoded, encode=time.perf_counter() - resampled)
+    return original_size, resized_size, paste_position
+
+
+def _letterbox_task(task):
+    """プロセスプール用のラッパー（引数をタプルで受け取る）
+
+    戻り値は (letterbox_image の戻り値, 計測値) で、計測値は処理時間（秒）と読み書きしたバイト数の辞書です。
+    """
+    src_path, dst_path, target_size, options = task
+    timings = {}
+    result = letterbox_image(src_path, dst_path, target_size, options, timings)
+    return result, {
+        'timings': timings,
+        'bytes_read': os.path.getsize(src_path),
+        'bytes_written': os.path.getsize(dst_path),
+    }
+
+
+def make_thumbnail(src_path, dst_path, size, quality=80):
+    """短辺がsizeピクセルになるよう縮小したJPEGサムネイルを作成（一覧のobject-fit: cover表示用）"""
+    with Image.open(src_path) as img:
+        # JPEGは縮小した解像度で直接デコードして読み込みを軽くする
+        img.draft('RGB', (size, size))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        width, height = img.size
+        scale = size / min(width, height)
+        if scale < 1:
+            new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            img = img.resize(new_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+        img.save(dst_path, 'JPEG', quality=quality, optimize=True)
+
+
+def level_size(width, height, level):
+    """タイルピラミッドの各レベルの画像サイズ（レベル0が原寸、1つ上がるごとに半分）"""
+    factor = 2 ** level
+    return max(1, math.ceil(width / factor)), max(1, math.ceil(height / factor))
+
+
+def make_tile_levels(src_path, level_dirs, tile_size, quality=85):
+    """元画像を1回だけデコードし、指定したレベルのタイルを作成する
+
+    level_dirs はレベル番号から出力フォルダへの辞書です。最も細かいレベルの画像を作り、
+    そこから半分ずつ縮小して粗いレベルを作ります。タイルは「列_行.jpg」で保存し、
+    作成したファイルの合計バイト数を返します。
+    """
+    levels = sorted(level_dirs)
+    written = 0
+    with Image.open(src_path) as img:
+        width, height = img.size
+        target = level_size(width, height, levels[0])
+        # JPEGは縮小した解像度で直接デコードして読み込みを軽くする
+        img.draft('RGB', target)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        level_img = img
+        for level in levels:
+            target = level_size(width, height, level)
+            if level_img.size != target:
+                level_img = level_img.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+            dst_dir = level_dirs[level]
+            os.makedirs(dst_dir, exist_ok=True)
+            for top in range(0, target[1], tile_size):
+                for left in range(0, target[0], tile_size):
+                    box = (left, top, min(left + tile_size, target[0]), min(top + tile_size, target[1]))
+                    tile_path = os.path.join(dst_dir, f"{left // tile_size}_{top // tile_size}.jpg")
+                    level_img.crop(box).save(tile_path, 'JPEG', quality=quality)
+                    written += os.path.getsize(tile_path)
+    return written
@@ -0,0 +1,373 @@
+"""
+YOLO形式データセットの取り込み
+images/ ・ labels/*.txt ・ data.yaml からなるデータセット（以前のプロジェクトの出力やモデルによる事前ラベル）を
+読み込み、画像をbase_imagesに配置して ImageFile・Annotation をまとめて登録します。
+画像とラベルファイルは BATCH_SIZE 枚ずつ処理し、バッチごとに1つのトランザクションでまとめて登録するため、
+データセットの大きさによらずメモリ使用量は一定です。
+"""
+import colorsys
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import yaml
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .export_cache import link_or_copy
+from .ingest import HEADER_THREADS, IMAGE_EXTENSIONS, read_image_size
+from .models import Annotation, ImageFile, Label, ScanEntry
+
+logger = logging.getLogger(__name__)
+
+# 1トランザクションで登録する画像の枚数
+BATCH_SIZE = 2000
+
+# アノテーションのINSERT（executemany）1回あたりの件数
+ANNOTATION_BATCH_SIZE = 50000
+
+# 一括INSERTする Annotation の列（モデル定義から列名を求める）
+ANNOTATION_FIELDS = ('image', 'label', 'x_center', 'y_center', 'width', 'height', 'created_at', 'updated_at')
+
+# 取り込み済みの画像にアノテーションがある場合の動作
+ON_EXISTING_CHOICES = ('skip', 'replace', 'append')
+
+YAML_FILENAMES = ('data.yaml', 'dataset.yaml')
+
+
+def find_dataset_yaml(dataset_dir):
+    """データセットのYAMLファイルを探す（data.yaml → dataset.yaml → 最初に見つかった *.yaml）"""
+    for name in YAML_FILENAMES:
+        path = os.path.join(dataset_dir, name)
+        if os.path.isfile(path):
+            return path
+    candidates = sorted(name for name in os.listdir(dataset_dir) if name.endswith(('.yaml', '.yml')))
+    return os.path.join(dataset_dir, candidates[0]) if candidates else None
+
+
+def path_within(path, roots):
+    """path（シンボリックリンクを解決したパス）が roots のいずれかのフォルダの中にあるか"""
+    real_path = os.path.realpath(path)
+    for root in roots:
+        root = os.path.realpath(root)
+        if os.path.commonpath([root, real_path]) == root:
+            return True
+    return False
+
+
+def read_dataset_yaml(dataset_dir, allowed_dirs=None):
+    """YAMLからクラス名（クラスID → 名前）と画像フォルダの一覧を読み込む
+
+    画像フォルダは train / val / test に書かれたフォルダ（path からの相対パス）で、
+    見つからない場合はデータセット直下の images フォルダを使います。
+    allowed_dirs を指定した場合、YAMLの path・train などが絶対パスや ../ で
+    そのいずれの中でもないフォルダを指していればエラーにします。
+    """
+    yaml_path = find_dataset_yaml(dataset_dir)
+    if yaml_path is None:
+        raise ValueError(f'YAMLファイルが見つかりません: {dataset_dir}')
+    with open(yaml_path, encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+
+    names = config.get('names') or {}
+    if isinstance(names, list):
+        names = dict(enumerate(names))
+    names = {int(class_id): str(name) for class_id, name in names.items()}
+    if not names:
+        raise ValueError(f'YAMLファイルにクラス名（names）がありません: {yaml_path}')
+
+    # path はYAMLのあるフォルダからの相対パス（存在しない場合はYAMLのあるフォルダ）
+    root = os.path.join(os.path.dirname(yaml_path), str(config.get('path') or ''))
+    if not os.path.isdir(root):
+        root = os.path.dirname(yaml_path)
+
+    image_dirs = []
+    for key in ('train', 'val', 'test'):
+        entries = config.get(key) or []
+        for entry in entries if isinstance(entries, list) else [entries]:
+            path = os.path.normpath(os.path.join(root, str(entry)))
+            if os.path.isdir(path):
+                if path not in image_dirs:
+                    image_dirs.append(path)
+            else:
+                logger.warning('画像フォルダが見つからないためスキップします (%s): %s', key, path)
+    if not image_dirs:
+        fallback = os.path.join(dataset_dir, 'images')
+        if not os.path.isdir(fallback):
+            raise ValueError(f'画像フォルダが見つかりません: {dataset_dir}')
+        image_dirs.append(fallback)
+    if allowed_dirs is not None:
+        for path in image_dirs:
+            if not path_within(path, allowed_dirs):
+                raise ValueError(f'このフォルダの画像は取り込めません: {path}')
+    return names, image_dirs
+
+
+def label_path_for(image_path):
+    """画像に対応するラベルファイルのパス（パス中の最後の images を labels に置き換え、拡張子を .txt に）"""
+    head, sep, tail = image_path.rpartition(f'{os.sep}images{os.sep}')
+    if sep:
+        image_path = f'{head}{os.sep}labels{os.sep}{tail}'
+    return os.path.splitext(image_path)[0] + '.txt'
+
+
+def parse_label_file(label_path):
+    """ラベルファイルを読み込み、(ボックスのリスト, 不正な行数) を返す（ファイルがない場合はボックスがNone）
+
+    セグメンテーション形式（クラスID + 多角形の頂点）の行は外接矩形に変換します。
+    """
+    try:
+        with open(label_path, encoding='utf-8') as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None, 0
+
+    boxes = []
+    invalid = 0
+    for line in text.splitlines():
+        values = line.split()
+        if not values:
+            continue
+        try:
+            class_id = int(values[0])
+            coords = [float(value) for value in values[1:]]
+        except ValueError:
+            invalid += 1
+            continue
+        if len(coords) == 4:
+            boxes.append((class_id, *coords))
+        elif len(coords) >= 6 and len(coords) % 2 == 0:
+            xs, ys = coords[0::2], coords[1::2]
+            left, right, top, bottom = min(xs), max(xs), min(ys), max(ys)
+            boxes.append((class_id, (left + right) / 2, (top + bottom) / 2, right - left, bottom - top))
+        else:
+            invalid += 1
+    return boxes, invalid
+
+
+def _label_color(index):
+    """新しく作成するラベルの表示色（色相をずらして見分けやすくする）"""
+    r, g, b = colorsys.hsv_to_rgb((index * 0.618033988749895) % 1, 0.85, 0.95)
+    return f'#{round(r * 255):02X}{round(g * 255):02X}{round(b * 255):02X}'
+
+
+def ensure_labels(names):
+    """クラス名に対応するラベルを用意し、(クラスID → ラベルID, 新規作成数) を返す"""
+    existing = dict(Label.objects.filter(name__in=names.values()).values_list('name', 'id'))
+    missing = [name for name in dict.fromkeys(names.values()) if name not in existing]
+    if missing:
+        offset = Label.objects.count()
+        Label.objects.bulk_create(
+            [Label(name=name, color=_label_color(offset + i)) for i, name in enumerate(missing)],
+            ignore_conflicts=True
+        )
+        existing = dict(Label.objects.filter(name__in=names.values()).values_list('name', 'id'))
+    return {class_id: existing[name] for class_id, name in names.items()}, len(missing)
+
+
+def _iter_images(image_dirs, allowed_dirs=None):
+    """画像フォルダ内の画像のパスを名前順に返す
+
+    シンボリックリンクのフォルダはたどりません。allowed_dirs を指定した場合、
+    リンク先がそのいずれの中でもない画像のシンボリックリンクは除きます。
+    """
+    for image_dir in image_dirs:
+        stack = [image_dir]
+        while stack:
+            directory = stack.pop()
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name, reverse=True)
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    if entry.is_symlink() and allowed_dirs is not None and not path_within(entry.path, allowed_dirs):
+                        logger.warning('取り込めない場所へのリンクのためスキップします: %s', entry.path)
+                        continue
+                    yield entry.path
+
+
+def _source_root(dataset_dir, image_dirs):
+    """画像の配置先を決める基準のフォルダ
+
+    画像フォルダがすべてデータセットの中にあればデータセットのフォルダ、YAMLが外のフォルダを
+    指している場合は、各画像フォルダの親フォルダに共通するフォルダを使います。
+    """
+    if all(os.path.commonpath([dataset_dir, path]) == dataset_dir for path in image_dirs):
+        return dataset_dir
+    return os.path.commonpath([os.path.dirname(path) for path in image_dirs])
+
+
+def _destination(src_path, source_root, prefix):
+    """base_images内での相対パスを決める（base_images内にあるデータセットはそのままの場所を使う）"""
+    base_dir = os.path.realpath(settings.BASE_IMAGES_DIR)
+    real_path = os.path.realpath(src_path)
+    if os.path.commonpath([base_dir, real_path]) == base_dir:
+        return os.path.relpath(real_path, base_dir).replace(os.sep, '/')
+
+    relative = os.path.relpath(src_path, source_root).replace(os.sep, '/')
+    if relative.startswith('images/'):
+        relative = relative[len('images/'):]
+    destination = f'{prefix}/{relative}'
+    # base_images/<prefix>/ の外に配置しない
+    if relative.startswith('../') or os.path.normpath(destination) != destination:
+        raise ValueError(f'取り込み先のパスが正しくありません: {destination}')
+    return destination
+
+
+def _prepare(task):
+    """画像をbase_imagesに配置してサイズを読み込み、ラベルファイルを解析する（スレッドプールで実行）"""
+    src_path, filename = task
+    dst_path = os.path.join(settings.BASE_IMAGES_DIR, filename)
+    placed = None
+    if os.path.realpath(dst_path) != os.path.realpath(src_path):
+        if not os.path.exists(dst_path):
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            link_or_copy(src_path, dst_path)
+        stat = os.stat(dst_path)
+        placed = (stat.st_mtime, stat.st_size)
+    image_size = read_image_size(dst_path)
+    boxes, invalid = parse_label_file(label_path_for(src_path))
+    return filename, image_size, placed, boxes, invalid
+
+
+def _insert_annotations(rows):
+    """アノテーションの行 (image_id, label_id, x, y, w, h) を executemany でまとめて登録
+
+    数十万件単位の取り込みでは bulk_create のモデル生成と値の変換が処理時間の大半を占めるため、
+    値がそのまま使える数値だけの行はSQLを直接実行します（集計値の更新は呼び出し側で行う）。
+    """
+    meta = Annotation._meta
+    columns = ', '.join(connection.ops.quote_name(meta.get_field(name).column) for name in ANNOTATION_FIELDS)
+    placeholders = ', '.join(['%s'] * len(ANNOTATION_FIELDS))
+    sql = f'INSERT INTO {connection.ops.quote_name(meta.db_table)} ({columns}) VALUES ({placeholders})'
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), ANNOTATION_BATCH_SIZE):
+            cursor.executemany(sql, [(*row, now, now) for row in rows[start:start + ANNOTATION_BATCH_SIZE]])
+
+
+def _save_batch(prepared, class_map, on_existing, stats):
+    """1バッチ分の画像・アノテーションを1つのトランザクションで登録"""
+    prepared = [item for item in prepared if item[1] is not None]
+    filenames = [item[0] for item in prepared]
+
+    with transaction.atomic():
+        existing = {
+            filename: (image_id, count)
+            for filename, image_id, count in ImageFile.objects.filter(filename__in=filenames)
+            .values_list('filename', 'id', 'annotation_count')
+        }
+
+        new_images = [
+            ImageFile(
+                filename=filename, width=width, height=height,
+                is_annotated=boxes is not None,
+                annotation_count=sum(1 for box in boxes or () if box[0] in class_map),
+            )
+            for filename, (width, height), _, boxes, _ in prepared
+            if filename not in existing
+        ]
+        image_ids = {image.filename: image.id for image in ImageFile.objects.bulk_create(new_images)}
+        stats['images_created'] += len(new_images)
+
+        # 既存の画像は on_existing に従ってアノテーションを追加・置き換え・スキップ
+        updated_ids = []
+        replaced_ids = []
+        for filename, _, _, boxes, _ in prepared:
+            if filename not in existing or boxes is None:
+                continue
+            image_id, count = existing[filename]
+            if count and on_existing == 'skip':
+                stats['images_skipped'] += 1
+                continue
+            if count and on_existing == 'replace':
+                replaced_ids.append(image_id)
+            image_ids[filename] = image_id
+            updated_ids.append(image_id)
+
+        label_deltas = Counter()
+        if replaced_ids:
+            for row in (Annotation.objects.filter(image_id__in=replaced_ids)
+                        .values('label_id').annotate(count=Count('id')).order_by()):
+                label_deltas[row['label_id']] -= row['count']
+            Annotation.objects.filter(image_id__in=replaced_ids).delete()
+
+        rows = []
+        for filename, _, _, boxes, _ in prepared:
+            image_id = image_ids.get(filename)
+            if image_id is None or not boxes:
+                continue
+            for class_id, *coords in boxes:
+                label_id = class_map.get(class_id)
+                if label_id is None:
+                    stats['unknown_class_boxes'] += 1
+                    continue
+                rows.append((image_id, label_id, *coords))
+                label_deltas[label_id] += 1
+        _insert_annotations(rows)
+        stats['annotations_created'] += len(rows)
+        Label.add_usage(label_deltas)
+
+        if updated_ids:
+            ImageFile.objects.filter(id__in=updated_ids).update(is_annotated=True)
+            ImageFile.refresh_annotation_counts(updated_ids)
+            stats['images_updated'] += len(updated_ids)
+
+        # base_imagesに配置したファイルはスキャン索引にも登録し、次回の画像読み込みで再処理しない
+        ScanEntry.objects.bulk_create(
+            [ScanEntry(path=filename, mtime=placed[0], size=placed[1])
+             for filename, _, placed, _, _ in prepared if placed],
+            ignore_conflicts=True
+        )
+
+
+def import_yolo(dataset_dir, prefix=None, on_existing='skip', progress=None, allowed_dirs=None):
+    """YOLO形式のデータセットを取り込み、件数の集計を返す
+
+    画像は base_images/<prefix>/ にハードリンク（できなければコピー）します。prefix の既定値はデータセットのフォルダ名です。
+    on_existing は既にアノテーションがある画像の扱いで、skip（変更しない）/ replace（置き換え）/ append（追加）です。
+    allowed_dirs（画面から実行する場合は settings.IMPORT_ALLOWED_DIRS）を指定すると、
+    データセットのフォルダとYAMLが指す画像フォルダがいずれもその中にあることを確認します。
+    """
+    if on_existing not in ON_EXISTING_CHOICES:
+        raise ValueError(f'on_existing の値が正しくありません: {on_existing}')
+    dataset_dir = os.path.abspath(dataset_dir)
+    if not os.path.isdir(dataset_dir):
+        raise ValueError(f'フォルダが見つかりません: {dataset_dir}')
+    if allowed_dirs is not None and not path_within(dataset_dir, allowed_dirs):
+        raise ValueError(f'このフォルダからは取り込めません: {dataset_dir}')
+    prefix = (prefix or os.path.basename(dataset_dir)).strip('/')
+    if not prefix or os.path.normpath(prefix) != prefix or prefix.split('/')[0] == '..':
+        raise ValueError(f'取り込み先のフォルダ名が正しくありません: {prefix}')
+
+    names, image_dirs = read_dataset_yaml(dataset_dir, allowed_dirs)
+    class_map, labels_created = ensure_labels(names)
+
+    # 進捗表示のため、先に画像の枚数だけ数える（ファイル名のみの走査）
+    total = sum(1 for _ in _iter_images(image_dirs, allowed_dirs))
+    stats = Counter(labels_created=labels_created)
+    done = 0
+
+    source_root = _source_root(dataset_dir, image_dirs)
+    tasks = ((path, _destination(path, source_root, prefix)) for path in _iter_images(image_dirs, allowed_dirs))
+    with ThreadPoolExecutor(max_workers=HEADER_THREADS) as executor:
+        while batch := list(islice(tasks, BATCH_SIZE)):
+            prepared = list(executor.map(_prepare, batch))
+            for filename, image_size, _, boxes, invalid in prepared:
+                if image_size is None:
+                    stats['unreadable_images'] += 1
+                if boxes is None:
+                    stats['images_without_labels'] += 1
+                stats['invalid_lines'] += invalid
+            _save_batch(prepared, class_map, on_existing, stats)
+            done += len(batch)
+            if progress:
+                progress(done, total)
+
+    logger.info('YOLOデータセット取り込み完了: %s %s', dataset_dir, dict(stats))
+    return dict(stats, total_images=total, prefix=prefix)
@@ -0,0 +1,119 @@
+"""
+base_imagesフォルダからの画像取り込み処理
+フォルダを os.scandir で再帰的に走査し、スキャン索引（パス・更新時刻・サイズ）と比較して
+新規または変更されたファイルだけを処理します。画像ヘッダーの読み込みはスレッドプールで並列に行い、
+データベースへの登録は bulk_create でまとめて実行します。
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image
+
+from .models import ImageFile, ScanEntry
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+
+# 一度にINSERT/UPDATEする件数
+BATCH_SIZE = 500
+
+# ヘッダー読み込みのスレッド数（I/O待ちが主なのでCPU数より多めに）
+HEADER_THREADS = min(32, (os.cpu_count() or 1) * 4)
+
+
+def scan_directory(base_dir):
+    """フォルダを再帰的に走査し、画像ファイルの (相対パス, 更新時刻, サイズ) を返す"""
+    stack = [('', base_dir)]
+    while stack:
+        prefix, directory = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((prefix + entry.name + '/', entry.path))
+                elif entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    stat = entry.stat()
+                    yield prefix + entry.name, stat.st_mtime, stat.st_size
+
+
+def read_image_size(filepath):
+    """画像のヘッダーのみを読み込んでサイズを取得（読み込めない場合はNone）"""
+    try:
+        with Image.open(filepath) as img:
+            return img.size
+    except Exception as e:
+        logger.warning('画像を読み込めません %s: %s', filepath, e)
+        return None
+
+
+def _batched(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def load_base_images(progress=None):
+    """base_imagesフォルダの新しい画像をデータベースに登録し、登録件数を返す"""
+    base_images_dir = settings.BASE_IMAGES_DIR
+    if not os.path.exists(base_images_dir):
+        os.makedirs(base_images_dir)
+        raise FileNotFoundError('base_imagesフォルダが見つかりません')
+
+    # 前回のスキャン索引と登録済みの画像を一括で取得
+    index = {
+        path: (entry_id, mtime, size)
+        for entry_id, path, mtime, size in ScanEntry.objects.values_list('id', 'path', 'mtime', 'size').iterator()
+    }
+    registered = dict(ImageFile.objects.values_list('filename', 'id').iterator())
+
+    # 索引と比較して、新規・変更されたファイルだけを抽出
+    new_entries = []
+    changed_entries = []
+    seen = set()
+    for path, mtime, size in scan_directory(base_images_dir):
+        seen.add(path)
+        indexed = index.get(path)
+        if indexed is None:
+            new_entries.append(ScanEntry(path=path, mtime=mtime, size=size))
+        elif indexed[1:] != (mtime, size):
+            changed_entries.append(ScanEntry(id=indexed[0], path=path, mtime=mtime, size=size))
+
+    pending = new_entries + changed_entries
+    total = len(pending)
+    created_images = []
+    updated_images = []
+
+    # 画像ヘッダーをスレッドプールで読み込み
+    with ThreadPoolExecutor(max_workers=HEADER_THREADS) as executor:
+        paths = (os.path.join(base_images_dir, entry.path) for entry in pending)
+        for done, (entry, image_size) in enumerate(zip(pending, executor.map(read_image_size, paths)), 1):
+            if image_size is not None:
+                width, height = image_size
+                image_id = registered.get(entry.path)
+                if image_id is None:
+                    created_images.append(ImageFile(filename=entry.path, width=width, height=height))
+                else:
+                    updated_images.append(ImageFile(id=image_id, width=width, height=height))
+            if progress:
+                progress(done, total)
+
+    with transaction.atomic():
+        for batch in _batched(created_images):
+            ImageFile.objects.bulk_create(batch, ignore_conflicts=True)
+        for batch in _batched(updated_images):
+            ImageFile.objects.bulk_update(batch, ['width', 'height'])
+
+        # スキャン索引を更新（消えたファイルの索引は削除）
+        for batch in _batched(new_entries):
+            ScanEntry.objects.bulk_create(batch)
+        for batch in _batched(changed_entries):
+            ScanEntry.objects.bulk_update(batch, ['mtime', 'size'])
+        removed_ids = [entry_id for path, (entry_id, _, _) in index.items() if path not in seen]
+        for batch in _batched(removed_ids):
+            ScanEntry.objects.filter(id__in=batch).delete()
+
+    logger.info('画像スキャン完了: 新規 %d件, 更新 %d件, スキップ %d件',
+                len(created_images), len(updated_images), len(seen) - total)
+    return len(created_images)
@@ -0,0 +1,275 @@
+"""
+ローカルジョブキュー
+ジョブはSQLiteのJobテーブルに保存され、`run_worker`管理コマンドで起動したワーカープロセスが順に実行します。
+Redisなどのブローカーは不要です。
+"""
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .export import export_dataset
+from .export_report import format_bytes, format_stages
+from .importer import import_yolo
+from .ingest import load_base_images
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# 進捗をデータベースに書き込む最小間隔（秒）
+PROGRESS_INTERVAL = 0.5
+
+# 実行中のジョブのハートビートを更新する間隔（秒）
+HEARTBEAT_INTERVAL = 30
+
+# ハートビートがこの秒数更新されていない実行中のジョブは、ワーカーが異常終了したものとみなす
+STALE_AFTER = 300
+
+# 異常終了したジョブを実行する回数の上限（超えた場合はエラーにする）
+MAX_ATTEMPTS = 2
+
+# データベースのエラーが続いた場合に、次に試すまで待つ時間の上限（秒）
+MAX_BACKOFF = 60
+
+
+def _run_load_images(params, progress):
+    created_count = load_base_images(progress=progress)
+    return {
+        'message': f'{created_count}個の新しい画像を読み込みました',
+        'created_count': created_count,
+    }
+
+
+def _run_split_dataset(params, progress):
+    result = export_dataset(
+        split_ratio=float(params.get('split_ratio', 0.8)),
+        target_size=int(params.get('image_size', 640)),
+        progress=progress,
+        formats=params.get('formats') or ['yolo'],
+        test_ratio=float(params.get('test_ratio', 0)),
+        seed=int(params.get('seed', 0)),
+        stratify=bool(params.get('stratify', False)),
+        letterbox=params.get('letterbox'),
+        dry_run=bool(params.get('dry_run', False)),
+    )
+    if result['dry_run']:
+        result['message'] = (
+            f'エクスポートを見積もりました ({result["sample_count"]}枚で試行、ファイルは出力していません)\n'
+            f'対象の画像: train {result["train_count"]}枚, valid {result["valid_count"]}枚, '
+            f'test {result["test_count"]}枚\n'
+            f'変換が必要な画像: {result["estimated_encoded_count"]}枚 '
+            f'(キャッシュ済み: {result["cache_hit_ratio"]:.0%})\n'
+            f'予想処理時間: {format_stages(result["estimated_stage_seconds"])}\n'
+            f'予想出力サイズ: {format_bytes(sum(result["estimated_output_bytes"].values()))}'
+        )
+        return result
+
+    stage_seconds = {name: stats['seconds'] for name, stats in result['report']['stages'].items()}
+    result['message'] = (
+        f'データセットを分割しました (train: {result["train_count"]}, valid: {result["valid_count"]}, '
+        f'test: {result["test_count"]})\n'
+        f'分割のシード: {result["seed"]}{" (ラベルで層化)" if result["stratified"] else ""}\n'
+        f'画像サイズ: {result["image_size"]}x{result["image_size"]}\n'
+        f'出力形式: {", ".join(result["formats"])}\n'
+        f'変換した画像: {result["encoded_count"]}枚 (キャッシュから再利用: {result["cached_count"]}枚)\n'
+        f'処理時間: {format_stages(stage_seconds)}\n'
+        f'出力フォルダ: output_{result["timestamp"]} (計測レポート: {result["report_filename"]})'
+    )
+    if result['yaml_filename']:
+        result['message'] += f'\nYAMLファイルを生成しました: {result["yaml_filename"]}'
+    return result
+
+
+def _run_import_yolo(params, progress):
+    result = import_yolo(
+        params['path'],
+        prefix=params.get('prefix'),
+        on_existing=params.get('on_existing', 'skip'),
+        progress=progress,
+        # 画面から登録されたジョブなので、YAMLが指す画像フォルダも取り込みを許可したフォルダに限る
+        allowed_dirs=settings.IMPORT_ALLOWED_DIRS,
+    )
+    result['message'] = (
+        f'YOLOデータセットを取り込みました (画像: {result["total_images"]}枚)\n'
+        f'新しい画像: {result.get("images_created", 0)}枚, '
+        f'アノテーション: {result.get("annotations_created", 0)}件, '
+        f'新しいラベル: {result.get("labels_created", 0)}個\n'
+        f'取り込み先: base_images/{result["prefix"]}/'
+    )
+    return result
+
+
+# ジョブの種類と実行関数の対応表
+# 実行関数は (params, progress) を受け取り、'message' を含む結果dictを返します。
+JOB_HANDLERS = {
+    'load_images': _run_load_images,
+    'split_dataset': _run_split_dataset,
+    'import_yolo': _run_import_yolo,
+}
+
+
+def enqueue(kind, params=None):
+    """ジョブをキューに追加"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'未知のジョブ種別です: {kind}')
+    return Job.objects.create(kind=kind, params=params or {})
+
+
+def claim_job(job_id):
+    """待機中のジョブを実行中にして返す（他のワーカーが先に確保した場合は None）
+
+    条件付きUPDATEで確保するため、同じジョブを複数のワーカーが同時に確保しようとしても1つだけが成功します。
+    """
+    now = timezone.now()
+    claimed = Job.objects.filter(id=job_id, status=Job.STATUS_PENDING).update(
+        status=Job.STATUS_RUNNING,
+        started_at=now,
+        heartbeat_at=now,
+        attempts=F('attempts') + 1,
+    )
+    return Job.objects.get(id=job_id) if claimed else None
+
+
+def claim_next_job():
+    """待機中の最も古いジョブを実行中にして返す（他のワーカーに先を越された場合は次のジョブを探す）"""
+    while True:
+        job_id = Job.objects.filter(status=Job.STATUS_PENDING).order_by('id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        job = claim_job(job_id)
+        if job is not None:
+            return job
+
+
+def reclaim_stale_jobs(stale_after=STALE_AFTER):
+    """ハートビートが途絶えた実行中のジョブを待機中に戻す（実行回数が上限に達したものはエラーにする）
+
+    ワーカーが異常終了・再起動した場合に、実行中のまま残ったジョブを回収します。戻り値は (再実行, エラー) の件数です。
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=stale_after)
+    stale = Job.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=Job.STATUS_RUNNING,
+    )
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=Job.STATUS_ERROR,
+        message='ワーカーが応答しなくなったため中断しました',
+        finished_at=now,
+    )
+    requeued = stale.filter(attempts__lt=MAX_ATTEMPTS).update(
+        status=Job.STATUS_PENDING,
+        started_at=None,
+        heartbeat_at=None,
+        progress_done=0,
+        progress_total=0,
+    )
+    if requeued or failed:
+        logger.warning('応答のないジョブを回収しました（再実行: %d件, エラー: %d件）', requeued, failed)
+    return requeued, failed
+
+
+def _current_run(job):
+    """このワーカーが実行中のジョブ（回収されて別のワーカーが実行し直している場合は一致しない）"""
+    return Job.objects.filter(id=job.id, status=Job.STATUS_RUNNING, attempts=job.attempts)
+
+
+def _start_heartbeat(job):
+    """ジョブの実行中、別スレッドでハートビートを定期的に更新する（戻り値の Event をセットすると停止）"""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL):
+                _current_run(job).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.id}-heartbeat', daemon=True)
+    thread.start()
+    return stop, thread
+
+
+def _make_progress(job):
+    """ジョブの進捗を間引いて保存するコールバックを作成"""
+    last_saved = [0.0]
+
+    def progress(done, total):
+        now = time.monotonic()
+        if done < total and now - last_saved[0] < PROGRESS_INTERVAL:
+            return
+        last_saved[0] = now
+        Job.objects.filter(id=job.id).update(progress_done=done, progress_total=total)
+
+    return progress
+
+
+def run_job(job):
+    """ジョブを実行して結果を保存"""
+    handler = JOB_HANDLERS[job.kind]
+    logger.info('ジョブ開始: %s', job)
+    stop_heartbeat, heartbeat = _start_heartbeat(job)
+    try:
+        result = handler(job.params, _make_progress(job))
+        job.status = Job.STATUS_SUCCESS
+        job.message = result.get('message', '')
+        job.result = result
+    except Exception as e:
+        logger.error('ジョブ失敗: %s\n%s', job, traceback.format_exc())
+        job.status = Job.STATUS_ERROR
+        job.message = str(e)
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+    job.finished_at = timezone.now()
+    # 応答がないとして回収された後に終わった場合は、再実行中のジョブの状態を上書きしない
+    if not _current_run(job).update(
+        status=job.status, message=job.message, result=job.result, finished_at=job.finished_at
+    ):
+        logger.warning('回収済みのジョブのため結果を保存しません: %s', job)
+    logger.info('ジョブ終了: %s', job)
+    return job
+
+
+def run_worker(poll_interval=1.0, once=False):
+    """ジョブを取り出して実行し続ける（once=Trueの場合はキューが空になったら終了）
+
+    起動時と、その後 HEARTBEAT_INTERVAL ごとに、異常終了したワーカーのジョブを回収します。
+    ジョブの前後で古い接続を閉じ（CONN_MAX_AGE）、データベースに接続できない間は待つ時間を延ばしながら再試行します。
+    """
+    last_reclaim = None
+    backoff = poll_interval
+    while True:
+        close_old_connections()
+        try:
+            if last_reclaim is None or time.monotonic() - last_reclaim >= HEARTBEAT_INTERVAL:
+                reclaim_stale_jobs()
+                last_reclaim = time.monotonic()
+            job = claim_next_job()
+        except DatabaseError as e:
+            logger.error('ジョブを取得できません（%.0f秒後に再試行します）: %s', backoff, e)
+            connection.close()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+            continue
+        backoff = poll_interval
+
+        if job is not None:
+            try:
+                run_job(job)
+            except DatabaseError as e:
+                # 結果を保存できなかったジョブは、ハートビートが途絶えた後に回収される
+                logger.error('ジョブの結果を保存できません: %s: %s', job, e)
+                connection.close()
+            finally:
+                close_old_connections()
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
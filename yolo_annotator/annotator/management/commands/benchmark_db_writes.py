@@ -0,0 +1,101 @@
+import json
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from annotator.db import sqlite_status
+from annotator.models import ImageFile, Label
+
+BENCH_PREFIX = '__benchmark__/'
+
+
+class Command(BaseCommand):
+    help = ('Simulate concurrent annotators saving through the save_annotations view '
+            'and report write throughput, latency and lock errors for the configured database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--savers', type=int, default=6, help='Number of concurrent savers (threads)')
+        parser.add_argument('--saves', type=int, default=50, help='Number of saves per saver')
+        parser.add_argument('--boxes', type=int, default=20, help='Number of boxes per save')
+
+    def handle(self, *args, **options):
+        savers = options['savers']
+        saves = options['saves']
+        boxes = options['boxes']
+
+        self.stdout.write(f'Database: {connection.vendor} {connection.settings_dict["NAME"]}')
+        status = sqlite_status(connection)
+        if status:
+            self.stdout.write('SQLite: ' + ', '.join(f'{name}={value}' for name, value in status.items()))
+
+        label = Label.objects.create(name=f'{BENCH_PREFIX}label')
+        ImageFile.objects.bulk_create([
+            ImageFile(filename=f'{BENCH_PREFIX}saver_{i}.jpg', width=640, height=480)
+            for i in range(savers)
+        ])
+        images = list(ImageFile.objects.filter(filename__startswith=BENCH_PREFIX).order_by('id'))
+        payload = json.dumps({'annotations': [
+            {'label_id': label.id, 'x_center': 0.5, 'y_center': 0.5, 'width': 0.1, 'height': 0.1}
+        ] * boxes})
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(savers)
+
+        def run_saver(image):
+            # テスト用サーバー名ではALLOWED_HOSTSを通らないためlocalhostとして送信
+            client = Client(SERVER_NAME='localhost')
+            url = reverse('annotator:save_annotations', args=[image.id])
+            barrier.wait()
+            try:
+                for _ in range(saves):
+                    started = time.perf_counter()
+                    result = client.post(url, data=payload, content_type='application/json').json()
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        if result['status'] == 'success':
+                            latencies.append(elapsed)
+                        else:
+                            errors.append(result['message'])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run_saver, args=(image,)) for image in images]
+        started = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            # 計測用のデータを削除（アノテーションは画像と一緒に削除される）
+            ImageFile.objects.filter(filename__startswith=BENCH_PREFIX).delete()
+            Label.objects.filter(name__startswith=BENCH_PREFIX).delete()
+
+        self.report(savers, saves, elapsed, latencies, errors)
+
+    def report(self, savers, saves, elapsed, latencies, errors):
+        total = savers * saves
+        self.stdout.write(f'{total} saves by {savers} savers in {elapsed:.2f}s '
+                          f'({len(latencies) / elapsed:.1f} saves/s)')
+        if latencies:
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(
+                f'latency ms: p50={statistics.median(latencies) * 1000:.1f} '
+                f'p95={p95 * 1000:.1f} max={latencies[-1] * 1000:.1f}'
+            )
+        if errors:
+            locked = sum('locked' in message for message in errors)
+            self.stdout.write(self.style.ERROR(
+                f'{len(errors)} saves failed ({locked} "database is locked"), first error: {errors[0]}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('All saves succeeded'))
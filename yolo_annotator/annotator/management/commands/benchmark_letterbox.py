@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from annotator.export import transform_images
+from annotator.imaging import letterbox_options, output_filename
+from annotator.models import ImageFile
+
+# 比較する変換方法（settings.EXPORT_LETTERBOX のリサイズ関係の項目だけを置き換える）
+# reference は縮小デコードも reduce も使わない最も忠実な方法で、画質（PSNR）の基準にする
+BENCHMARK_MODES = {
+    'reference': {'resample': 'lanczos', 'draft': False, 'reducing_gap': None},
+    'lanczos-draft-reduce': {'resample': 'lanczos', 'draft': True, 'reducing_gap': 2.0},
+    'bicubic-draft-reduce': {'resample': 'bicubic', 'draft': True, 'reducing_gap': 2.0},
+    'bilinear-draft-reduce': {'resample': 'bilinear', 'draft': True, 'reducing_gap': 2.0},
+    'bilinear-draft': {'resample': 'bilinear', 'draft': True, 'reducing_gap': None},
+    'nearest-draft': {'resample': 'nearest', 'draft': True, 'reducing_gap': None},
+}
+
+
+def psnr(path, reference_path):
+    """2枚の画像のPSNR（dB、同一なら inf）"""
+    with Image.open(path) as a, Image.open(reference_path) as b:
+        diff = np.asarray(a.convert('RGB'), dtype=np.float64) - np.asarray(b.convert('RGB'), dtype=np.float64)
+    mse = np.mean(diff ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+class Command(BaseCommand):
+    help = ('Letterbox a sample of base_images with each resize mode and report images per second, '
+            'output size and PSNR against the reference (full decode + Lanczos) mode')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=50, help='Number of images to sample')
+        parser.add_argument('--image-size', type=int, default=640, help='Output image size (square)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes (default: 1, per-core throughput)')
+        parser.add_argument('--mode', dest='modes', action='append', choices=sorted(BENCHMARK_MODES) + ['settings'],
+                            help='Mode to run; repeat for several (default: all modes and the current settings)')
+
+    def handle(self, *args, **options):
+        filenames = list(ImageFile.objects.order_by('id').values_list('filename', flat=True)[:options['images']])
+        sources = [os.path.join(settings.BASE_IMAGES_DIR, filename) for filename in filenames]
+        sources = [path for path in sources if os.path.exists(path)]
+        if not sources:
+            raise CommandError('No images found; load images into base_images first')
+
+        modes = {name: {**settings.EXPORT_LETTERBOX, **overrides} for name, overrides in BENCHMARK_MODES.items()}
+        modes['settings'] = dict(settings.EXPORT_LETTERBOX)
+        selected = options['modes'] or list(modes)
+        # 画質の基準として reference は必ず実行する
+        selected = ['reference'] + [name for name in selected if name != 'reference']
+        target_size = options['image_size']
+
+        megapixels = 0
+        for path in sources:
+            with Image.open(path) as img:
+                megapixels += img.width * img.height / 1e6
+        self.stdout.write(
+            f'{len(sources)} images ({megapixels / len(sources):.1f} MP on average) -> '
+            f'{target_size}x{target_size}, {options["workers"]} worker(s)'
+        )
+
+        tmpdir = tempfile.mkdtemp(prefix='letterbox_benchmark_')
+        try:
+            outputs = {}
+            for name in selected:
+                mode = letterbox_options(**modes[name])
+                mode_dir = os.path.join(tmpdir, name)
+                os.makedirs(mode_dir)
+                entries = [
+                    (i, path, os.path.join(mode_dir, output_filename(f'{i}{os.path.splitext(path)[1]}', mode)))
+                    for i, path in enumerate(sources)
+                ]
+                started = time.perf_counter()
+                # エクスポートと同じ処理で変換する（キャッシュは使わない）
+                transform_images(entries, target_size, mode, options['workers'], use_cache=False)
+                elapsed = time.perf_counter() - started
+                outputs[name] = (mode, [entry[2] for entry in entries], elapsed)
+
+            reference_paths = outputs['reference'][1]
+            self.stdout.write(f'{"mode":<24}{"images/s":>10}{"MP/s":>8}{"avg KB":>9}{"PSNR dB":>9}  settings')
+            for name, (mode, paths, elapsed) in outputs.items():
+                size_kb = sum(os.path.getsize(path) for path in paths) / len(paths) / 1024
+                quality = min(psnr(path, reference) for path, reference in zip(paths, reference_paths))
+                description = (f'resample={mode["resample"]} draft={mode["draft"]} '
+                               f'reducing_gap={mode["reducing_gap"]}')
+                self.stdout.write(
+                    f'{name:<24}{len(paths) / elapsed:>10.1f}{megapixels / elapsed:>8.1f}'
+                    f'{size_kb:>9.1f}{quality:>9.1f}  {description}'
+                )
+            self.stdout.write('PSNR is the worst image against the reference mode (higher is closer, inf = identical)')
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
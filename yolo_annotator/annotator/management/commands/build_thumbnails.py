@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from annotator.models import ImageFile
+from annotator import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Pre-generate cached thumbnails for the image index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', help='Thumbnail sizes (default: THUMBNAIL_SIZES)')
+        parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count)')
+        parser.add_argument('--evict', action='store_true', help='Only apply the cache size limit and exit')
+
+    def handle(self, *args, **options):
+        if options['evict']:
+            removed = thumbnails.evict()
+            self.stdout.write(self.style.SUCCESS(f'Removed {removed} cached thumbnails'))
+            return
+
+        src_paths = [image.file_path for image in ImageFile.objects.only('filename').iterator()]
+
+        def progress(done, total):
+            if done % 100 == 0 or done == total:
+                self.stdout.write(f'{done}/{total} thumbnails generated')
+
+        created = thumbnails.build_thumbnails(
+            src_paths, sizes=options['sizes'], workers=options['workers'], progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(f'Created {created} thumbnails'))
@@ -0,0 +1,109 @@
+from argparse import BooleanOptionalAction
+
+from django.core.management.base import BaseCommand, CommandError
+from annotator.export import DRY_RUN_SAMPLE_SIZE, export_dataset, default_worker_count
+from annotator.export_report import format_bytes
+from annotator.formats import EXPORT_FORMATS
+from annotator.imaging import OUTPUT_FORMATS, PADDING_MODES, RESAMPLE_FILTERS
+
+
+class Command(BaseCommand):
+    help = 'Export annotated images as a YOLO, COCO and/or Pascal VOC dataset using a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--split-ratio', type=float, default=0.8, help='Fraction of images used for train')
+        parser.add_argument('--test-ratio', type=float, default=0.0,
+                            help='Fraction of images used for a test split (valid gets the rest)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Split seed; the same seed and filenames always give the same split')
+        parser.add_argument('--stratify', action='store_true',
+                            help='Balance each split by the rarest label in every image')
+        parser.add_argument('--image-size', type=int, default=640, help='Output image size (square)')
+        parser.add_argument('--workers', type=int, default=default_worker_count(),
+                            help='Number of worker processes (default: CPU count)')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Re-encode every image instead of linking unchanged ones from the export cache')
+        parser.add_argument('--format', dest='formats', action='append', choices=sorted(EXPORT_FORMATS),
+                            help='Label format to write; repeat to write several from one image pass (default: yolo)')
+        # 画像の変換設定（指定しない項目は settings.EXPORT_LETTERBOX）
+        parser.add_argument('--resample', choices=RESAMPLE_FILTERS, help='Resampling filter')
+        parser.add_argument('--padding', choices=PADDING_MODES, help='Where to place the resized image on the square canvas')
+        parser.add_argument('--fill', help='Padding colour, e.g. "#727272"')
+        parser.add_argument('--quality', type=int, help='JPEG/WebP quality (1-100)')
+        parser.add_argument('--draft', action=BooleanOptionalAction, default=None,
+                            help='Decode JPEGs directly at a reduced scale')
+        parser.add_argument('--reducing-gap', type=float,
+                            help='Shrink with integer reduce() down to this multiple of the output size before resampling '
+                                 '(0 disables)')
+        parser.add_argument('--output-format', choices=OUTPUT_FORMATS, help='Image format of the exported images')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Letterbox and write a sample in a temporary directory and estimate the output size '
+                                 'and duration without writing anything to output/ or the cache')
+        parser.add_argument('--sample', type=int, default=DRY_RUN_SAMPLE_SIZE,
+                            help=f'Number of images tried by --dry-run (default: {DRY_RUN_SAMPLE_SIZE})')
+
+    def handle(self, *args, **options):
+        report_every = 100
+        letterbox = {
+            key: options[key] for key in ('resample', 'padding', 'fill', 'quality', 'draft', 'output_format')
+            if options[key] is not None
+        }
+        if options['reducing_gap'] is not None:
+            letterbox['reducing_gap'] = options['reducing_gap'] or None
+
+        def progress(done, total):
+            if done % report_every == 0 or done == total:
+                self.stdout.write(f'{done}/{total} images exported')
+
+        try:
+            result = export_dataset(
+                split_ratio=options['split_ratio'],
+                test_ratio=options['test_ratio'],
+                seed=options['seed'],
+                stratify=options['stratify'],
+                letterbox=letterbox,
+                target_size=options['image_size'],
+                workers=options['workers'],
+                progress=progress,
+                use_cache=not options['no_cache'],
+                formats=options['formats'] or ['yolo'],
+                dry_run=options['dry_run'],
+                sample_size=options['sample'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if result['dry_run']:
+            self.stdout.write(
+                f'Dry run on {result["sample_count"]} images '
+                f'(train: {result["train_count"]}, valid: {result["valid_count"]}, test: {result["test_count"]}); '
+                f'nothing was written'
+            )
+            self.stdout.write(
+                f'{result["estimated_encoded_count"]} images to encode '
+                f'({result["cache_hit_ratio"]:.0%} already in the export cache)'
+            )
+            for name, seconds in result['estimated_stage_seconds'].items():
+                self.stdout.write(f'  {name:<18}{seconds:>10.1f}s')
+            for name, nbytes in result['estimated_output_bytes'].items():
+                self.stdout.write(f'  {name:<18}{format_bytes(nbytes):>11}')
+            self.stdout.write(self.style.SUCCESS(
+                f'Estimated {result["estimated_seconds"]:.1f}s and '
+                f'{format_bytes(sum(result["estimated_output_bytes"].values()))} with {result["workers"]} worker(s)'
+            ))
+            return
+
+        for name, stats in result['report']['stages'].items():
+            self.stdout.write(
+                f'  {name:<18}{stats["seconds"]:>10.1f}s  {stats["queries"]:>4} queries ({stats["query_seconds"]:.1f}s)'
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Exported {", ".join(result["formats"])} dataset '
+                f'(train: {result["train_count"]}, valid: {result["valid_count"]}, test: {result["test_count"]}) '
+                f'to {result["output_dir"]} '
+                f'({result["encoded_count"]} encoded, {result["cached_count"]} reused from cache); '
+                f'timing report: {result["report_filename"]}'
+            )
+        )
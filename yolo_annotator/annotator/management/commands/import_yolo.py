@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from annotator.importer import import_yolo, ON_EXISTING_CHOICES
+
+
+class Command(BaseCommand):
+    help = 'Import a YOLO dataset (images/, labels/ and data.yaml) into base_images and the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Dataset folder containing data.yaml')
+        parser.add_argument('--prefix', help='Folder under base_images to place the images in (default: dataset folder name)')
+        parser.add_argument('--on-existing', choices=ON_EXISTING_CHOICES, default='skip',
+                            help='What to do with images that already have annotations (default: skip)')
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total} images imported')
+
+        try:
+            result = import_yolo(
+                options['path'],
+                prefix=options['prefix'],
+                on_existing=options['on_existing'],
+                progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Imported {result["total_images"]} images into base_images/{result["prefix"]}/ '
+                f'({result.get("images_created", 0)} new, {result.get("images_updated", 0)} updated, '
+                f'{result.get("images_skipped", 0)} skipped, '
+                f'{result.get("annotations_created", 0)} annotations, '
+                f'{result.get("labels_created", 0)} new labels)'
+            )
+        )
+        problems = {
+            'unreadable_images': 'unreadable images',
+            'images_without_labels': 'images without a label file',
+            'invalid_lines': 'invalid label lines',
+            'unknown_class_boxes': 'boxes with a class id missing from names',
+        }
+        for key, description in problems.items():
+            if result.get(key):
+                self.stdout.write(self.style.WARNING(f'{result[key]} {description}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from annotator.models import ImageFile, Label
+
+
+class Command(BaseCommand):
+    help = 'Recount ImageFile.annotation_count and Label.usage_count from the annotations table'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ImageFile.refresh_annotation_counts()
+            Label.refresh_usage_counts()
+        self.stdout.write(self.style.SUCCESS('Annotation counters refreshed'))
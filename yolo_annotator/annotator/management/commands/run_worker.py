@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from annotator.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run the background job worker (image loading, dataset export)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of waiting for new jobs')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Job worker started'))
+        try:
+            run_worker(poll_interval=options['poll_interval'], once=options['once'])
+        except KeyboardInterrupt:
+            self.stdout.write('Job worker stopped')
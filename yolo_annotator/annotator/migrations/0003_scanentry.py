@@ -0,0 +1,22 @@
+# Generated by Django 6.1.2 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotator', '0002_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('mtime', models.FloatField()),
+                ('size', models.BigIntegerField()),
+            ],
+        ),
+    ]
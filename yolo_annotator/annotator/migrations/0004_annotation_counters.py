@@ -0,0 +1,53 @@
+# Generated by Django 6.1.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """既存のアノテーションから集計値を作成"""
+    Annotation = apps.get_model('annotator', 'Annotation')
+    ImageFile = apps.get_model('annotator', 'ImageFile')
+    Label = apps.get_model('annotator', 'Label')
+
+    image_counts = (
+        Annotation.objects.filter(image=OuterRef('pk')).order_by()
+        .values('image').annotate(count=Count('id')).values('count')
+    )
+    ImageFile.objects.update(annotation_count=Coalesce(Subquery(image_counts), 0))
+
+    label_counts = (
+        Annotation.objects.filter(label=OuterRef('pk')).order_by()
+        .values('label').annotate(count=Count('id')).values('count')
+    )
+    Label.objects.update(usage_count=Coalesce(Subquery(label_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotator', '0003_scanentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagefile',
+            name='annotation_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='label',
+            name='usage_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['image', 'label'], name='annotator_a_image_i_91bc3e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagefile',
+            index=models.Index(fields=['is_annotated', 'filename'], name='annotator_i_is_anno_c5410c_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,10 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
 import os
 from PIL import Image
 
@@ -6,10 +12,32 @@ from PIL import Image
 class Label(models.Model):
     name = models.CharField(max_length=100, unique=True)
     color = models.CharField(max_length=7, default='#FF0000')  # Hex color for display
+    usage_count = models.IntegerField(default=0)  # このラベルのアノテーション数（集計の代わりに保持）
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return self.name
+    
+    @classmethod
+    def add_usage(cls, deltas):
+        """ラベルごとの使用回数を増減（deltas: ラベルID -> 増減数）を1クエリで反映"""
+        deltas = {label_id: delta for label_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        cls.objects.filter(id__in=deltas).update(usage_count=F('usage_count') + Case(
+            *[When(id=label_id, then=Value(delta)) for label_id, delta in deltas.items()],
+            default=Value(0)
+        ))
+    
+    @classmethod
+    def refresh_usage_counts(cls, label_ids=None):
+        """使用回数をアノテーションから数え直す（label_ids省略時は全ラベル）"""
+        counts = (
+            Annotation.objects.filter(label=OuterRef('pk')).order_by()
+            .values('label').annotate(count=Count('id')).values('count')
+        )
+        labels = cls.objects.all() if label_ids is None else cls.objects.filter(id__in=label_ids)
+        labels.update(usage_count=Coalesce(Subquery(counts), 0))
 
 
 class ImageFile(models.Model):
@@ -17,12 +45,29 @@ class ImageFile(models.Model):
     width = models.IntegerField()
     height = models.IntegerField()
     is_annotated = models.BooleanField(default=False)
+    annotation_count = models.IntegerField(default=0)  # この画像のアノテーション数（集計の代わりに保持）
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # アノテーション済みでの絞り込み（一覧・データセット分割）とファイル名順の並び替え
+            models.Index(fields=['is_annotated', 'filename']),
+        ]
+    
     def __str__(self):
         return self.filename
     
+    @classmethod
+    def refresh_annotation_counts(cls, image_ids=None):
+        """アノテーション数をアノテーションから数え直す（image_ids省略時は全画像）"""
+        counts = (
+            Annotation.objects.filter(image=OuterRef('pk')).order_by()
+            .values('image').annotate(count=Count('id')).values('count')
+        )
+        images = cls.objects.all() if image_ids is None else cls.objects.filter(id__in=image_ids)
+        images.update(annotation_count=Coalesce(Subquery(counts), 0))
+    
     @property
     def file_path(self):
         from django.conf import settings
@@ -36,6 +81,16 @@ class ImageFile(models.Model):
             return (0, 0)
 
 
+class ScanEntry(models.Model):
+    """base_imagesフォルダのスキャン結果（変更のないファイルを再処理しないための索引）"""
+    path = models.CharField(max_length=255, unique=True)  # base_imagesからの相対パス
+    mtime = models.FloatField()
+    size = models.BigIntegerField()
+
+    def __str__(self):
+        return self.path
+
+
 class Annotation(models.Model):
     image = models.ForeignKey(ImageFile, on_delete=models.CASCADE, related_name='annotations')
     label = models.ForeignKey(Label, on_delete=models.CASCADE)
@@ -46,9 +101,110 @@ class Annotation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # ラベルでの絞り込み（画像ごとに指定ラベルのアノテーションがあるか）
+            models.Index(fields=['image', 'label']),
+        ]
+    
     def __str__(self):
         return f"{self.image.filename} - {self.label.name}"
     
+    # 1件ずつの保存・削除（管理画面など）でも集計値を更新する
+    # bulk_create などの一括処理では呼び出し側で ImageFile.annotation_count と Label.add_usage を更新すること
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = Annotation.objects.filter(pk=self.pk).values('image_id', 'label_id').first()
+            super().save(*args, **kwargs)
+            
+            image_deltas = Counter({self.image_id: 1})
+            label_deltas = Counter({self.label_id: 1})
+            if previous is not None:
+                image_deltas[previous['image_id']] -= 1
+                label_deltas[previous['label_id']] -= 1
+            for image_id, delta in image_deltas.items():
+                if delta:
+                    ImageFile.objects.filter(id=image_id).update(annotation_count=F('annotation_count') + delta)
+            Label.add_usage(label_deltas)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            ImageFile.objects.filter(id=self.image_id).update(annotation_count=F('annotation_count') - 1)
+            Label.add_usage({self.label_id: -1})
+        return result
+    
     def to_yolo_format(self):
         """Convert to YOLO format string"""
         return f"{self.label.id} {self.x_center} {self.y_center} {self.width} {self.height}"
+
+
+class Job(models.Model):
+    """バックグラウンドで実行する長時間処理（画像読み込み・データセット分割など）"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCESS = 'success'
+    STATUS_ERROR = 'error'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '待機中'),
+        (STATUS_RUNNING, '実行中'),
+        (STATUS_SUCCESS, '完了'),
+        (STATUS_ERROR, 'エラー'),
+    ]
+
+    kind = models.CharField(max_length=50)  # 実行する処理の種類（jobs.JOB_HANDLERSのキー）
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    progress_done = models.IntegerField(default=0)
+    progress_total = models.IntegerField(default=0)
+    message = models.TextField(blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # 実行中のワーカーが定期的に更新（途絶えたら再実行）
+    attempts = models.IntegerField(default=0)  # 実行を開始した回数
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCESS, self.STATUS_ERROR)
+
+    def to_dict(self):
+        """進捗ポーリング用のJSON表現"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress_done': self.progress_done,
+            'progress_total': self.progress_total,
+            'message': self.message,
+            'result': self.result,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+@receiver(pre_delete, sender=ImageFile)
+def _release_label_usage(sender, instance, **kwargs):
+    """画像の削除で一緒に消えるアノテーションの分だけラベルの使用回数を減らす"""
+    counts = instance.annotations.values('label_id').annotate(count=Count('id')).order_by()
+    Label.add_usage({row['label_id']: -row['count'] for row in counts})
+
+
+@receiver(pre_delete, sender=Label)
+def _release_image_annotation_count(sender, instance, **kwargs):
+    """ラベルの削除で一緒に消えるアノテーションの分だけ画像のアノテーション数を減らす"""
+    counts = Annotation.objects.filter(label=instance).values('image_id').annotate(count=Count('id')).order_by()
+    for row in counts:
+        ImageFile.objects.filter(id=row['image_id']).update(annotation_count=F('annotation_count') - row['count'])
@@ -0,0 +1,113 @@
+"""
+データセットの分割（train / valid / test）
+画像ごとにシードとファイル名のハッシュから [0, 1) の値を求め、その値で分割先を決めます。
+同じシードなら何度エクスポートしても同じ分割になり、画像を追加しても既存の画像の分割先は変わりません。
+
+層化（stratify）する場合は、画像に含まれるラベルのうちデータセット全体で最も少ないラベルで画像をグループ分けし、
+グループごとにハッシュ値の順で比率どおりに割り当てます。まれなラベルも各分割に最低1枚入りますが、
+画像を追加するとグループ内の境界付近の画像は分割先が変わることがあります。
+"""
+import hashlib
+import math
+
+import numpy as np
+
+from .models import Annotation
+
+SPLIT_NAMES = ('train', 'valid', 'test')
+
+# 層化のグループ：ボックスのない画像
+NO_LABEL = -1
+
+
+def split_ratios(split_ratio, test_ratio=0.0):
+    """train の比率と test の比率から (train, valid, test) の比率を求める"""
+    valid_ratio = 1 - split_ratio - test_ratio
+    if split_ratio <= 0 or test_ratio < 0 or valid_ratio < -1e-9:
+        raise ValueError(f'分割比率が正しくありません (train: {split_ratio}, test: {test_ratio})')
+    return split_ratio, max(0.0, valid_ratio), test_ratio
+
+
+def hash_fraction(filename, seed=0):
+    """シードとファイル名から [0, 1) の値を求める（プロセスやPythonのバージョンによらず同じ値）"""
+    digest = hashlib.blake2b(f'{seed}:{filename}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+def fetch_strata(image_ids):
+    """画像ごとの層化のグループ（含まれるラベルのうち、そのラベルを含む画像が最も少ないラベルのID）を返す
+
+    画像とラベルの組を1回の集計クエリで取得し、配列演算で求めます。ボックスのない画像は含みません。
+    export.fetch_boxes と同じく、IDを並べた IN 句ではなくアノテーション済みの画像の結合で絞り込みます。
+    """
+    rows = (
+        Annotation.objects
+        .filter(image__is_annotated=True)
+        .order_by()
+        .values_list('image_id', 'label_id')
+        .distinct()
+    )
+    pairs = np.fromiter(rows.iterator(chunk_size=2000), dtype=np.dtype([('image_id', np.int64), ('label_id', np.int64)]))
+    pairs = pairs[np.isin(pairs['image_id'], np.asarray(image_ids, dtype=np.int64))]
+    if not len(pairs):
+        return {}
+
+    # ラベルごとの画像数（少ないほどまれなラベル）
+    _, label_index, image_counts = np.unique(pairs['label_id'], return_inverse=True, return_counts=True)
+    rarity = image_counts[label_index]
+    # 画像ID順・まれな順に並べ、各画像の先頭の組を取る（同数の場合はラベルIDの小さい方）
+    order = np.lexsort((pairs['label_id'], rarity, pairs['image_id']))
+    image_ids_sorted = pairs['image_id'][order]
+    first = np.flatnonzero(np.r_[True, image_ids_sorted[1:] != image_ids_sorted[:-1]])
+    return dict(zip(image_ids_sorted[first].tolist(), pairs['label_id'][order][first].tolist()))
+
+
+def _quotas(count, ratios):
+    """グループ内の枚数を比率に応じて各分割に割り当てる（比率が0でない分割には、枚数が足りる限り最低1枚）"""
+    exact = [count * ratio for ratio in ratios]
+    quotas = [math.floor(value) for value in exact]
+    # 端数は小数部分の大きい分割から順に配る
+    for index in sorted(range(len(ratios)), key=lambda i: exact[i] - quotas[i], reverse=True)[:count - sum(quotas)]:
+        quotas[index] += 1
+    active = [index for index, ratio in enumerate(ratios) if ratio > 0]
+    if count >= len(active):
+        for index in active:
+            if quotas[index] == 0:
+                quotas[max(active, key=lambda i: quotas[i])] -= 1
+                quotas[index] = 1
+    return quotas
+
+
+def assign_splits(images, ratios, seed=0, strata=None):
+    """画像 (画像ID, ファイル名) を分割し、[(分割名, 画像のリスト), ...] を返す
+
+    ratios は (train, valid, test) の比率です。strata（画像ID → グループ）を指定した場合はグループごとに比率どおりに分けます。
+    test の比率が0の場合、test は戻り値に含めません。
+    """
+    splits = {name: [] for name in SPLIT_NAMES}
+    if strata is None:
+        train_limit = ratios[0]
+        valid_limit = ratios[0] + ratios[1]
+        for image in images:
+            value = hash_fraction(image[1], seed)
+            name = 'train' if value < train_limit else 'valid' if value < valid_limit or not ratios[2] else 'test'
+            splits[name].append(image)
+    else:
+        groups = {}
+        for image in images:
+            groups.setdefault(strata.get(image[0], NO_LABEL), []).append((hash_fraction(image[1], seed), image))
+        for group in groups.values():
+            group.sort(key=lambda item: item[0])
+            start = 0
+            for name, quota in zip(SPLIT_NAMES, _quotas(len(group), ratios)):
+                splits[name].extend(image for _, image in group[start:start + quota])
+                start += quota
+
+    return [(name, splits[name]) for name, ratio in zip(SPLIT_NAMES, ratios) if name != 'test' or ratio > 0]
+
+
+def split_images(images_list, split_ratio, test_ratio=0.0, seed=0, stratify=False):
+    """画像 (画像ID, ファイル名) を train / valid（/ test）に分割する"""
+    ratios = split_ratios(split_ratio, test_ratio)
+    strata = fetch_strata([image_id for image_id, _ in images_list]) if stratify else None
+    return assign_splits(images_list, ratios, seed, strata)
@@ -1,4 +1,111 @@
 // アノテーション機能のJavaScript
+
+// ラベル名の背景（矩形の上に描画）の高さと、線の太さによるはみ出し
+const LABEL_TAG_HEIGHT = 18;
+const BOX_LINE_PADDING = 2;
+
+// 拡大表示の上限（画面の1ピクセルあたりの元画像のピクセル数の逆数）
+const MAX_VIEW_SCALE = 8;
+// タイル表示で保持するデコード済みタイルの枚数
+const TILE_CACHE_SIZE = 256;
+
+// 空間インデックスの1辺あたりのセル数（正規化座標の0〜1を等分）
+const SPATIAL_GRID_SIZE = 64;
+
+// アノテーションを正規化座標の一様グリッドに登録し、点や矩形と重なるものを
+// 全件を走査せずに求める（登録・削除はそのアノテーションのセルだけを更新）
+class SpatialGrid {
+    constructor(gridSize = SPATIAL_GRID_SIZE) {
+        this.gridSize = gridSize;
+        this.cells = new Map();   // セル番号 -> アノテーションのSet
+        this.entries = new Map(); // アノテーション -> { cells: 登録したセル番号, order: 描画順 }
+        this.nextOrder = 0;
+    }
+    
+    cellIndex(value) {
+        return Math.min(this.gridSize - 1, Math.max(0, Math.floor(value * this.gridSize)));
+    }
+    
+    // 正規化座標の矩形が重なるセル番号の一覧
+    cellsForRect(rect) {
+        const x0 = this.cellIndex(rect.x);
+        const x1 = this.cellIndex(rect.x + rect.w);
+        const y0 = this.cellIndex(rect.y);
+        const y1 = this.cellIndex(rect.y + rect.h);
+        const cells = [];
+        for (let cy = y0; cy <= y1; cy++) {
+            for (let cx = x0; cx <= x1; cx++) {
+                cells.push(cy * this.gridSize + cx);
+            }
+        }
+        return cells;
+    }
+    
+    insert(annotation) {
+        if (this.entries.has(annotation)) {
+            this.remove(annotation);
+        }
+        const cells = this.cellsForRect(normalizedRect(annotation));
+        cells.forEach(cell => {
+            let items = this.cells.get(cell);
+            if (!items) {
+                items = new Set();
+                this.cells.set(cell, items);
+            }
+            items.add(annotation);
+        });
+        this.entries.set(annotation, { cells: cells, order: this.nextOrder++ });
+    }
+    
+    remove(annotation) {
+        const entry = this.entries.get(annotation);
+        if (!entry) return;
+        entry.cells.forEach(cell => {
+            const items = this.cells.get(cell);
+            items.delete(annotation);
+            if (items.size === 0) {
+                this.cells.delete(cell);
+            }
+        });
+        this.entries.delete(annotation);
+    }
+    
+    // 一覧で置き換える（配列の順番を描画順とする）
+    rebuild(annotations) {
+        this.cells = new Map();
+        this.entries = new Map();
+        this.nextOrder = 0;
+        annotations.forEach(ann => this.insert(ann));
+    }
+    
+    // 正規化座標の矩形と重なるアノテーション（描画順）
+    queryRect(rect) {
+        const found = new Set();
+        this.cellsForRect(rect).forEach(cell => {
+            const items = this.cells.get(cell);
+            if (!items) return;
+            items.forEach(ann => {
+                if (!found.has(ann) && rectsIntersect(normalizedRect(ann), rect)) {
+                    found.add(ann);
+                }
+            });
+        });
+        return Array.from(found).sort((a, b) => this.entries.get(a).order - this.entries.get(b).order);
+    }
+    
+    // 正規化座標の点を含むアノテーション（描画順）
+    queryPoint(x, y) {
+        return this.queryRect({ x: x, y: y, w: 0, h: 0 });
+    }
+}
+
+// 画像・アノテーション・操作中の表示を別々のキャンバスに描画する
+//   背景レイヤー: 表示サイズに縮小した画像（画像の読み込み時・リサイズ時・拡大/移動時のみ描画）
+//                 巨大画像は表示範囲のタイルだけを読み込んで描画する
+//   オーバーレイ: アノテーションの矩形（変更があった範囲のみ描き直す）
+//   最上位レイヤー: 描画中の矩形とホバー中のアノテーション（マウス操作のイベントもここで受け取る）
+// 再描画は requestAnimationFrame で1フレームに1回にまとめる
+// 座標は常に正規化座標（YOLO形式）で保持し、拡大率と表示位置はキャンバス座標への変換だけに使う
 class AnnotationCanvas {
     constructor(canvasId) {
         console.log('AnnotationCanvas constructor called with:', canvasId);
@@ -12,68 +119,182 @@ class AnnotationCanvas {
         
         console.log('Canvas element found:', this.canvas);
         this.ctx = this.canvas.getContext('2d');
-        console.log('Canvas context:', this.ctx);
+        this.backgroundCanvas = this.createLayer('background');
+        this.backgroundCtx = this.backgroundCanvas.getContext('2d', { alpha: false });
+        this.overlayCanvas = this.createLayer('overlay');
+        this.overlayCtx = this.overlayCanvas.getContext('2d');
         
         this.image = new Image();
+        this.imageWidth = 0;  // 表示中の画像の原寸（読み込みが終わるまでは0）
+        this.imageHeight = 0;
+        this.tiles = null;    // タイル表示の情報（巨大画像のみ）
+        this.tileCache = new LruCache(TILE_CACHE_SIZE); // "レベル/列/行" -> デコード済みのタイル
+        this.pendingTiles = new Map();                 // 読み込み中のタイル
         this.annotations = [];
+        this.index = new SpatialGrid(); // 当たり判定・範囲検索用の空間インデックス
+        this.selectedAnnotations = new Set(); // 選択中のアノテーション
         this.currentAnnotation = null;
         this.selectedLabelId = null;
         this.selectedLabelName = null;
         this.selectedLabelColor = '#FF0000';
         this.isDrawing = false;
+        this.isSelecting = false; // Shift+ドラッグによる範囲選択中
+        this.suppressClick = false; // 範囲選択の直後のクリックを無視する
         this.startX = 0;
         this.startY = 0;
-        this.scale = 1;
-        this.offsetX = 0;
+        this.currentBox = null; // 描画中の矩形・範囲選択の矩形（キャンバス座標）
+        this.scale = 1;   // 画像全体をキャンバスに収めるときの縮小率
+        this.zoom = 1;    // 全体表示からの拡大率
+        this.offsetX = 0; // 画像の左上のキャンバス座標
         this.offsetY = 0;
-        this.hoveredAnnotationId = null; // ホバー中のアノテーションID
+        this.isPanning = false; // 中ボタンまたはSpace+ドラッグによる表示位置の移動中
+        this.panStart = null;
+        this.spaceHeld = false;
+        this.hoveredAnnotation = null; // ホバー中のアノテーション
+        this.savedAnnotations = new Map(); // サーバーに保存済みのアノテーション（ID -> 内容）
+        this.onChange = null; // アノテーションが編集されたときのコールバック（自動保存用）
+        
+        // 再描画の予約状態
+        this.frameRequested = false;
+        this.backgroundDirty = false;
+        this.overlayFullRedraw = false;
+        this.overlayDirtyRect = null; // オーバーレイで描き直す範囲（nullなら不要）
+        this.topLayerDirty = false;
+        this.topLayerDrawnRect = null; // 最上位レイヤーに前回描画した範囲
+        this.textWidths = new Map(); // ラベル名の描画幅のキャッシュ
         
         this.initEventListeners();
     }
     
+    // 表示用キャンバスの背面に重ねるキャンバスを作成
+    createLayer(name) {
+        const layer = document.createElement('canvas');
+        layer.className = `canvas-layer canvas-layer-${name}`;
+        this.canvas.parentElement.insertBefore(layer, this.canvas);
+        return layer;
+    }
+    
     initEventListeners() {
         this.canvas.addEventListener('mousedown', this.onMouseDown.bind(this));
         this.canvas.addEventListener('mousemove', this.onMouseMove.bind(this));
         this.canvas.addEventListener('mouseup', this.onMouseUp.bind(this));
         this.canvas.addEventListener('click', this.onCanvasClick.bind(this));
+        this.canvas.addEventListener('mouseleave', () => {
+            if (!this.isDrawing && !this.isSelecting) this.clearHoverAnnotation();
+        });
+        // ホイールでマウス位置を中心に拡大・縮小
+        this.canvas.addEventListener('wheel', e => {
+            if (!this.isImageReady()) return;
+            e.preventDefault();
+            const pos = this.getMousePosition(e);
+            this.zoomAt(pos.x, pos.y, Math.exp(-e.deltaY * 0.0015));
+        }, { passive: false });
+        // Spaceを押している間はドラッグで表示位置を移動
+        window.addEventListener('keydown', e => {
+            if (e.code !== 'Space' || isTextInput(document.activeElement)) return;
+            // キャンバス上ではページのスクロールを止める
+            if (this.canvas.matches(':hover')) e.preventDefault();
+            this.spaceHeld = true;
+            this.canvas.style.cursor = 'grab';
+        });
+        window.addEventListener('keyup', e => {
+            if (e.code !== 'Space') return;
+            this.spaceHeld = false;
+            this.canvas.style.cursor = 'crosshair';
+        });
     }
     
-    loadImage(imageUrl) {
+    // すべてのレイヤーのサイズと表示位置を揃える
+    setCanvasSize(width, height) {
+        [this.canvas, this.backgroundCanvas, this.overlayCanvas].forEach(layer => {
+            layer.width = width;
+            layer.height = height;
+        });
+        this.canvas.style.width = width + 'px';
+        this.canvas.style.height = height + 'px';
+        
+        // CSSの max-width などで縮んだ場合も表示用キャンバスの内側にぴったり重ねる
+        [this.backgroundCanvas, this.overlayCanvas].forEach(layer => {
+            layer.style.left = (this.canvas.offsetLeft + this.canvas.clientLeft) + 'px';
+            layer.style.top = (this.canvas.offsetTop + this.canvas.clientTop) + 'px';
+            layer.style.width = this.canvas.clientWidth + 'px';
+            layer.style.height = this.canvas.clientHeight + 'px';
+        });
+        this.topLayerDrawnRect = null;
+    }
+    
+    // 背景レイヤーにメッセージを表示（読み込み中・エラー）
+    drawMessage(background, color, lines) {
+        const ctx = this.backgroundCtx;
+        ctx.fillStyle = background;
+        ctx.fillRect(0, 0, this.backgroundCanvas.width, this.backgroundCanvas.height);
+        ctx.fillStyle = color;
+        ctx.font = '16px Arial';
+        ctx.textAlign = 'center';
+        lines.forEach((line, index) => {
+            ctx.fillText(line, this.backgroundCanvas.width / 2, this.backgroundCanvas.height / 2 + (index - (lines.length - 1) / 2) * 30);
+        });
+        ctx.textAlign = 'left';
+        this.overlayCtx.clearRect(0, 0, this.overlayCanvas.width, this.overlayCanvas.height);
+        this.ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+    }
+    
+    // 画像を切り替える前に表示状態を初期化
+    resetImage() {
+        this.imageWidth = 0;
+        this.imageHeight = 0;
+        this.tiles = null;
+        this.pendingTiles.forEach(tile => {
+            tile.src = '';
+        });
+        this.pendingTiles = new Map();
+        this.tileCache = new LruCache(TILE_CACHE_SIZE);
+        this.zoom = 1;
+        this.offsetX = 0;
+        this.offsetY = 0;
+    }
+    
+    loadImage(imageUrl, prefetchedImage) {
         console.log('画像を読み込み中:', imageUrl);
+        this.resetImage();
         
-        // 画像読み込み前にCanvasを初期化
-        this.canvas.width = 800;
-        this.canvas.height = 600;
-        this.ctx.fillStyle = '#f8f9fa';
-        this.ctx.fillRect(0, 0, this.canvas.width, this.canvas.height);
-        
-        // ローディング表示
-        this.ctx.fillStyle = '#6c757d';
-        this.ctx.font = '18px Arial';
-        this.ctx.textAlign = 'center';
-        this.ctx.fillText('画像を読み込み中...', this.canvas.width / 2, this.canvas.height / 2);
-        this.ctx.textAlign = 'left';
-        
-        this.image.onload = () => {
-            console.log('画像読み込み成功');
-            console.log('画像の自然サイズ:', this.image.naturalWidth, 'x', this.image.naturalHeight);
+        // 先読み済みでデコードも終わっている画像はそのまま使う
+        if (prefetchedImage && prefetchedImage.complete && prefetchedImage.naturalWidth > 0) {
+            this.image = prefetchedImage;
+            this.imageWidth = prefetchedImage.naturalWidth;
+            this.imageHeight = prefetchedImage.naturalHeight;
             this.resizeCanvas();
             this.redraw();
-        };
+            return Promise.resolve();
+        }
+        const image = new Image();
+        this.image = image;
+        
+        // 画像読み込み前にCanvasを初期化し、ローディング表示
+        this.setCanvasSize(800, 600);
+        this.drawMessage('#f8f9fa', '#6c757d', ['画像を読み込み中...']);
+        
+        const loaded = new Promise(resolve => {
+            this.image.onload = () => {
+                // 読み込み中に別の画像へ切り替わった場合は何もしない
+                if (this.image !== image) return;
+                console.log('画像読み込み成功');
+                console.log('画像の自然サイズ:', this.image.naturalWidth, 'x', this.image.naturalHeight);
+                this.imageWidth = this.image.naturalWidth;
+                this.imageHeight = this.image.naturalHeight;
+                this.resizeCanvas();
+                this.redraw();
+                resolve();
+            };
+        });
         
         this.image.onerror = (e) => {
+            if (this.image !== image) return;
             console.error('画像読み込み失敗:', e);
             console.error('URL:', imageUrl);
             
             // エラー表示
-            this.ctx.fillStyle = '#f8d7da';
-            this.ctx.fillRect(0, 0, this.canvas.width, this.canvas.height);
-            this.ctx.fillStyle = '#721c24';
-            this.ctx.font = '16px Arial';
-            this.ctx.textAlign = 'center';
-            this.ctx.fillText('画像の読み込みに失敗しました', this.canvas.width / 2, this.canvas.height / 2 - 20);
-            this.ctx.fillText('URL: ' + imageUrl, this.canvas.width / 2, this.canvas.height / 2 + 10);
-            this.ctx.textAlign = 'left';
+            this.drawMessage('#f8d7da', '#721c24', ['画像の読み込みに失敗しました', 'URL: ' + imageUrl]);
             
             // アラートも表示
             setTimeout(() => {
@@ -81,85 +302,209 @@ class AnnotationCanvas {
             }, 100);
         };
         
-        // 画像読み込み開始
+        // 画像読み込み開始（更新の有無はETagで判定されるためキャッシュを利用する）
         this.image.crossOrigin = 'anonymous';
-        const cacheBuster = '?t=' + Date.now();
-        this.image.src = imageUrl + cacheBuster;
+        this.image.src = imageUrl;
         
         console.log('画像読み込み開始:', this.image.src);
+        return loaded;
+    }
+    
+    // 巨大画像をタイルで表示する（元画像は読み込まない）
+    // 最も粗いレベルのタイルが表示できたら解決するPromiseを返す
+    loadTiledImage(imageData) {
+        this.resetImage();
+        this.image = null;
+        this.tiles = imageData.tiles;
+        this.imageWidth = imageData.width;
+        this.imageHeight = imageData.height;
+        this.resizeCanvas();
+        this.redraw();
+        return new Promise(resolve => {
+            this.requestTile(this.tiles.levels - 1, 0, 0, resolve);
+        });
+    }
+    
+    isImageReady() {
+        return this.imageWidth > 0 && this.imageHeight > 0;
+    }
+    
+    // キャンバスの1ピクセルあたりの元画像のピクセル数の逆数
+    getViewScale() {
+        return this.scale * this.zoom;
     }
     
     resizeCanvas() {
-        console.log('resizeCanvas called');
-        
-        if (!this.image || !this.image.naturalWidth || !this.image.naturalHeight) {
+        if (!this.isImageReady()) {
             console.error('Invalid image for resizing');
             return;
         }
-        
-        console.log('Image natural dimensions:', this.image.naturalWidth, 'x', this.image.naturalHeight);
+        const previousScale = this.scale;
         
         // コンテナサイズを取得
         const container = this.canvas.parentElement;
         const containerWidth = container.clientWidth - 40; // パディングを考慮
         const maxHeight = Math.min(window.innerHeight * 0.7, 600); // 最大高さを制限
         
-        console.log('Container constraints:', containerWidth, 'x', maxHeight);
-        
         // 画像のアスペクト比を維持してキャンバスサイズを計算
-        const imageAspectRatio = this.image.naturalWidth / this.image.naturalHeight;
+        const imageAspectRatio = this.imageWidth / this.imageHeight;
         const containerAspectRatio = containerWidth / maxHeight;
         
+        let width;
+        let height;
         if (imageAspectRatio > containerAspectRatio) {
             // 幅が制限要因
-            this.canvas.width = containerWidth;
-            this.canvas.height = containerWidth / imageAspectRatio;
+            width = containerWidth;
+            height = containerWidth / imageAspectRatio;
         } else {
             // 高さが制限要因
-            this.canvas.height = maxHeight;
-            this.canvas.width = maxHeight * imageAspectRatio;
+            height = maxHeight;
+            width = maxHeight * imageAspectRatio;
         }
+        this.setCanvasSize(width, height);
         
-        // スケール係数を計算
-        this.scale = this.canvas.width / this.image.naturalWidth;
-        
-        console.log('Canvas resized to:', this.canvas.width, 'x', this.canvas.height);
-        console.log('Scale factor:', this.scale);
-        
-        // CSSでキャンバスサイズを明示的に設定
-        this.canvas.style.width = this.canvas.width + 'px';
-        this.canvas.style.height = this.canvas.height + 'px';
+        // スケール係数を計算（拡大中の表示位置は同じ比率で移動）
+        this.scale = this.canvas.width / this.imageWidth;
+        this.offsetX *= this.scale / previousScale;
+        this.offsetY *= this.scale / previousScale;
+        this.clampView();
+        this.invalidateView();
+        console.log('Canvas resized to:', this.canvas.width, 'x', this.canvas.height, 'scale:', this.scale);
+    }
+    
+    // ===== 拡大・移動 =====
+    
+    // 画像がキャンバスからはみ出さないよう表示位置を調整
+    clampView() {
+        const viewScale = this.getViewScale();
+        const width = this.imageWidth * viewScale;
+        const height = this.imageHeight * viewScale;
+        this.offsetX = width <= this.canvas.width
+            ? (this.canvas.width - width) / 2
+            : Math.min(0, Math.max(this.canvas.width - width, this.offsetX));
+        this.offsetY = height <= this.canvas.height
+            ? (this.canvas.height - height) / 2
+            : Math.min(0, Math.max(this.canvas.height - height, this.offsetY));
+    }
+    
+    // キャンバス座標 (x, y) の位置を固定して拡大率を factor 倍にする
+    zoomAt(x, y, factor) {
+        const viewScale = this.getViewScale();
+        const imageX = (x - this.offsetX) / viewScale;
+        const imageY = (y - this.offsetY) / viewScale;
+        const maxZoom = Math.max(1, MAX_VIEW_SCALE / this.scale);
+        this.zoom = Math.min(maxZoom, Math.max(1, this.zoom * factor));
+        this.offsetX = x - imageX * this.getViewScale();
+        this.offsetY = y - imageY * this.getViewScale();
+        this.clampView();
+        this.invalidateView();
+    }
+    
+    // 全体表示に戻す
+    resetView() {
+        this.zoom = 1;
+        this.clampView();
+        this.invalidateView();
+    }
+    
+    // 拡大率・表示位置が変わったので全レイヤーを描き直す
+    invalidateView() {
+        this.backgroundDirty = true;
+        this.topLayerDrawnRect = null;
+        this.redraw();
+    }
+    
+    getMousePosition(e) {
+        const rect = this.canvas.getBoundingClientRect();
+        // CSSで縮小表示されている場合もキャンバス座標に合わせる
+        return {
+            x: (e.clientX - rect.left - this.canvas.clientLeft) * this.canvas.width / this.canvas.clientWidth,
+            y: (e.clientY - rect.top - this.canvas.clientTop) * this.canvas.height / this.canvas.clientHeight
+        };
     }
     
     onMouseDown(e) {
+        const pos = this.getMousePosition(e);
+        this.suppressClick = false;
+        
+        // 中ボタンまたはSpace+ドラッグで表示位置を移動
+        if (e.button === 1 || this.spaceHeld) {
+            e.preventDefault();
+            this.isPanning = true;
+            this.panStart = { x: pos.x, y: pos.y, offsetX: this.offsetX, offsetY: this.offsetY };
+            this.canvas.style.cursor = 'grabbing';
+            return;
+        }
+        
+        // Shift+ドラッグは範囲選択
+        if (e.shiftKey) {
+            this.startX = pos.x;
+            this.startY = pos.y;
+            this.isSelecting = true;
+            return;
+        }
+        
         if (!this.selectedLabelId) {
             alert('ラベルを選択してください');
             return;
         }
         
-        const rect = this.canvas.getBoundingClientRect();
-        this.startX = e.clientX - rect.left;
-        this.startY = e.clientY - rect.top;
+        this.startX = pos.x;
+        this.startY = pos.y;
         this.isDrawing = true;
     }
     
     onMouseMove(e) {
-        if (!this.isDrawing) return;
-        
-        const rect = this.canvas.getBoundingClientRect();
-        const currentX = e.clientX - rect.left;
-        const currentY = e.clientY - rect.top;
+        const pos = this.getMousePosition(e);
+        if (this.isPanning) {
+            this.offsetX = this.panStart.offsetX + pos.x - this.panStart.x;
+            this.offsetY = this.panStart.offsetY + pos.y - this.panStart.y;
+            this.clampView();
+            this.invalidateView();
+            return;
+        }
+        if (!this.isDrawing && !this.isSelecting) {
+            // マウス位置の最も手前のアノテーションをハイライト
+            const hit = this.getAnnotationAt(pos.x, pos.y);
+            if (hit !== this.hoveredAnnotation) {
+                this.hoverAnnotation(hit);
+            }
+            return;
+        }
         
-        this.redraw();
-        this.drawCurrentBox(this.startX, this.startY, currentX, currentY);
+        this.currentBox = {
+            x: Math.min(this.startX, pos.x),
+            y: Math.min(this.startY, pos.y),
+            w: Math.abs(pos.x - this.startX),
+            h: Math.abs(pos.y - this.startY)
+        };
+        this.invalidateTopLayer();
     }
     
     onMouseUp(e) {
+        if (this.isPanning) {
+            this.isPanning = false;
+            this.suppressClick = true;
+            this.canvas.style.cursor = this.spaceHeld ? 'grab' : 'crosshair';
+            return;
+        }
+        if (this.isSelecting) {
+            this.isSelecting = false;
+            if (this.currentBox) {
+                // 範囲選択の矩形と重なるアノテーションを選択（Ctrl/Cmdを押している場合は追加）
+                const found = this.getAnnotationsInCanvasRect(this.currentBox);
+                const selected = (e.ctrlKey || e.metaKey) ? Array.from(this.selectedAnnotations).concat(found) : found;
+                this.currentBox = null;
+                this.selectAnnotations(selected);
+                this.suppressClick = true;
+            }
+            return;
+        }
         if (!this.isDrawing) return;
         
-        const rect = this.canvas.getBoundingClientRect();
-        const endX = e.clientX - rect.left;
-        const endY = e.clientY - rect.top;
+        const pos = this.getMousePosition(e);
+        const endX = pos.x;
+        const endY = pos.y;
         
         const minX = Math.min(this.startX, endX);
         const minY = Math.min(this.startY, endY);
@@ -171,16 +516,17 @@ class AnnotationCanvas {
         
         if (width > 10 && height > 10) {
             // Canvas座標を画像座標に変換してYOLO形式に変換
-            const imageX = minX / this.scale;
-            const imageY = minY / this.scale;
-            const imageWidth = width / this.scale;
-            const imageHeight = height / this.scale;
+            const viewScale = this.getViewScale();
+            const imageX = (minX - this.offsetX) / viewScale;
+            const imageY = (minY - this.offsetY) / viewScale;
+            const imageWidth = width / viewScale;
+            const imageHeight = height / viewScale;
             
             // YOLO形式（正規化された中心座標と幅・高さ）
-            const x_center = (imageX + imageWidth / 2) / this.image.naturalWidth;
-            const y_center = (imageY + imageHeight / 2) / this.image.naturalHeight;
-            const norm_width = imageWidth / this.image.naturalWidth;
-            const norm_height = imageHeight / this.image.naturalHeight;
+            const x_center = (imageX + imageWidth / 2) / this.imageWidth;
+            const y_center = (imageY + imageHeight / 2) / this.imageHeight;
+            const norm_width = imageWidth / this.imageWidth;
+            const norm_height = imageHeight / this.imageHeight;
             
             const annotation = {
                 id: Date.now(), // 一時的なID
@@ -194,128 +540,372 @@ class AnnotationCanvas {
             };
             
             this.annotations.push(annotation);
+            this.index.insert(annotation);
+            this.invalidateOverlay(this.getAnnotationBounds(annotation));
             this.updateAnnotationsList();
+            this.notifyChange();
         }
         
         this.isDrawing = false;
-        this.redraw();
+        this.currentBox = null;
+        this.invalidateTopLayer();
     }
     
     onCanvasClick(e) {
         if (this.isDrawing) return;
+        // 範囲選択の直後のクリックは無視
+        if (this.suppressClick) {
+            this.suppressClick = false;
+            return;
+        }
         
-        const rect = this.canvas.getBoundingClientRect();
-        const clickX = e.clientX - rect.left;
-        const clickY = e.clientY - rect.top;
-        
-        // クリックされた座標にあるアノテーションを検索
-        for (let i = this.annotations.length - 1; i >= 0; i--) {
-            const ann = this.annotations[i];
-            const x = (ann.x_center - ann.width / 2) * this.image.naturalWidth * this.scale;
-            const y = (ann.y_center - ann.height / 2) * this.image.naturalHeight * this.scale;
-            const w = ann.width * this.image.naturalWidth * this.scale;
-            const h = ann.height * this.image.naturalHeight * this.scale;
-            
-            if (clickX >= x && clickX <= x + w && clickY >= y && clickY <= y + h) {
-                this.highlightAnnotation(ann.id);
-                break;
-            }
+        // クリックされた座標の最も手前のアノテーションを選択
+        const pos = this.getMousePosition(e);
+        const hit = this.getAnnotationAt(pos.x, pos.y);
+        if (hit) {
+            this.highlightAnnotation(hit.id);
+        } else if (!e.shiftKey) {
+            this.selectAnnotations([]);
         }
     }
     
-    drawCurrentBox(x1, y1, x2, y2) {
-        this.ctx.strokeStyle = this.selectedLabelColor;
-        this.ctx.lineWidth = 2;
-        this.ctx.setLineDash([5, 5]);
-        this.ctx.strokeRect(
-            Math.min(x1, x2),
-            Math.min(y1, y2),
-            Math.abs(x2 - x1),
-            Math.abs(y2 - y1)
-        );
-        this.ctx.setLineDash([]);
+    // キャンバス座標と正規化座標の変換
+    toNormalized(x, y) {
+        const viewScale = this.getViewScale();
+        return {
+            x: (x - this.offsetX) / viewScale / this.imageWidth,
+            y: (y - this.offsetY) / viewScale / this.imageHeight
+        };
+    }
+    
+    // キャンバス座標の点にある最も手前のアノテーション
+    getAnnotationAt(x, y) {
+        if (!this.isImageReady()) return null;
+        const point = this.toNormalized(x, y);
+        const hits = this.index.queryPoint(point.x, point.y);
+        return hits.length > 0 ? hits[hits.length - 1] : null;
     }
     
+    // キャンバス座標の矩形と重なるアノテーション（描画順）
+    getAnnotationsInCanvasRect(rect) {
+        if (!this.isImageReady()) return [];
+        const topLeft = this.toNormalized(rect.x, rect.y);
+        const bottomRight = this.toNormalized(rect.x + rect.w, rect.y + rect.h);
+        return this.index.queryRect({
+            x: topLeft.x, y: topLeft.y, w: bottomRight.x - topLeft.x, h: bottomRight.y - topLeft.y
+        });
+    }
+    
+    // アノテーションの矩形（キャンバス座標）
+    getAnnotationRect(annotation) {
+        const imageWidth = this.imageWidth * this.getViewScale();
+        const imageHeight = this.imageHeight * this.getViewScale();
+        return {
+            x: (annotation.x_center - annotation.width / 2) * imageWidth + this.offsetX,
+            y: (annotation.y_center - annotation.height / 2) * imageHeight + this.offsetY,
+            w: annotation.width * imageWidth,
+            h: annotation.height * imageHeight
+        };
+    }
+    
+    // アノテーションの描画範囲（ラベル名の背景と線の太さを含む）
+    getAnnotationBounds(annotation) {
+        const rect = this.getAnnotationRect(annotation);
+        const tagWidth = this.getTextWidth(annotation.label_name) + 8;
+        return {
+            x: rect.x - BOX_LINE_PADDING,
+            y: rect.y - LABEL_TAG_HEIGHT - BOX_LINE_PADDING,
+            w: Math.max(rect.w, tagWidth) + BOX_LINE_PADDING * 2,
+            h: rect.h + LABEL_TAG_HEIGHT + BOX_LINE_PADDING * 2
+        };
+    }
+    
+    getTextWidth(text) {
+        let width = this.textWidths.get(text);
+        if (width === undefined) {
+            this.overlayCtx.font = '14px Arial';
+            width = this.overlayCtx.measureText(text).width;
+            this.textWidths.set(text, width);
+        }
+        return width;
+    }
+    
+    // 描画範囲（ラベル名の背景を含む）が指定した範囲と重なるアノテーション（描画順）
+    getAnnotationsInRect(rect) {
+        // ラベル名の背景は矩形の上と右にはみ出すので、その分だけ広げて候補を検索
+        let maxTagWidth = 0;
+        this.textWidths.forEach(width => {
+            maxTagWidth = Math.max(maxTagWidth, width + 8);
+        });
+        const candidates = this.getAnnotationsInCanvasRect({
+            x: rect.x - maxTagWidth - BOX_LINE_PADDING,
+            y: rect.y - BOX_LINE_PADDING,
+            w: rect.w + maxTagWidth + BOX_LINE_PADDING * 2,
+            h: rect.h + LABEL_TAG_HEIGHT + BOX_LINE_PADDING * 2
+        });
+        return candidates.filter(ann => rectsIntersect(this.getAnnotationBounds(ann), rect));
+    }
+    
+    // ===== 再描画の予約 =====
+    
+    // アノテーション全体を描き直す
     redraw() {
-        console.log('redraw called');
+        this.overlayFullRedraw = true;
+        this.topLayerDirty = true;
+        this.requestFrame();
+    }
+    
+    // オーバーレイの指定した範囲だけを描き直す
+    invalidateOverlay(rect) {
+        this.overlayDirtyRect = this.overlayDirtyRect ? unionRects(this.overlayDirtyRect, rect) : rect;
+        this.requestFrame();
+    }
+    
+    invalidateTopLayer() {
+        this.topLayerDirty = true;
+        this.requestFrame();
+    }
+    
+    requestFrame() {
+        if (this.frameRequested) return;
+        this.frameRequested = true;
+        requestAnimationFrame(() => this.renderFrame());
+    }
+    
+    renderFrame() {
+        this.frameRequested = false;
+        if (!this.isImageReady()) {
+            return; // 画像が読み込まれていない場合はアノテーションも描画しない
+        }
         
-        // キャンバスをクリア
-        this.ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+        if (this.backgroundDirty) {
+            this.renderBackground();
+            this.backgroundDirty = false;
+        }
         
-        // 画像が準備完了しているかチェック
-        if (this.image && this.image.complete && this.image.naturalWidth > 0) {
-            console.log('Drawing image to canvas');
-            this.ctx.drawImage(this.image, 0, 0, this.canvas.width, this.canvas.height);
-        } else {
-            console.warn('Image not ready for drawing');
-            // 読み込み中の表示
-            this.ctx.fillStyle = '#f8f9fa';
-            this.ctx.fillRect(0, 0, this.canvas.width, this.canvas.height);
-            this.ctx.fillStyle = '#6c757d';
-            this.ctx.font = '16px Arial';
-            this.ctx.textAlign = 'center';
-            this.ctx.fillText('画像を読み込み中...', this.canvas.width / 2, this.canvas.height / 2);
-            this.ctx.textAlign = 'left';
-            return; // 画像が読み込まれていない場合はアノテーションも描画しない
+        if (this.overlayFullRedraw) {
+            // 拡大中は表示範囲にあるアノテーションだけを描画
+            this.overlayCtx.clearRect(0, 0, this.overlayCanvas.width, this.overlayCanvas.height);
+            const visible = { x: 0, y: 0, w: this.overlayCanvas.width, h: this.overlayCanvas.height };
+            this.getAnnotationsInRect(visible).forEach(ann => this.drawAnnotation(ann, false, this.overlayCtx));
+        } else if (this.overlayDirtyRect) {
+            this.renderOverlayRegion(this.overlayDirtyRect);
         }
+        this.overlayFullRedraw = false;
+        this.overlayDirtyRect = null;
         
-        // 既存のアノテーションを描画
-        this.annotations.forEach(ann => {
-            // ホバー中のアノテーション以外を通常通り描画
-            if (ann.id !== this.hoveredAnnotationId) {
-                this.drawAnnotation(ann);
+        if (this.topLayerDirty) {
+            this.renderTopLayer();
+            this.topLayerDirty = false;
+        }
+    }
+    
+    renderBackground() {
+        const ctx = this.backgroundCtx;
+        const viewScale = this.getViewScale();
+        ctx.fillStyle = '#f8f9fa';
+        ctx.fillRect(0, 0, this.backgroundCanvas.width, this.backgroundCanvas.height);
+        if (this.tiles) {
+            this.renderTiles();
+        } else if (this.image) {
+            ctx.drawImage(this.image, this.offsetX, this.offsetY, this.imageWidth * viewScale, this.imageHeight * viewScale);
+        }
+    }
+    
+    // ===== タイル表示 =====
+    
+    // 表示範囲にあるタイルを描画し、未読み込みのタイルを要求する
+    renderTiles() {
+        const viewScale = this.getViewScale();
+        const tileSize = this.tiles.tile_size;
+        // 画面の1ピクセルに対して画素が不足しない範囲で最も粗いレベル
+        const level = Math.max(0, Math.min(this.tiles.levels - 1, Math.floor(Math.log2(1 / viewScale))));
+        const span = tileSize * 2 ** level; // タイル1枚が覆う元画像のピクセル数
+        
+        // 表示範囲（元画像のピクセル座標）
+        const left = Math.max(0, -this.offsetX / viewScale);
+        const top = Math.max(0, -this.offsetY / viewScale);
+        const right = Math.min(this.imageWidth, (this.backgroundCanvas.width - this.offsetX) / viewScale);
+        const bottom = Math.min(this.imageHeight, (this.backgroundCanvas.height - this.offsetY) / viewScale);
+        
+        const wanted = new Set();
+        for (let row = Math.floor(top / span); row * span < bottom; row++) {
+            for (let col = Math.floor(left / span); col * span < right; col++) {
+                const key = `${level}/${col}/${row}`;
+                wanted.add(key);
+                const tile = this.tileCache.get(key);
+                if (tile) {
+                    this.drawTileRegion(tile, level, col, row, level);
+                } else {
+                    this.requestTile(level, col, row);
+                    this.drawTileFallback(level, col, row);
+                }
+            }
+        }
+        
+        // 表示範囲から外れた読み込み中のタイルは中止
+        this.pendingTiles.forEach((tile, key) => {
+            if (!wanted.has(key) && !key.startsWith(`${this.tiles.levels - 1}/`)) {
+                tile.src = '';
+                this.pendingTiles.delete(key);
             }
         });
+    }
+    
+    // レベル level の (col, row) のタイルが覆う範囲に、レベル sourceLevel のタイルの該当部分を描画
+    drawTileRegion(tile, sourceLevel, col, row, level) {
+        const viewScale = this.getViewScale();
+        const tileSize = this.tiles.tile_size;
+        const span = tileSize * 2 ** level;
+        const sourceFactor = 2 ** sourceLevel;
+        const sourceCol = Math.floor(col * span / (tileSize * sourceFactor));
+        const sourceRow = Math.floor(row * span / (tileSize * sourceFactor));
         
-        // ホバー中のアノテーションを薄い色で描画
-        if (this.hoveredAnnotationId !== null) {
-            const hoveredAnnotation = this.annotations.find(ann => ann.id === this.hoveredAnnotationId);
-            if (hoveredAnnotation) {
-                this.drawAnnotation(hoveredAnnotation, true); // ホバー状態で描画
+        // 元画像のピクセル座標での範囲
+        const x0 = col * span;
+        const y0 = row * span;
+        const x1 = Math.min(x0 + span, this.imageWidth);
+        const y1 = Math.min(y0 + span, this.imageHeight);
+        
+        // 描画元のタイル内の範囲
+        const sx = x0 / sourceFactor - sourceCol * tileSize;
+        const sy = y0 / sourceFactor - sourceRow * tileSize;
+        const sw = Math.min((x1 - x0) / sourceFactor, tile.width - sx);
+        const sh = Math.min((y1 - y0) / sourceFactor, tile.height - sy);
+        if (sw <= 0 || sh <= 0) return;
+        
+        // タイルの境目に隙間ができないよう描画先は整数に揃える
+        const dx0 = Math.floor(x0 * viewScale + this.offsetX);
+        const dy0 = Math.floor(y0 * viewScale + this.offsetY);
+        const dx1 = Math.ceil(x1 * viewScale + this.offsetX);
+        const dy1 = Math.ceil(y1 * viewScale + this.offsetY);
+        this.backgroundCtx.drawImage(tile, sx, sy, sw, sh, dx0, dy0, dx1 - dx0, dy1 - dy0);
+    }
+    
+    // 読み込み中のタイルの代わりに、読み込み済みの粗いレベルのタイルを拡大して描画
+    drawTileFallback(level, col, row) {
+        for (let sourceLevel = level + 1; sourceLevel < this.tiles.levels; sourceLevel++) {
+            const shift = sourceLevel - level;
+            const tile = this.tileCache.get(`${sourceLevel}/${col >> shift}/${row >> shift}`);
+            if (tile) {
+                this.drawTileRegion(tile, sourceLevel, col, row, level);
+                return;
             }
         }
+    }
+    
+    requestTile(level, col, row, onLoad) {
+        const key = `${level}/${col}/${row}`;
+        if (this.tileCache.has(key) || this.pendingTiles.has(key)) {
+            if (onLoad) onLoad();
+            return;
+        }
+        const tiles = this.tiles;
+        const tile = new Image();
+        tile.crossOrigin = 'anonymous';
+        tile.onload = () => {
+            // 読み込み中に別の画像へ切り替わった場合は何もしない
+            if (this.tiles !== tiles) return;
+            this.pendingTiles.delete(key);
+            this.tileCache.set(key, tile);
+            this.backgroundDirty = true;
+            this.requestFrame();
+            if (onLoad) onLoad();
+        };
+        tile.onerror = () => {
+            if (this.tiles !== tiles) return;
+            this.pendingTiles.delete(key);
+            console.warn('タイルの読み込みに失敗しました:', key);
+        };
+        tile.src = tiles.url.replace('{level}', level).replace('{col}', col).replace('{row}', row);
+        this.pendingTiles.set(key, tile);
+    }
+    
+    // 範囲内だけを消去し、その範囲に重なるアノテーションを描き直す
+    renderOverlayRegion(rect) {
+        const ctx = this.overlayCtx;
+        const x = Math.floor(rect.x);
+        const y = Math.floor(rect.y);
+        const w = Math.ceil(rect.x + rect.w) - x;
+        const h = Math.ceil(rect.y + rect.h) - y;
         
-        console.log('redraw completed');
+        ctx.save();
+        ctx.beginPath();
+        ctx.rect(x, y, w, h);
+        ctx.clip();
+        ctx.clearRect(x, y, w, h);
+        this.getAnnotationsInRect(rect).forEach(ann => this.drawAnnotation(ann, false, ctx));
+        ctx.restore();
     }
     
-    drawAnnotation(annotation, isHovered = false) {
-        if (!this.image || !this.image.naturalWidth) {
-            return; // 画像が読み込まれていない場合は描画しない
+    // 描画中の矩形とホバー中のアノテーションを描画（前回描画した範囲だけを消去）
+    renderTopLayer() {
+        const ctx = this.ctx;
+        if (this.topLayerDrawnRect) {
+            const r = this.topLayerDrawnRect;
+            ctx.clearRect(Math.floor(r.x), Math.floor(r.y), Math.ceil(r.w) + 2, Math.ceil(r.h) + 2);
+        } else {
+            ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
         }
         
+        let drawnRect = null;
+        this.selectedAnnotations.forEach(ann => {
+            this.drawAnnotation(ann, true, ctx);
+            const bounds = this.getAnnotationBounds(ann);
+            drawnRect = drawnRect ? unionRects(drawnRect, bounds) : bounds;
+        });
+        if (this.hoveredAnnotation) {
+            this.drawAnnotation(this.hoveredAnnotation, true, ctx); // ホバー状態で描画
+            const bounds = this.getAnnotationBounds(this.hoveredAnnotation);
+            drawnRect = drawnRect ? unionRects(drawnRect, bounds) : bounds;
+        }
+        if (this.currentBox) {
+            this.drawCurrentBox(this.currentBox);
+            const box = this.currentBox;
+            const boxRect = { x: box.x - BOX_LINE_PADDING, y: box.y - BOX_LINE_PADDING, w: box.w + BOX_LINE_PADDING * 2, h: box.h + BOX_LINE_PADDING * 2 };
+            drawnRect = drawnRect ? unionRects(drawnRect, boxRect) : boxRect;
+        }
+        this.topLayerDrawnRect = drawnRect || { x: 0, y: 0, w: 0, h: 0 };
+    }
+    
+    drawCurrentBox(box) {
+        this.ctx.strokeStyle = this.isSelecting ? '#6c757d' : this.selectedLabelColor;
+        this.ctx.lineWidth = 2;
+        this.ctx.setLineDash([5, 5]);
+        this.ctx.strokeRect(box.x, box.y, box.w, box.h);
+        this.ctx.setLineDash([]);
+    }
+    
+    drawAnnotation(annotation, isHovered = false, ctx = this.overlayCtx) {
         // YOLO形式からキャンバス座標に変換
-        const x = (annotation.x_center - annotation.width / 2) * this.image.naturalWidth * this.scale;
-        const y = (annotation.y_center - annotation.height / 2) * this.image.naturalHeight * this.scale;
-        const w = annotation.width * this.image.naturalWidth * this.scale;
-        const h = annotation.height * this.image.naturalHeight * this.scale;
+        const { x, y, w, h } = this.getAnnotationRect(annotation);
         
         // ホバー中の場合は内部を薄く塗りつぶし
         if (isHovered) {
             // バウンディングボックスの内部を薄い色で塗りつぶし
-            this.ctx.globalAlpha = 0.2;
-            this.ctx.fillStyle = annotation.label_color;
-            this.ctx.fillRect(x, y, w, h);
-            this.ctx.globalAlpha = 1.0;
+            ctx.globalAlpha = 0.2;
+            ctx.fillStyle = annotation.label_color;
+            ctx.fillRect(x, y, w, h);
+            ctx.globalAlpha = 1.0;
         }
         
         // 矩形の枠を描画
-        this.ctx.strokeStyle = annotation.label_color;
-        this.ctx.lineWidth = 2;
-        this.ctx.strokeRect(x, y, w, h);
+        ctx.strokeStyle = annotation.label_color;
+        ctx.lineWidth = 2;
+        ctx.strokeRect(x, y, w, h);
         
         // ラベル名を描画（背景付き）
-        this.ctx.font = '14px Arial';
-        const textMetrics = this.ctx.measureText(annotation.label_name);
-        const textWidth = textMetrics.width;
+        ctx.font = '14px Arial';
+        const textWidth = this.getTextWidth(annotation.label_name);
         const textHeight = 14;
         
         // 背景を描画
-        this.ctx.fillStyle = annotation.label_color;
-        this.ctx.fillRect(x, y - textHeight - 4, textWidth + 8, textHeight + 4);
+        ctx.fillStyle = annotation.label_color;
+        ctx.fillRect(x, y - textHeight - 4, textWidth + 8, textHeight + 4);
         
         // テキストを描画
-        this.ctx.fillStyle = '#ffffff';
-        this.ctx.fillText(annotation.label_name, x + 4, y - 4);
+        ctx.fillStyle = '#ffffff';
+        ctx.fillText(annotation.label_name, x + 4, y - 4);
     }
     
     setSelectedLabel(labelId, labelName, labelColor) {
@@ -328,10 +918,55 @@ class AnnotationCanvas {
     
     loadExistingAnnotations(annotations) {
         this.annotations = annotations;
+        this.index.rebuild(annotations);
+        this.selectedAnnotations.clear();
+        this.hoveredAnnotation = null;
+        this.markSaved(annotations);
+        this.updateAnnotationsList();
+        this.redraw();
+    }
+    
+    // サーバーに保存済みの状態を記録（差分保存の基準）
+    markSaved(annotations) {
+        this.savedAnnotations = new Map();
+        annotations.forEach(ann => {
+            this.savedAnnotations.set(ann.id, serializeAnnotation(ann));
+        });
+    }
+    
+    // 保存済みの状態との差分（追加・変更・削除）を求める
+    getAnnotationChanges() {
+        return diffAnnotations(this.annotations, this.savedAnnotations);
+    }
+    
+    // 自動保存から復元した状態を読み込む（saved は保存済みの [ID, 内容] の配列）
+    restoreState(annotations, saved) {
+        this.annotations = annotations;
+        this.index.rebuild(annotations);
+        this.selectedAnnotations.clear();
+        this.hoveredAnnotation = null;
+        this.savedAnnotations = new Map(saved);
         this.updateAnnotationsList();
         this.redraw();
     }
     
+    hasUnsavedChanges() {
+        return !isEmptyChanges(this.getAnnotationChanges());
+    }
+    
+    // 差分保存の結果を反映（一時IDを保存後のIDに置き換え、保存済みの状態を更新）
+    applySaveResult(data) {
+        const idMap = data.id_map || {};
+        this.annotations.forEach(ann => {
+            const savedId = idMap[String(ann.id)];
+            if (savedId !== undefined) {
+                ann.id = savedId;
+            }
+        });
+        this.markSaved(data.annotations);
+        this.updateAnnotationsList();
+    }
+    
     updateAnnotationsList() {
         const listContainer = document.getElementById('annotations-list');
         listContainer.innerHTML = '';
@@ -356,7 +991,7 @@ class AnnotationCanvas {
             
             // ホバー時にバウンディングボックスをハイライト
             item.addEventListener('mouseenter', () => {
-                this.hoverAnnotation(ann.id);
+                this.hoverAnnotation(ann);
             });
             
             item.addEventListener('mouseleave', () => {
@@ -365,55 +1000,664 @@ class AnnotationCanvas {
             
             listContainer.appendChild(item);
         });
+        this.updateListHighlight();
     }
     
     highlightAnnotation(annotationId) {
-        // リスト内のハイライトを更新
+        const annotation = this.annotations.find(ann => ann.id === annotationId);
+        this.selectAnnotations(annotation ? [annotation] : []);
+    }
+    
+    // アノテーションを選択し、キャンバスと一覧の両方でハイライトする
+    selectAnnotations(annotations) {
+        this.selectedAnnotations = new Set(annotations);
+        this.updateListHighlight();
+        this.invalidateTopLayer();
+    }
+    
+    updateListHighlight() {
+        const selectedIds = new Set(Array.from(this.selectedAnnotations, ann => String(ann.id)));
         document.querySelectorAll('.annotation-item').forEach(item => {
-            item.classList.remove('highlighted');
+            item.classList.toggle('highlighted', selectedIds.has(item.dataset.annotationId));
         });
-        
-        const item = document.querySelector(`[data-annotation-id="${annotationId}"]`);
-        if (item) {
-            item.classList.add('highlighted');
-        }
     }
     
     deleteAnnotation(annotationId) {
-        this.annotations = this.annotations.filter(ann => ann.id !== annotationId);
+        const annotation = this.annotations.find(ann => ann.id === annotationId);
+        if (!annotation) return;
+        this.removeAnnotations([annotation]);
+    }
+    
+    // 選択中のアノテーションをまとめて削除
+    deleteSelectedAnnotations() {
+        if (this.selectedAnnotations.size === 0) return;
+        this.removeAnnotations(Array.from(this.selectedAnnotations));
+    }
+    
+    removeAnnotations(annotations) {
+        const removed = new Set(annotations);
+        this.annotations = this.annotations.filter(ann => !removed.has(ann));
+        
+        // 削除したアノテーションがあった範囲だけを描き直す
+        let dirtyRect = null;
+        removed.forEach(ann => {
+            this.index.remove(ann);
+            this.selectedAnnotations.delete(ann);
+            const bounds = this.getAnnotationBounds(ann);
+            dirtyRect = dirtyRect ? unionRects(dirtyRect, bounds) : bounds;
+            if (this.hoveredAnnotation === ann) {
+                this.hoveredAnnotation = null;
+            }
+        });
+        this.invalidateOverlay(dirtyRect);
+        this.invalidateTopLayer();
         this.updateAnnotationsList();
-        this.redraw();
+        this.notifyChange();
     }
     
     clearAllAnnotations() {
         this.annotations = [];
+        this.index.rebuild([]);
+        this.selectedAnnotations.clear();
+        this.hoveredAnnotation = null;
         this.updateAnnotationsList();
         this.redraw();
+        this.notifyChange();
+    }
+    
+    notifyChange() {
+        if (this.onChange) {
+            this.onChange();
+        }
     }
     
     getAnnotationsForSave() {
-        return this.annotations.map(ann => ({
-            label_id: ann.label_id,
-            x_center: ann.x_center,
-            y_center: ann.y_center,
-            width: ann.width,
-            height: ann.height
-        }));
+        return this.annotations.map(ann => serializeAnnotation(ann));
     }
     
-    hoverAnnotation(annotationId) {
-        this.hoveredAnnotationId = annotationId;
-        this.redraw();
+    hoverAnnotation(annotation) {
+        this.hoveredAnnotation = annotation;
+        this.invalidateTopLayer();
     }
     
     clearHoverAnnotation() {
-        this.hoveredAnnotationId = null;
-        this.redraw();
+        this.hoveredAnnotation = null;
+        this.invalidateTopLayer();
+    }
+}
+
+function isTextInput(element) {
+    return element && (element.tagName === 'INPUT' || element.tagName === 'TEXTAREA');
+}
+
+function rectsIntersect(a, b) {
+    return a.x <= b.x + b.w && b.x <= a.x + a.w && a.y <= b.y + b.h && b.y <= a.y + a.h;
+}
+
+// アノテーションの矩形（正規化座標）
+function normalizedRect(ann) {
+    return {
+        x: ann.x_center - ann.width / 2,
+        y: ann.y_center - ann.height / 2,
+        w: ann.width,
+        h: ann.height
+    };
+}
+
+function unionRects(a, b) {
+    const x = Math.min(a.x, b.x);
+    const y = Math.min(a.y, b.y);
+    return {
+        x: x,
+        y: y,
+        w: Math.max(a.x + a.w, b.x + b.w) - x,
+        h: Math.max(a.y + a.h, b.y + b.h) - y
+    };
+}
+
+function serializeAnnotation(ann) {
+    return {
+        label_id: ann.label_id,
+        x_center: ann.x_center,
+        y_center: ann.y_center,
+        width: ann.width,
+        height: ann.height
+    };
+}
+
+function isSameAnnotation(a, b) {
+    return Object.keys(a).every(key => a[key] === b[key]);
+}
+
+// 保存済みの状態（ID -> 内容のMap）との差分を求める
+function diffAnnotations(annotations, saved) {
+    const added = [];
+    const updated = [];
+    const currentIds = new Set();
+    
+    annotations.forEach(ann => {
+        currentIds.add(ann.id);
+        const data = serializeAnnotation(ann);
+        const savedData = saved.get(ann.id);
+        if (!savedData) {
+            added.push({ client_id: ann.id, ...data });
+        } else if (!isSameAnnotation(data, savedData)) {
+            updated.push({ id: ann.id, ...data });
+        }
+    });
+    
+    const deleted = [];
+    saved.forEach((savedData, id) => {
+        if (!currentIds.has(id)) {
+            deleted.push(id);
+        }
+    });
+    
+    return { added, updated, deleted };
+}
+
+function isEmptyChanges(changes) {
+    return changes.added.length === 0 && changes.updated.length === 0 && changes.deleted.length === 0;
+}
+
+// ===== 自動保存 =====
+// 編集内容は少し待ってからIndexedDBにまとめて書き込み（画面遷移や再読み込みでも失われない）、
+// バックグラウンドで差分保存APIに送信する。送信に失敗した場合は間隔を空けて再試行する。
+const AUTOSAVE_DB_NAME = 'yolo-annotator';
+const AUTOSAVE_STORE = 'pending-annotations';
+const AUTOSAVE_PERSIST_DELAY = 300;   // 編集からIndexedDBへの書き込みまで（ミリ秒）
+const AUTOSAVE_FLUSH_DELAY = 1500;    // 編集からサーバー送信まで（ミリ秒）
+const AUTOSAVE_RETRY_MIN = 1000;
+const AUTOSAVE_RETRY_MAX = 30000;
+
+// 未送信の編集内容の保存先（IndexedDBが使えない環境ではメモリ上に保持）
+class PendingStore {
+    constructor() {
+        this.memory = new Map();
+        this.dbPromise = new Promise(resolve => {
+            if (!window.indexedDB) {
+                resolve(null);
+                return;
+            }
+            const request = indexedDB.open(AUTOSAVE_DB_NAME, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore(AUTOSAVE_STORE, { keyPath: 'imageId' });
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => {
+                console.warn('IndexedDBを開けません。未送信の編集はメモリ上に保持します:', request.error);
+                resolve(null);
+            };
+        });
+    }
+    
+    async run(mode, operation, fallback) {
+        const db = await this.dbPromise;
+        if (!db) {
+            return fallback();
+        }
+        return new Promise((resolve, reject) => {
+            const transaction = db.transaction(AUTOSAVE_STORE, mode);
+            const request = operation(transaction.objectStore(AUTOSAVE_STORE));
+            transaction.oncomplete = () => resolve(request.result);
+            transaction.onerror = () => reject(transaction.error);
+        });
+    }
+    
+    get(imageId) {
+        return this.run('readonly', store => store.get(imageId), () => this.memory.get(imageId));
+    }
+    
+    getAll() {
+        return this.run('readonly', store => store.getAll(), () => Array.from(this.memory.values()));
+    }
+    
+    put(entry) {
+        return this.run('readwrite', store => store.put(entry), () => this.memory.set(entry.imageId, entry));
+    }
+    
+    delete(imageId) {
+        return this.run('readwrite', store => store.delete(imageId), () => this.memory.delete(imageId));
+    }
+}
+
+// サーバーが受け付けない編集（存在しないラベルなど）。自動では再試行しない
+class AutosaveRejectedError extends Error {}
+
+class AutosaveQueue {
+    constructor(canvas, imageId, statusElement) {
+        this.canvas = canvas;
+        this.imageId = imageId;
+        this.statusElement = statusElement;
+        this.store = new PendingStore();
+        this.persistTimer = null;
+        this.flushTimer = null;
+        this.retryDelay = AUTOSAVE_RETRY_MIN;
+        this.flushing = null; // 送信中のPromise
+        this.inflightImageId = null;
+        this.unconfirmedImageId = null; // 送信済みかどうか未確認の編集を復元した画像
+        this.onSaved = null; // 画像の編集がサーバーに保存されたときのコールバック
+        
+        this.canvas.onChange = () => this.notifyChange();
+        window.addEventListener('online', () => this.flush());
+        window.addEventListener('offline', () => this.setStatus('offline'));
+        // タブを閉じる場合も、書き込み待ちの編集をIndexedDBに残す
+        window.addEventListener('pagehide', () => {
+            if (this.persistTimer) this.persist();
+        });
+    }
+    
+    // 表示する画像を切り替える（切り替え前に persist() で編集内容を書き込んでおくこと）
+    setImage(imageId) {
+        clearTimeout(this.persistTimer);
+        this.persistTimer = null;
+        this.imageId = imageId;
+    }
+    
+    // 編集のたびに呼ばれる。書き込みと送信はそれぞれまとめて遅延実行する
+    notifyChange() {
+        this.setStatus('dirty');
+        clearTimeout(this.persistTimer);
+        this.persistTimer = setTimeout(() => this.persist(), AUTOSAVE_PERSIST_DELAY);
+        this.scheduleFlush(AUTOSAVE_FLUSH_DELAY);
+    }
+    
+    scheduleFlush(delay) {
+        clearTimeout(this.flushTimer);
+        this.flushTimer = setTimeout(() => this.flush(), delay);
+    }
+    
+    // 表示中の画像の編集内容をIndexedDBに書き込む（ネットワークは使わない）
+    async persist() {
+        clearTimeout(this.persistTimer);
+        this.persistTimer = null;
+        if (!this.canvas.hasUnsavedChanges()) {
+            if (this.inflightImageId !== this.imageId) {
+                await this.store.delete(this.imageId);
+            }
+            return;
+        }
+        await this.store.put({
+            imageId: this.imageId,
+            annotations: this.canvas.annotations.map(ann => ({ ...ann })),
+            saved: Array.from(this.canvas.savedAnnotations.entries()),
+            inflight: this.inflightImageId === this.imageId || this.unconfirmedImageId === this.imageId
+        });
+    }
+    
+    // 前回の未送信の編集があれば表示中の画像に復元する
+    async restore() {
+        let entry = await this.store.get(this.imageId);
+        if (!entry) {
+            return false;
+        }
+        if (entry.inflight) {
+            try {
+                entry = await this.reconcile(entry);
+            } catch (error) {
+                console.warn('送信済みかどうかを確認できません。後で再確認します:', error);
+                this.unconfirmedImageId = this.imageId;
+            }
+        }
+        this.canvas.restoreState(entry.annotations, entry.saved);
+        this.setStatus(this.canvas.hasUnsavedChanges() ? 'dirty' : 'saved');
+        return true;
+    }
+    
+    // 送信中に画面を離れた編集について、サーバーに反映済みの部分を確認する
+    // （同じ追加を二重に送らないよう、内容が一致するサーバー側のアノテーションに対応付ける）
+    async reconcile(entry) {
+        const response = await fetch(`/api/annotations/${entry.imageId}/`);
+        const data = await response.json();
+        if (data.status !== 'success') {
+            throw new Error(data.message);
+        }
+        
+        const saved = new Map(entry.saved);
+        const server = new Map(data.annotations.map(ann => [ann.id, serializeAnnotation(ann)]));
+        
+        // 保存済みだったアノテーションはサーバーの現在の内容を基準にする（削除済みのものは除く）
+        Array.from(saved.keys()).forEach(id => {
+            if (server.has(id)) {
+                saved.set(id, server.get(id));
+            } else {
+                saved.delete(id);
+            }
+        });
+        
+        const unmatched = Array.from(server.entries()).filter(([id]) => !saved.has(id));
+        entry.annotations.forEach(ann => {
+            if (saved.has(ann.id)) return;
+            const data = serializeAnnotation(ann);
+            const index = unmatched.findIndex(([, serverData]) => isSameAnnotation(data, serverData));
+            if (index !== -1) {
+                const [serverId, serverData] = unmatched.splice(index, 1)[0];
+                ann.id = serverId;
+                saved.set(serverId, serverData);
+            }
+        });
+        
+        entry.saved = Array.from(saved.entries());
+        entry.inflight = false;
+        await this.store.put(entry);
+        return entry;
+    }
+    
+    // 未送信の編集をすべて送信する（同時に1つだけ実行）
+    flush() {
+        if (this.flushing) {
+            return this.flushing;
+        }
+        clearTimeout(this.flushTimer);
+        this.flushing = this.flushAll().finally(() => {
+            this.flushing = null;
+        });
+        return this.flushing;
+    }
+    
+    async flushAll() {
+        try {
+            await this.persist();
+            if (!navigator.onLine) {
+                this.setStatus('offline');
+                return;
+            }
+            const entries = await this.store.getAll();
+            for (const entry of entries) {
+                this.setStatus('saving');
+                await this.flushEntry(entry);
+            }
+            this.retryDelay = AUTOSAVE_RETRY_MIN;
+            this.setStatus(this.canvas.hasUnsavedChanges() ? 'dirty' : 'saved');
+        } catch (error) {
+            console.error('自動保存エラー:', error);
+            if (error instanceof AutosaveRejectedError) {
+                this.setStatus('error', error.message);
+                return;
+            }
+            // 間隔を倍にしながら再試行
+            this.setStatus(navigator.onLine ? 'retry' : 'offline');
+            this.scheduleFlush(this.retryDelay);
+            this.retryDelay = Math.min(this.retryDelay * 2, AUTOSAVE_RETRY_MAX);
+        }
+    }
+    
+    async flushEntry(entry) {
+        if (entry.inflight) {
+            entry = await this.reconcile(entry);
+            if (entry.imageId === this.imageId) {
+                this.unconfirmedImageId = null;
+                this.canvas.restoreState(entry.annotations, entry.saved);
+            }
+        }
+        
+        const changes = diffAnnotations(entry.annotations, new Map(entry.saved));
+        if (isEmptyChanges(changes)) {
+            await this.store.delete(entry.imageId);
+            return;
+        }
+        
+        entry.inflight = true;
+        this.inflightImageId = entry.imageId;
+        await this.store.put(entry);
+        
+        try {
+            const response = await fetch(`/api/annotations/${entry.imageId}/`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': getCookie('csrftoken')
+                },
+                body: JSON.stringify(changes)
+            });
+            const data = await response.json();
+            if (response.status === 400 || response.status === 404) {
+                throw new AutosaveRejectedError(data.message || '保存できない編集があります');
+            }
+            if (data.status !== 'success') {
+                throw new Error(data.message);
+            }
+            
+            this.inflightImageId = null;
+            if (this.onSaved) {
+                this.onSaved(entry.imageId);
+            }
+            if (entry.imageId === this.imageId) {
+                // 表示中の画像は送信中の編集も含めてキャンバスの状態を基準にする
+                this.canvas.applySaveResult(data);
+                await this.persist();
+            } else {
+                const idMap = data.id_map || {};
+                entry.annotations.forEach(ann => {
+                    const savedId = idMap[String(ann.id)];
+                    if (savedId !== undefined) ann.id = savedId;
+                });
+                entry.saved = data.annotations.map(ann => [ann.id, serializeAnnotation(ann)]);
+                entry.inflight = false;
+                if (isEmptyChanges(diffAnnotations(entry.annotations, new Map(entry.saved)))) {
+                    await this.store.delete(entry.imageId);
+                } else {
+                    await this.store.put(entry);
+                }
+            }
+        } finally {
+            this.inflightImageId = null;
+        }
+    }
+    
+    setStatus(state, detail) {
+        if (!this.statusElement) return;
+        const labels = {
+            saved: ['保存済み', 'bg-success'],
+            dirty: ['未保存の変更あり', 'bg-secondary'],
+            saving: ['保存中...', 'bg-info'],
+            retry: ['保存に失敗（再試行します）', 'bg-warning'],
+            offline: ['オフライン（接続後に保存）', 'bg-warning'],
+            error: ['保存エラー', 'bg-danger']
+        };
+        const [text, className] = labels[state];
+        this.statusElement.textContent = text;
+        this.statusElement.className = `badge ${className}`;
+        this.statusElement.title = detail || '';
+    }
+}
+
+// ===== 前後の画像の先読み =====
+// 件数上限付きのキャッシュ（上限を超えたら最も使われていないものから削除）
+class LruCache {
+    constructor(maxSize) {
+        this.maxSize = maxSize;
+        this.map = new Map();
+    }
+    
+    get(key) {
+        if (!this.map.has(key)) return undefined;
+        const value = this.map.get(key);
+        // 使用順を更新するため末尾に移動
+        this.map.delete(key);
+        this.map.set(key, value);
+        return value;
+    }
+    
+    set(key, value) {
+        this.map.delete(key);
+        this.map.set(key, value);
+        while (this.map.size > this.maxSize) {
+            this.map.delete(this.map.keys().next().value);
+        }
+    }
+    
+    has(key) {
+        return this.map.has(key);
+    }
+    
+    delete(key) {
+        this.map.delete(key);
+    }
+}
+
+// 前後の画像とその表示用データ（/api/images/<id>/）をバックグラウンドで読み込み、デコード済みの状態で保持する
+// 回線を表示中の画像と取り合わないよう、1件ずつ順番に読み込む
+class ImagePrefetcher {
+    constructor(cacheSize) {
+        this.images = new LruCache(cacheSize);      // URL -> デコード済みのImage
+        this.workspaces = new LruCache(cacheSize);  // 画像ID -> 画像情報・アノテーション・前後の画像
+        this.queue = [];
+        this.running = false;
+    }
+    
+    // items: [{id, url}, ...] を先頭から順に先読み（タイル表示する画像は url が null で、データのみ先読み）
+    prefetch(items) {
+        this.queue = items.filter(item => (item.url && !this.images.has(item.url)) || !this.workspaces.has(item.id));
+        if (!this.running) {
+            this.runQueue();
+        }
+    }
+    
+    async runQueue() {
+        this.running = true;
+        while (this.queue.length > 0) {
+            const item = this.queue.shift();
+            try {
+                await Promise.all([item.url && this.loadImage(item.url), this.loadWorkspace(item.id)]);
+            } catch (error) {
+                console.warn('先読みに失敗しました:', item.url, error);
+            }
+        }
+        this.running = false;
+    }
+    
+    async loadImage(url) {
+        if (this.images.has(url)) return this.images.get(url);
+        const image = new Image();
+        image.crossOrigin = 'anonymous';
+        image.fetchPriority = 'low';
+        image.src = url;
+        // デコードまで済ませておき、表示時にメインスレッドでデコードしないようにする
+        await image.decode();
+        this.images.set(url, image);
+        return image;
+    }
+    
+    async loadWorkspace(imageId) {
+        if (this.workspaces.has(imageId)) return this.workspaces.get(imageId);
+        const response = await fetch(`/api/images/${imageId}/`);
+        const data = await response.json();
+        if (data.status !== 'success') {
+            throw new Error(data.message);
+        }
+        this.workspaces.set(imageId, data);
+        return data;
+    }
+    
+    // 先読み済みのデコードされた画像（なければundefined）
+    getImage(url) {
+        return this.images.get(url);
+    }
+    
+    getWorkspace(imageId) {
+        return this.workspaces.get(imageId);
+    }
+    
+    // 編集された画像のデータは古くなるので破棄する（画像そのものは残す）
+    forget(imageId) {
+        this.workspaces.delete(imageId);
+    }
+}
+
+// ===== ページを再読み込みしない画像の切り替え =====
+let workspaceGeneration = 0;
+
+// 指定した画像に切り替える（push=false は戻る/進むによる切り替え）
+async function showImage(imageId, push = true) {
+    const generation = ++workspaceGeneration;
+    
+    // 表示中の画像の編集内容をIndexedDBに書き込み、保存中の送信があれば完了を待つ
+    await autosave.persist().catch(error => console.error('編集内容の書き込みに失敗しました:', error));
+    if (autosave.flushing) {
+        await autosave.flushing;
+    }
+    prefetcher.forget(autosave.imageId);
+    
+    let workspace;
+    try {
+        workspace = prefetcher.getWorkspace(imageId) || await prefetcher.loadWorkspace(imageId);
+    } catch (error) {
+        console.error('画像データの取得に失敗しました:', error);
+        window.location.href = `/annotate/${imageId}/`;
+        return;
+    }
+    // 取得中にさらに別の画像へ移動した場合は、最後の移動だけを反映する
+    if (generation !== workspaceGeneration) return;
+    
+    applyWorkspace(workspace);
+    if (push) {
+        history.pushState({ imageId: imageId }, '', workspace.annotate_url);
     }
 }
 
+function applyWorkspace(workspace) {
+    const image = workspace.image;
+    window.imageData = image;
+    
+    // 画像を表示し、表示できたら次の前後の画像を先読み
+    const loading = image.tiles
+        ? annotationCanvas.loadTiledImage(image)
+        : annotationCanvas.loadImage(image.url, prefetcher.getImage(image.url));
+    loading.then(() => {
+        prefetcher.prefetch(workspace.prefetch);
+    });
+    
+    // キャッシュのデータを編集しないようにコピーして読み込む
+    annotationCanvas.loadExistingAnnotations(workspace.annotations.map(ann => ({ ...ann })));
+    autosave.setImage(image.id);
+    autosave.setStatus('saved');
+    autosave.restore()
+        .then(restored => {
+            if (restored && annotationCanvas.hasUnsavedChanges()) {
+                autosave.scheduleFlush(AUTOSAVE_FLUSH_DELAY);
+            }
+        })
+        .catch(error => console.error('自動保存の復元に失敗しました:', error));
+    
+    document.title = `アノテーション - ${image.filename}`;
+    document.getElementById('image-filename').textContent = image.filename;
+    updateNavigationButton('prev-btn', workspace.prev_id);
+    updateNavigationButton('next-btn', workspace.next_id);
+    document.getElementById('back-to-list-btn').classList.toggle('d-none', Boolean(workspace.prev_id || workspace.next_id));
+}
+
+function updateNavigationButton(id, imageId) {
+    const button = document.getElementById(id);
+    button.dataset.imageId = imageId || '';
+    button.href = imageId ? `/annotate/${imageId}/` : '';
+    button.classList.toggle('d-none', !imageId);
+}
+
+// 前後の画像へのリンクはページを再読み込みせずに切り替える（新しいタブで開く操作はそのまま）
+function initWorkspaceNavigation() {
+    ['prev-btn', 'next-btn'].forEach(id => {
+        document.getElementById(id).addEventListener('click', function(e) {
+            if (e.button !== 0 || e.ctrlKey || e.metaKey || e.shiftKey) return;
+            e.preventDefault();
+            if (this.dataset.imageId) {
+                showImage(parseInt(this.dataset.imageId));
+            }
+        });
+    });
+    
+    history.replaceState({ imageId: window.imageData.id }, '', window.location.href);
+    window.addEventListener('popstate', function(e) {
+        if (e.state && e.state.imageId) {
+            showImage(e.state.imageId, false);
+        }
+    });
+}
+
 // アプリケーション初期化
 let annotationCanvas;
+let autosave;
+let prefetcher;
 
 document.addEventListener('DOMContentLoaded', function() {
     console.log('DOM読み込み完了');
@@ -454,13 +1698,32 @@ document.addEventListener('DOMContentLoaded', function() {
         return;
     }
     
-    // 画像を読み込み
+    // 画像を読み込み、表示できたら前後の画像をバックグラウンドで先読み
     console.log('画像読み込み開始:', window.imageData.url);
-    annotationCanvas.loadImage(window.imageData.url);
+    const prefetchConfig = window.prefetchConfig || { cacheSize: 8, images: [] };
+    prefetcher = new ImagePrefetcher(prefetchConfig.cacheSize);
+    const loading = window.imageData.tiles
+        ? annotationCanvas.loadTiledImage(window.imageData)
+        : annotationCanvas.loadImage(window.imageData.url);
+    loading.then(() => {
+        prefetcher.prefetch(prefetchConfig.images);
+    });
     
     // 既存のアノテーションを読み込み
     annotationCanvas.loadExistingAnnotations(window.existingAnnotations);
     
+    // 自動保存を初期化し、前回の未送信の編集があれば復元してから送信
+    autosave = new AutosaveQueue(annotationCanvas, window.imageData.id, document.getElementById('autosave-status'));
+    autosave.restore()
+        .catch(error => console.error('自動保存の復元に失敗しました:', error))
+        .finally(() => autosave.flush());
+    
+    // 保存された画像の先読みデータは古くなるので破棄
+    autosave.onSaved = imageId => prefetcher.forget(imageId);
+    
+    // 前後の画像への移動はページを再読み込みせずに切り替える
+    initWorkspaceNavigation();
+    
     // 既存のラベルボタンに色を適用
     initializeLabelButtonColors();
     
@@ -491,38 +1754,11 @@ document.addEventListener('DOMContentLoaded', function() {
         );
     }
     
-    // 保存ボタン
+    // 保存ボタン（自動保存を待たずにすぐ送信）
     document.getElementById('save-btn').addEventListener('click', function() {
-        const annotations = annotationCanvas.getAnnotationsForSave();
-        
         this.disabled = true;
-        this.textContent = '保存中...';
-        
-        fetch(`/api/save_annotations/${window.imageData.id}/`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-CSRFToken': getCookie('csrftoken')
-            },
-            body: JSON.stringify({
-                annotations: annotations
-            })
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.status === 'success') {
-                alert('保存しました');
-            } else {
-                alert('エラー: ' + data.message);
-            }
-        })
-        .catch(error => {
-            console.error('Error:', error);
-            alert('エラーが発生しました');
-        })
-        .finally(() => {
+        autosave.flush().finally(() => {
             this.disabled = false;
-            this.textContent = '保存';
         });
     });
     
@@ -852,15 +2088,6 @@ document.addEventListener('keydown', function(event) {
     }
 });
 
-// 既存のアノテーションを読み込み
-annotationCanvas.loadExistingAnnotations(window.existingAnnotations);
-
-// 既存のラベルボタンに色を適用
-initializeLabelButtonColors();
-
-// ラベル管理機能を初期化
-initLabelManagement();
-
 // キーボードナビゲーション機能を追加
 function initKeyboardNavigation() {
     document.addEventListener('keydown', function(event) {
@@ -893,6 +2120,22 @@ function initKeyboardNavigation() {
                 }
                 break;
                 
+            case '0':
+                // 全体表示に戻す
+                if (annotationCanvas) {
+                    annotationCanvas.resetView();
+                }
+                break;
+                
+            case 'Delete':
+            case 'Backspace':
+                // 選択中のアノテーションを削除
+                if (annotationCanvas && annotationCanvas.selectedAnnotations.size > 0) {
+                    event.preventDefault();
+                    annotationCanvas.deleteSelectedAnnotations();
+                }
+                break;
+                
             case 's':
             case 'S':
                 if (event.ctrlKey) {
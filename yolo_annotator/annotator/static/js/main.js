@@ -13,6 +13,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const splitDatasetBtn = document.getElementById('split-dataset-btn');
     const splitModal = new bootstrap.Modal(document.getElementById('splitModal'));
     const confirmSplitBtn = document.getElementById('confirm-split');
+    const estimateSplitBtn = document.getElementById('estimate-split');
 
     // 画像読み込みボタン
     loadImagesBtn.addEventListener('click', function() {
@@ -28,16 +29,21 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(response => response.json())
         .then(data => {
-            if (data.status === 'success') {
-                alert(data.message);
-                location.reload();
-            } else {
-                alert('エラー: ' + data.message);
+            if (data.status !== 'success') {
+                throw new Error(data.message);
             }
+            // ジョブの完了まで進捗をポーリング
+            return pollJob(data.job_id, job => {
+                this.textContent = `読み込み中... ${formatJobProgress(job)}`;
+            });
+        })
+        .then(job => {
+            alert(job.message);
+            location.reload();
         })
         .catch(error => {
             console.error('Error:', error);
-            alert('エラーが発生しました');
+            alert('エラー: ' + error.message);
         })
         .finally(() => {
             this.disabled = false;
@@ -45,18 +51,69 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // YOLOデータセット取り込みボタン（サーバー上のフォルダを指定）
+    document.getElementById('import-yolo-btn').addEventListener('click', function() {
+        const path = prompt('取り込むYOLOデータセットのフォルダ（data.yaml があるフォルダ）をサーバー上のパスで指定してください');
+        if (!path) {
+            return;
+        }
+        
+        this.disabled = true;
+        this.textContent = '取り込み中...';
+        
+        fetch('/api/import_yolo/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            body: JSON.stringify({ path: path })
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status !== 'success') {
+                throw new Error(data.message);
+            }
+            return pollJob(data.job_id, job => {
+                this.textContent = `取り込み中... ${formatJobProgress(job)}`;
+            });
+        })
+        .then(job => {
+            alert(job.message);
+            location.reload();
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            alert('エラー: ' + error.message);
+        })
+        .finally(() => {
+            this.disabled = false;
+            this.textContent = 'YOLOデータセットを取り込み';
+        });
+    });
+
     // データセット分割ボタン
     splitDatasetBtn.addEventListener('click', function() {
         splitModal.show();
     });
 
-    // 分割実行ボタン
-    confirmSplitBtn.addEventListener('click', function() {
-        const splitRatio = document.getElementById('split-ratio').value;
+    // 分割の実行（dryRun の場合は一部の画像で試して出力サイズと処理時間を見積もるだけ）
+    function runSplit(button, dryRun) {
+        const splitRatioSelect = document.getElementById('split-ratio');
+        const splitRatio = splitRatioSelect.value;
+        const testRatio = splitRatioSelect.selectedOptions[0].dataset.testRatio;
         const imageSize = document.getElementById('image-size').value;
+        const formats = Array.from(document.querySelectorAll('.export-format:checked'), input => input.value);
+        if (formats.length === 0) {
+            alert('出力形式を1つ以上選択してください');
+            return;
+        }
         
-        this.disabled = true;
-        this.textContent = '分割中...';
+        const idleText = button.textContent;
+        const busyText = dryRun ? '見積もり中...' : '分割中...';
+        confirmSplitBtn.disabled = true;
+        estimateSplitBtn.disabled = true;
+        button.textContent = busyText;
         
         fetch('/api/split_dataset/', {
             method: 'POST',
@@ -66,30 +123,60 @@ document.addEventListener('DOMContentLoaded', function() {
             },
             body: JSON.stringify({
                 split_ratio: parseFloat(splitRatio),
-                image_size: parseInt(imageSize)
+                test_ratio: parseFloat(testRatio),
+                seed: parseInt(document.getElementById('split-seed').value) || 0,
+                stratify: document.getElementById('split-stratify').checked,
+                image_size: parseInt(imageSize),
+                formats: formats,
+                letterbox: { padding: document.getElementById('padding-mode').value },
+                dry_run: dryRun
             })
         })
         .then(response => response.json())
         .then(data => {
-            if (data.status === 'success') {
-                alert(data.message);
-                splitModal.hide();
-            } else {
-                alert('エラー: ' + data.message);
+            if (data.status !== 'success') {
+                throw new Error(data.message);
+            }
+            return pollJob(data.job_id, job => {
+                button.textContent = `${busyText} ${formatJobProgress(job)}`;
+            });
+        })
+        .then(job => {
+            if (dryRun) {
+                alert(job.message);
+                return;
+            }
+            splitModal.hide();
+            // 出力したデータセットをZIPでダウンロード（サーバー上で圧縮しながら送信される）
+            if (confirm(`${job.message}\n\nZIPファイルとしてダウンロードしますか？`)) {
+                window.location.href = `/api/exports/${job.result.timestamp}/download/`;
             }
         })
         .catch(error => {
             console.error('Error:', error);
-            alert('エラーが発生しました');
+            alert('エラー: ' + error.message);
         })
         .finally(() => {
-            this.disabled = false;
-            this.textContent = '分割実行';
+            confirmSplitBtn.disabled = false;
+            estimateSplitBtn.disabled = false;
+            button.textContent = idleText;
         });
+    }
+    
+    // 分割実行ボタン
+    confirmSplitBtn.addEventListener('click', function() {
+        runSplit(this, false);
     });
     
-    // 表示切り替え機能
-    initViewToggle();
+    // 見積もりボタン
+    estimateSplitBtn.addEventListener('click', function() {
+        runSplit(this, true);
+    });
+    
+    // 画像一覧（仮想スクロール）と表示切り替え機能
+    const { imageIndex, applyFilters } = initImageIndex();
+    initViewToggle(imageIndex);
+    applyFilters();
     
     // ラベル管理機能を初期化
     initLabelManagement();
@@ -322,12 +409,259 @@ function removeLabelFromUI(labelId) {
     }
 }
 
+// 仮想スクロールによる画像一覧
+// 画像データは一覧APIからカーソルでページ単位に読み込み、表示範囲に入っている行のDOMだけを生成する
+class ImageIndex {
+    constructor(viewport, pageSize) {
+        this.viewport = viewport;
+        this.spacer = viewport.querySelector('.images-spacer');
+        this.pageSize = pageSize;
+        this.mode = 'grid';
+        this.filters = {};
+        this.items = [];
+        this.count = 0;
+        this.nextCursor = null;
+        this.loading = false;
+        this.generation = 0; // 絞り込み変更前のレスポンスを破棄するための世代番号
+        this.renderedRows = new Map(); // 行番号 -> 行のDOM
+        this.renderScheduled = false;
+        
+        this.viewport.addEventListener('scroll', () => this.scheduleRender());
+        window.addEventListener('resize', () => {
+            this.clearRows();
+            this.scheduleRender();
+        });
+    }
+    
+    // 1行あたりの列数（グリッド表示は画面幅に応じて変える）
+    get columns() {
+        if (this.mode === 'list') return 1;
+        return this.viewport.clientWidth >= 700 ? 4 : 2;
+    }
+    
+    get rowHeight() {
+        return this.mode === 'list' ? IMAGE_LIST_ROW_HEIGHT : IMAGE_GRID_ROW_HEIGHT;
+    }
+    
+    setMode(mode) {
+        this.mode = mode;
+        this.clearRows();
+        this.scheduleRender();
+    }
+    
+    setFilters(filters) {
+        this.filters = filters;
+        this.generation++;
+        this.items = [];
+        this.count = 0;
+        this.nextCursor = null;
+        this.loading = false;
+        this.viewport.scrollTop = 0;
+        this.clearRows();
+        this.loadPage();
+    }
+    
+    loadPage() {
+        if (this.loading) return;
+        this.loading = true;
+        const generation = this.generation;
+        
+        const params = new URLSearchParams({ limit: this.pageSize });
+        Object.entries(this.filters).forEach(([key, value]) => {
+            if (value) params.set(key, value);
+        });
+        if (this.nextCursor) {
+            params.set('cursor', this.nextCursor);
+        }
+        
+        fetch('/api/images/?' + params.toString())
+            .then(response => response.json())
+            .then(data => {
+                if (generation !== this.generation) return;
+                if (data.status !== 'success') {
+                    throw new Error(data.message);
+                }
+                if (data.count !== null) {
+                    this.count = data.count;
+                    this.updateCount();
+                }
+                this.items.push(...data.images);
+                this.nextCursor = data.next_cursor;
+                this.loading = false;
+                this.scheduleRender();
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                if (generation === this.generation) this.loading = false;
+            });
+    }
+    
+    updateCount() {
+        document.getElementById('images-count').textContent = `${this.count}件`;
+        document.getElementById('no-images-message').classList.toggle('d-none', this.count > 0);
+        this.viewport.classList.toggle('d-none', this.count === 0);
+    }
+    
+    scheduleRender() {
+        if (this.renderScheduled) return;
+        this.renderScheduled = true;
+        requestAnimationFrame(() => this.render());
+    }
+    
+    clearRows() {
+        this.renderedRows.forEach(row => row.remove());
+        this.renderedRows.clear();
+    }
+    
+    render() {
+        this.renderScheduled = false;
+        
+        const columns = this.columns;
+        const rowHeight = this.rowHeight;
+        const totalRows = Math.ceil(this.count / columns);
+        this.spacer.style.height = (totalRows * rowHeight) + 'px';
+        
+        // 表示範囲（前後に少し余分に描画してスクロール時のちらつきを防ぐ）
+        const scrollTop = this.viewport.scrollTop;
+        const firstRow = Math.max(0, Math.floor(scrollTop / rowHeight) - IMAGE_OVERSCAN_ROWS);
+        const lastRow = Math.min(totalRows - 1,
+            Math.ceil((scrollTop + this.viewport.clientHeight) / rowHeight) + IMAGE_OVERSCAN_ROWS);
+        
+        // 範囲外になった行を削除
+        this.renderedRows.forEach((row, index) => {
+            if (index < firstRow || index > lastRow) {
+                row.remove();
+                this.renderedRows.delete(index);
+            }
+        });
+        
+        let needsMore = false;
+        for (let index = firstRow; index <= lastRow; index++) {
+            if (this.renderedRows.has(index)) continue;
+            
+            const start = index * columns;
+            const end = Math.min(start + columns, this.count);
+            if (end > this.items.length) {
+                // まだ読み込んでいない行
+                needsMore = true;
+                break;
+            }
+            
+            const row = this.mode === 'list'
+                ? this.buildListRow(this.items[start])
+                : this.buildGridRow(this.items.slice(start, end), columns);
+            row.style.height = rowHeight + 'px';
+            row.style.transform = `translateY(${index * rowHeight}px)`;
+            this.spacer.appendChild(row);
+            this.renderedRows.set(index, row);
+        }
+        
+        if (needsMore && this.nextCursor) {
+            this.loadPage();
+        }
+    }
+    
+    buildGridRow(images, columns) {
+        const row = document.createElement('div');
+        row.className = 'row image-row';
+        const columnClass = columns === 4 ? 'col-3' : 'col-6';
+        row.innerHTML = images.map(image => `
+            <div class="${columnClass} image-item" data-filename="${escapeHtml(image.filename)}" data-annotated="${image.is_annotated}">
+                <div class="card">
+                    <img src="${escapeHtml(image.thumbnail_url)}" class="card-img-top" style="height: 200px; object-fit: cover;" alt="${escapeHtml(image.filename)}">
+                    <div class="card-body">
+                        <h6 class="card-title text-truncate" title="${escapeHtml(image.filename)}">${escapeHtml(image.filename)}</h6>
+                        <p class="card-text">
+                            <small class="text-muted">${image.width}x${image.height}</small>
+                            ${statusBadge(image.is_annotated)}
+                        </p>
+                        <a href="${escapeHtml(image.annotate_url)}" class="btn btn-primary btn-sm">アノテーション</a>
+                    </div>
+                </div>
+            </div>
+        `).join('');
+        return row;
+    }
+    
+    buildListRow(image) {
+        const row = document.createElement('div');
+        row.className = 'list-group-item image-row image-item';
+        row.dataset.filename = image.filename;
+        row.dataset.annotated = image.is_annotated;
+        row.innerHTML = `
+            <div class="row align-items-center">
+                <div class="col-2">
+                    <img src="${escapeHtml(image.list_thumbnail_url)}" class="img-thumbnail" style="height: 80px; width: 80px; object-fit: cover;" alt="${escapeHtml(image.filename)}">
+                </div>
+                <div class="col-6">
+                    <h6 class="mb-1 text-truncate" title="${escapeHtml(image.filename)}">${escapeHtml(image.filename)}</h6>
+                    <p class="mb-1">
+                        <small class="text-muted">サイズ: ${image.width}x${image.height}</small>
+                    </p>
+                </div>
+                <div class="col-2">${statusBadge(image.is_annotated)}</div>
+                <div class="col-2">
+                    <a href="${escapeHtml(image.annotate_url)}" class="btn btn-primary btn-sm">アノテーション</a>
+                </div>
+            </div>
+        `;
+        return row;
+    }
+}
+
+// 画像一覧の行の高さ（CSSの .image-row と合わせる）
+const IMAGE_GRID_ROW_HEIGHT = 330;
+const IMAGE_LIST_ROW_HEIGHT = 104;
+const IMAGE_OVERSCAN_ROWS = 2;
+
+function statusBadge(isAnnotated) {
+    return isAnnotated
+        ? '<span class="badge bg-success">完了</span>'
+        : '<span class="badge bg-danger">未完了</span>';
+}
+
+function escapeHtml(value) {
+    return String(value)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
+// 画像一覧と絞り込みの初期化
+function initImageIndex() {
+    const viewport = document.getElementById('images-viewport');
+    const imageIndex = new ImageIndex(viewport, parseInt(viewport.dataset.pageSize) || 200);
+    
+    const prefixInput = document.getElementById('filter-prefix');
+    const annotatedSelect = document.getElementById('filter-annotated');
+    const labelSelect = document.getElementById('filter-label');
+    
+    const applyFilters = () => {
+        imageIndex.setFilters({
+            prefix: prefixInput.value.trim(),
+            annotated: annotatedSelect.value,
+            label: labelSelect.value
+        });
+    };
+    
+    // ファイル名の入力は少し待ってからまとめて反映
+    let prefixTimer = null;
+    prefixInput.addEventListener('input', () => {
+        clearTimeout(prefixTimer);
+        prefixTimer = setTimeout(applyFilters, 300);
+    });
+    annotatedSelect.addEventListener('change', applyFilters);
+    labelSelect.addEventListener('change', applyFilters);
+    
+    return { imageIndex, applyFilters };
+}
+
 // 表示切り替え機能の初期化
-function initViewToggle() {
+function initViewToggle(imageIndex) {
     const gridViewBtn = document.getElementById('grid-view-btn');
     const listViewBtn = document.getElementById('list-view-btn');
-    const imagesGrid = document.getElementById('images-grid');
-    const imagesList = document.getElementById('images-list');
     
     // 初期状態：グリッド表示をアクティブに
     let currentView = localStorage.getItem('imageViewMode') || 'grid';
@@ -356,10 +690,8 @@ function initViewToggle() {
         gridViewBtn.classList.add('active');
         listViewBtn.classList.remove('active');
         
-        // 表示を切り替え
-        imagesGrid.classList.remove('d-none');
-        imagesList.classList.add('d-none');
-        
+        imageIndex.viewport.classList.remove('list-group');
+        imageIndex.setMode('grid');
         currentView = 'grid';
     }
     
@@ -368,14 +700,51 @@ function initViewToggle() {
         listViewBtn.classList.add('active');
         gridViewBtn.classList.remove('active');
         
-        // 表示を切り替え
-        imagesGrid.classList.add('d-none');
-        imagesList.classList.remove('d-none');
-        
+        imageIndex.viewport.classList.add('list-group');
+        imageIndex.setMode('list');
         currentView = 'list';
     }
 }
 
+// ジョブが終了するまで進捗をポーリングする
+// 成功時は完了したジョブを返し、失敗時はエラーメッセージでrejectする
+function pollJob(jobId, onProgress, interval = 1000) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(`/api/jobs/${jobId}/`)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status !== 'success') {
+                        throw new Error(data.message);
+                    }
+                    const job = data.job;
+                    if (job.status === 'success') {
+                        resolve(job);
+                    } else if (job.status === 'error') {
+                        reject(new Error(job.message));
+                    } else {
+                        if (onProgress) onProgress(job);
+                        setTimeout(poll, interval);
+                    }
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
+// ジョブの進捗を表示用の文字列に変換
+function formatJobProgress(job) {
+    if (job.status === 'pending') {
+        return '(待機中)';
+    }
+    if (!job.progress_total) {
+        return '';
+    }
+    const percent = Math.floor(job.progress_done / job.progress_total * 100);
+    return `${job.progress_done}/${job.progress_total} (${percent}%)`;
+}
+
 // CSRFトークンを取得する関数
 function getCookie(name) {
     let cookieValue = null;
@@ -0,0 +1,176 @@
+"""
+ファイルのストリーミング配信
+ファイル全体をメモリに読み込まず、固定サイズのチャンク単位で送信します。
+HTTP Range リクエスト（単一範囲）と、Webサーバーへの配信委譲（X-Accel-Redirect / X-Sendfile）に対応します。
+ASGIで動作している場合は、ファイルの読み込みをスレッドに逃がす非同期イテレータで送信します
+（同期イテレータのままだとDjangoがファイル全体をメモリに読み込んでから送信するため）。
+"""
+import asyncio
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(path):
+    """更新時刻とサイズからETagを作成"""
+    return stat_etag(os.stat(path))
+
+
+def stat_etag(stat):
+    """os.stat の結果からETagを作成"""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """Rangeヘッダーを解析して (開始, 終了) を返す
+
+    ヘッダーがない・複数範囲など対応しない形式の場合は None（全体を返す）、
+    範囲がファイルサイズを超える場合は ValueError を送出します。
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if size == 0:
+        # 空のファイルにはどの範囲も存在しない
+        raise ValueError('range not satisfiable')
+    if not start:
+        # bytes=-500 （末尾から500バイト）
+        length = int(end)
+        if length == 0:
+            raise ValueError('empty suffix range')
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('range not satisfiable')
+    return start, end
+
+
+def _iter_range(f, start, length):
+    """ファイルの指定範囲をチャンク単位で読み出す"""
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def _aiter_range(path, start, length):
+    """ファイルの指定範囲をチャンク単位で読み出す（ファイル操作はスレッドで実行）"""
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def _aiter_in_thread(iterator):
+    """同期イテレータ（ジェネレーター）をスレッドで1つずつ進める非同期イテレータ"""
+    sentinel = object()
+    try:
+        while (chunk := await asyncio.to_thread(next, iterator, sentinel)) is not sentinel:
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close:
+            await asyncio.to_thread(close)
+
+
+def stream_iterator(request, iterator, content_type='application/octet-stream'):
+    """ジェネレーターが作成するデータをそのまま送信するレスポンスを作成
+
+    ASGIではジェネレーターをスレッドで進める非同期イテレータに包み、全体をメモリに溜めずに送信します。
+    """
+    iterator = iter(iterator)
+    if isinstance(request, ASGIRequest):
+        iterator = _aiter_in_thread(iterator)
+    return StreamingHttpResponse(iterator, content_type=content_type)
+
+
+def stream_file(request, path, etag=None, sendfile_path=None, size=None):
+    """ファイルをストリーミング配信するレスポンスを作成
+
+    sendfile_path は IMAGE_SENDFILE_BACKEND が有効な場合にWebサーバーへ渡すパス（base_imagesからの相対パス）です。
+    size を省略した場合はファイルサイズを取得します。
+    """
+    content_type, _ = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+
+    # Webサーバーに配信を委譲（Range・条件付きリクエストもWebサーバー側で処理される）
+    backend = getattr(settings, 'IMAGE_SENDFILE_BACKEND', None)
+    if backend and sendfile_path is not None:
+        response = HttpResponse(content_type=content_type)
+        if backend == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.IMAGE_SENDFILE_URL_PREFIX + quote(sendfile_path)
+        elif backend == 'x-sendfile':
+            response['X-Sendfile'] = path
+        else:
+            raise ValueError(f'未知の IMAGE_SENDFILE_BACKEND です: {backend}')
+        return response
+
+    if size is None:
+        size = os.path.getsize(path)
+
+    # If-Range が現在のETagと一致しない（ETagがなく確認できない）場合は範囲指定を無視して全体を返す
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if isinstance(request, ASGIRequest):
+        start, end = byte_range or (0, size - 1)
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _aiter_range(path, start, length),
+            status=200 if byte_range is None else 206, content_type=content_type
+        )
+        response['Content-Length'] = str(length)
+        if byte_range is not None:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _iter_range(open(path, 'rb'), start, length),
+            status=206, content_type=content_type
+        )
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
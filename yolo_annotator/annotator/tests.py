@@ -1,3 +1,1447 @@
-from django.test import TestCase
+import importlib.util
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import archive, export_cache, jobs, thumbnails, tiles, views
+from .db import sqlite_status
+from .export import BOX_DTYPE, export_dataset, iter_image_boxes, transform_boxes
+from .formats import YoloWriter
+from .splitting import assign_splits, fetch_strata, split_images
+from .importer import import_yolo
+from .ingest import load_base_images, read_image_size
+from .models import Annotation, ImageFile, Job, Label, ScanEntry
+
+
+def _box(label, **overrides):
+    data = {'label_id': label.id, 'x_center': 0.5, 'y_center': 0.5, 'width': 0.2, 'height': 0.2}
+    data.update(overrides)
+    return data
+
+
+class TempDirMixin:
+    """テストごとに一時フォルダ（self.tmpdir）を作成し、temp_settings の設定を上書きして実行する"""
+
+    def temp_settings(self):
+        """self.tmpdir の中を指すように上書きする設定"""
+        return {}
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        settings_override = override_settings(**self.temp_settings())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class QueryCountTests(TestCase):
+    """主要な画面・APIのクエリ数がデータ件数に比例しない（N+1にならない）ことを確認"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.labels = [Label.objects.create(name=f'label{i}') for i in range(3)]
+        cls.images = [
+            ImageFile.objects.create(filename=f'img{i:03d}.jpg', width=640, height=480)
+            for i in range(20)
+        ]
+        Annotation.objects.bulk_create([
+            Annotation(image=image, label=cls.labels[j % 3], x_center=0.5, y_center=0.5, width=0.1, height=0.1)
+            for image in cls.images[:10]
+            for j in range(5)
+        ])
+        ImageFile.objects.filter(id__in=[image.id for image in cls.images[:10]]).update(is_annotated=True)
+        ImageFile.refresh_annotation_counts()
+        Label.refresh_usage_counts()
+
+    def test_index(self):
+        # ラベル一覧・画像数の集計
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('annotator:index'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_annotate(self):
+        # 画像・次の画像・前の画像・ラベル一覧・アノテーション（ラベルを結合）
+        image = self.images[5]
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('annotator:annotate', args=[image.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'label0')
+
+    def test_image_workspace(self):
+        # 画像と次の画像・前の画像・アノテーション
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('annotator:image_workspace', args=[self.images[5].id]))
+        self.assertEqual(len(response.json()['annotations']), 5)
+
+    def test_save_annotations(self):
+        # 画像・ラベル・旧アノテーションのラベル集計・削除・一括作成・ラベル使用回数・画像の更新
+        # （トランザクションのSAVEPOINT/RELEASEを含む）
+        image = self.images[0]
+        payload = {'annotations': [_box(self.labels[i % 3]) for i in range(30)]}
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                reverse('annotator:save_annotations', args=[image.id]),
+                data=json.dumps(payload), content_type='application/json'
+            )
+        self.assertEqual(response.json()['status'], 'success')
+
+    def test_split_dataset(self):
+        # 対象画像の有無の確認とジョブの登録
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                reverse('annotator:split_dataset'),
+                data=json.dumps({'split_ratio': 0.8, 'image_size': 64}), content_type='application/json'
+            )
+        self.assertEqual(response.json()['status'], 'success')
+
+
+class SqliteTuningTests(TempDirMixin, SimpleTestCase):
+    """SQLiteの接続を作成するたびに SQLITE_PRAGMAS が適用されることを確認"""
+
+    def open_connection(self):
+        # テスト用のデータベースはメモリ上にあるため、WALを使えるファイルのデータベースに別の接続を作る
+        wrapper = SQLiteDatabaseWrapper(
+            {**connection.settings_dict, 'NAME': str(self.tmpdir / 'pragma.sqlite3')}, alias='pragma_test'
+        )
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    @override_settings(SQLITE_PRAGMAS={
+        'journal_mode': 'WAL', 'busy_timeout': 20000, 'synchronous': 'NORMAL', 'mmap_size': 268435456,
+    })
+    def test_pragmas_applied_on_connect(self):
+        self.assertEqual(sqlite_status(self.open_connection()), {
+            'journal_mode': 'wal', 'busy_timeout': 20000, 'synchronous': 1, 'mmap_size': 268435456,
+        })
+
+    @override_settings(SQLITE_PRAGMAS={})
+    def test_tuning_disabled(self):
+        status = sqlite_status(self.open_connection())
+        self.assertEqual((status['journal_mode'], status['synchronous']), ('delete', 2))
+
+
+class ExportQueryCountTests(TempDirMixin, TestCase):
+    """データセット出力のクエリ数が画像数・アノテーション数に依存しないことを確認"""
+
+    def temp_settings(self):
+        return dict(
+            PROJECT_ROOT=self.tmpdir, BASE_IMAGES_DIR=self.tmpdir / 'base_images',
+            EXPORT_CACHE_DIR=self.tmpdir / 'cache',
+        )
+
+    def setUp(self):
+        super().setUp()
+        base_images = self.tmpdir / 'base_images'
+        os.makedirs(base_images)
+        label = Label.objects.create(name='object')
+        for i in range(12):
+            filename = f'img{i:02d}.png'
+            Image.new('RGB', (80, 60), (i * 10, 0, 0)).save(base_images / filename)
+            image = ImageFile.objects.create(filename=filename, width=80, height=60, is_annotated=True)
+            Annotation.objects.bulk_create([
+                Annotation(image=image, label=label, x_center=0.5, y_center=0.5, width=0.2, height=0.2)
+                for _ in range(3)
+            ])
+
+    def test_export_dataset(self):
+        # 対象画像・全アノテーション・YAML用のラベル一覧
+        with self.assertNumQueries(3):
+            result = export_dataset(split_ratio=0.75, target_size=32, workers=1)
+        self.assertEqual(result['train_count'] + result['valid_count'], 12)
+
+    def test_export_beyond_sqlite_variable_limit(self):
+        # 画像IDを並べた IN 句は画像数が SQLite の変数の上限を超えると失敗するため、結合で絞り込んでいることを確認
+        connection.ensure_connection()
+        raw = connection.connection
+        limit = raw.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        raw.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 8)
+        self.addCleanup(raw.setlimit, sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit)
+
+        result = export_dataset(split_ratio=0.75, target_size=32, workers=1, stratify=True)
+        self.assertEqual(result['train_count'] + result['valid_count'], 12)
+        self.assertEqual(result['report']['counters']['boxes'], 36)
+
+    def test_process_pool_matches_single_process(self):
+        outputs = []
+        for workers in (1, 2):
+            with mock.patch('annotator.export.datetime') as mock_datetime:
+                mock_datetime.now.return_value.strftime.return_value = f'workers{workers}'
+                result = export_dataset(split_ratio=0.75, target_size=32, workers=workers, use_cache=False)
+            output_dir = Path(result['output_dir'])
+            outputs.append({
+                str(path.relative_to(output_dir)): path.read_bytes()
+                for path in sorted(output_dir.rglob('*')) if path.is_file() and path.parts[-2] != output_dir.name
+            })
+        self.assertEqual(len(outputs[0]), 24)
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_export_command(self):
+        out = io.StringIO()
+        call_command('export_dataset', split_ratio=0.5, image_size=32, workers=1, stdout=out)
+        self.assertRegex(out.getvalue(), r'Exported yolo dataset .*\(12 encoded, 0 reused from cache\)')
+        ImageFile.objects.update(is_annotated=False)
+        with self.assertRaises(CommandError):
+            call_command('export_dataset', workers=1, stdout=io.StringIO())
+
+    def test_repeat_export_reuses_cache(self):
+        first = export_dataset(split_ratio=0.75, target_size=32, workers=1)
+        self.assertEqual((first['encoded_count'], first['cached_count']), (12, 0))
+
+        # 変更のない画像は再エンコードせず、キャッシュの同じファイルをリンクする
+        with mock.patch('annotator.export.datetime') as mock_datetime:
+            mock_datetime.now.return_value.strftime.return_value = 'repeat'
+            second = export_dataset(split_ratio=0.75, target_size=32, workers=1)
+        self.assertEqual((second['encoded_count'], second['cached_count']), (0, 12))
+        for split in ('train', 'valid'):
+            for name in os.listdir(Path(second['output_dir']) / 'images' / split):
+                self.assertEqual(os.stat(Path(second['output_dir']) / 'images' / split / name).st_nlink, 3)
+
+    def test_evict_keeps_files_being_written(self):
+        export_dataset(split_ratio=0.75, target_size=32, workers=1)
+        # 別のエクスポートが同じキーの画像を書き込んでいる途中に容量超過で削除処理が走る
+        meta_path = next((self.tmpdir / 'cache').rglob('*.json'))
+        key = meta_path.stem
+        result = (tuple(value) for value in json.loads(meta_path.read_text()).values())
+        dst_path = str(self.tmpdir / 'image.jpg')
+        tmp_path = export_cache.temp_path(key, dst_path)
+        Path(tmp_path).write_bytes(b'encoding')
+
+        self.assertEqual(export_cache.evict(max_bytes=0), 12)
+        self.assertEqual(export_cache.cache_usage(), 0)
+        self.assertTrue(os.path.exists(tmp_path))
+        export_cache.store(key, dst_path, tmp_path, tuple(result))
+        self.assertIsNotNone(export_cache.lookup(key, dst_path))
+        self.assertEqual(Path(dst_path).read_bytes(), b'encoding')
+
+    def test_cache_smaller_than_one_image(self):
+        # 登録した直後の削除処理でキャッシュから消えても、出力フォルダには配置済み
+        with override_settings(EXPORT_CACHE_MAX_BYTES=10):
+            result = export_dataset(split_ratio=0.75, target_size=32, workers=1)
+        self.assertEqual(result['encoded_count'], 12)
+        for split in ('train', 'valid'):
+            for name in os.listdir(Path(result['output_dir']) / 'images' / split):
+                with Image.open(Path(result['output_dir']) / 'images' / split / name) as img:
+                    self.assertEqual(img.size, (32, 32))
+
+    def test_entry_evicted_after_lookup(self):
+        export_dataset(split_ratio=0.75, target_size=32, workers=1)
+        lookup = export_cache.lookup
+
+        def lookup_then_evict(*args, **kwargs):
+            # 確認した直後に、他のエクスポートの削除処理でキャッシュが空になる
+            cached = lookup(*args, **kwargs)
+            export_cache.evict(max_bytes=0)
+            return cached
+
+        with mock.patch('annotator.export.datetime') as mock_datetime, \
+                mock.patch('annotator.export_cache.lookup', side_effect=lookup_then_evict):
+            mock_datetime.now.return_value.strftime.return_value = 'evicted'
+            result = export_dataset(split_ratio=0.75, target_size=32, workers=1)
+        self.assertEqual((result['encoded_count'], result['cached_count']), (12, 0))
+        self.assertEqual(len(list((Path(result['output_dir']) / 'images').rglob('*.png'))), 12)
+
+    def test_export_all_formats(self):
+        # 画像の変換は1回で、全形式を書き出してもクエリ数は変わらない
+        with self.assertNumQueries(3):
+            result = export_dataset(split_ratio=0.75, target_size=32, workers=1, formats=('yolo', 'coco', 'voc'))
+        self.assertEqual(result['encoded_count'], 12)
+        output_dir = Path(result['output_dir'])
+        self.assertTrue((output_dir / result['yaml_filename']).exists())
+
+        for split, count in (('train', result['train_count']), ('valid', result['valid_count'])):
+            coco = json.loads((output_dir / 'annotations' / f'instances_{split}.json').read_text(encoding='utf-8'))
+            self.assertEqual(len(coco['images']), count)
+            self.assertEqual(len(coco['annotations']), count * 3)
+            self.assertEqual([category['name'] for category in coco['categories']], ['object'])
+            # 80x60の画像を32x32に縮小すると 32x24、中央の 0.2x0.2 のボックスは 6.4x4.8
+            self.assertEqual(coco['annotations'][0]['bbox'], [12.8, 9.6, 6.4, 4.8])
+
+            stems = (output_dir / 'ImageSets' / 'Main' / f'{split}.txt').read_text(encoding='utf-8').split()
+            self.assertEqual(len(stems), count)
+            xml = ElementTree.parse(output_dir / 'Annotations' / f'{stems[0]}.xml').getroot()
+            self.assertEqual(len(xml.findall('object')), 3)
+            self.assertEqual(
+                [xml.find(f'object/bndbox/{key}').text for key in ('xmin', 'ymin', 'xmax', 'ymax')],
+                ['14', '11', '19', '14']
+            )
+
+    def test_letterbox_options(self):
+        # 中央に配置してPNGで出力すると、ファイル名と座標もそれに合わせて出力される
+        result = export_dataset(split_ratio=0.75, target_size=32, workers=1, formats=('yolo', 'coco'), letterbox={
+            'padding': 'center', 'fill': '#727272', 'output_format': 'png', 'resample': 'bilinear', 'draft': False,
+        })
+        output_dir = Path(result['output_dir'])
+        coco = json.loads((output_dir / 'annotations' / 'instances_train.json').read_text(encoding='utf-8'))
+        file_name = coco['images'][0]['file_name']
+        self.assertTrue(file_name.endswith('.png'))
+        with Image.open(output_dir / 'images' / 'train' / file_name) as img:
+            self.assertEqual(img.format, 'PNG')
+            # 80x60 → 32x24 を上下4ピクセルずつパディング
+            self.assertEqual(img.getpixel((0, 0)), (0x72, 0x72, 0x72))
+            self.assertEqual(img.getpixel((0, 31)), (0x72, 0x72, 0x72))
+        self.assertEqual(coco['annotations'][0]['bbox'], [12.8, 13.6, 6.4, 4.8])
+        label_file = output_dir / 'labels' / 'train' / (os.path.splitext(file_name)[0] + '.txt')
+        self.assertEqual(label_file.read_text().splitlines()[0], f'{Label.objects.get().id} 0.500000 0.500000 0.200000 0.150000')
+
+        with self.assertRaises(ValueError):
+            export_dataset(target_size=32, workers=1, letterbox={'resample': 'unknown'})
+
+    def test_benchmark_letterbox_command(self):
+        out = io.StringIO()
+        call_command('benchmark_letterbox', images=3, image_size=32, modes=['bilinear-draft'], stdout=out)
+        rows = {line.split()[0]: line.split() for line in out.getvalue().splitlines()[2:-1]}
+        self.assertEqual(sorted(rows), ['bilinear-draft', 'reference'])
+        # 基準と同じ画像同士のPSNRは inf
+        self.assertEqual(rows['reference'][4], 'inf')
+
+    def test_timing_report(self):
+        result = export_dataset(split_ratio=0.75, target_size=32, workers=1)
+        report_path = Path(result['output_dir']) / result['report_filename']
+        self.assertEqual(json.loads(report_path.read_text(encoding='utf-8'))['report'], result['report'])
+
+        report = result['report']
+        self.assertEqual(
+            list(report['stages']),
+            ['select', 'split', 'transform_images', 'fetch_boxes', 'transform_boxes', 'write_labels', 'write_manifest']
+        )
+        # クエリは実行した段階に集計される
+        self.assertEqual(sum(stage['queries'] for stage in report['stages'].values()), 3)
+        self.assertEqual(report['stages']['fetch_boxes']['queries'], 2)
+        self.assertEqual(report['counters'], {'images_encoded': 12, 'images_cached': 0, 'boxes': 36})
+        self.assertEqual(report['images']['decode']['count'], 12)
+        self.assertEqual(sum(report['images']['total']['histogram'].values()), 12)
+        self.assertEqual(len(report['outliers']), 10)
+        self.assertGreater(report['bytes']['images_read'], 0)
+        self.assertGreater(report['bytes']['labels_written'], 0)
+
+    def test_dry_run_writes_nothing(self):
+        export_dataset(split_ratio=0.75, target_size=32, workers=1)
+        cache_files = sorted(path for path in (self.tmpdir / 'cache').rglob('*'))
+        cache_mtimes = [path.stat().st_mtime_ns for path in cache_files]
+        outputs = os.listdir(self.tmpdir / 'output')
+
+        result = export_dataset(split_ratio=0.75, target_size=32, workers=2, dry_run=True, sample_size=4,
+                                formats=('yolo', 'coco'))
+        self.assertEqual(os.listdir(self.tmpdir / 'output'), outputs)
+        self.assertEqual(sorted(path for path in (self.tmpdir / 'cache').rglob('*')), cache_files)
+        self.assertEqual([path.stat().st_mtime_ns for path in cache_files], cache_mtimes)
+
+        self.assertTrue(result['dry_run'])
+        self.assertEqual(result['train_count'] + result['valid_count'], 12)
+        # 各分割から枚数に比例して抽出（端数は切り上げ）
+        self.assertIn(result['sample_count'], (4, 5))
+        # 全ての画像がキャッシュ済みなので変換は不要
+        self.assertEqual((result['cache_hit_ratio'], result['estimated_encoded_count']), (1.0, 0))
+        self.assertEqual(set(result['estimated_output_bytes']) - {'images', 'labels', 'annotations'}, {'dataset_32x32_dry_run.yaml'})
+        self.assertGreater(result['estimated_output_bytes']['images'], 0)
+        self.assertEqual(result['estimated_stage_seconds']['transform_images'], 0)
+
+
+class CounterTests(TestCase):
+    """ImageFile.annotation_count と Label.usage_count が保存のたびに更新されることを確認"""
+
+    def setUp(self):
+        self.label_a = Label.objects.create(name='a')
+        self.label_b = Label.objects.create(name='b')
+        self.image = ImageFile.objects.create(filename='x.jpg', width=100, height=100)
+
+    def assertCounts(self, image_count, a_count, b_count):
+        self.image.refresh_from_db()
+        self.label_a.refresh_from_db()
+        self.label_b.refresh_from_db()
+        self.assertEqual(
+            (self.image.annotation_count, self.label_a.usage_count, self.label_b.usage_count),
+            (image_count, a_count, b_count)
+        )
+
+    def test_save_annotations_replaces_counts(self):
+        url = reverse('annotator:save_annotations', args=[self.image.id])
+        payload = {'annotations': [_box(self.label_a), _box(self.label_a), _box(self.label_b)]}
+        self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertCounts(3, 2, 1)
+
+        payload = {'annotations': [_box(self.label_b)]}
+        self.client.post(url, data=json.dumps(payload), content_type='application/json')
+        self.assertCounts(1, 0, 1)
+
+    def test_delta_api_updates_counts(self):
+        url = reverse('annotator:annotations_api', args=[self.image.id])
+        response = self.client.post(url, data=json.dumps({
+            'added': [_box(self.label_a, client_id=1), _box(self.label_a, client_id=2)]
+        }), content_type='application/json')
+        id_map = response.json()['id_map']
+        self.assertCounts(2, 2, 0)
+
+        self.client.post(url, data=json.dumps({
+            'updated': [_box(self.label_b, id=id_map['1'])],
+            'deleted': [id_map['2']],
+        }), content_type='application/json')
+        self.assertCounts(1, 0, 1)
+
+    def test_model_save_and_delete(self):
+        annotation = Annotation.objects.create(
+            image=self.image, label=self.label_a, x_center=0.5, y_center=0.5, width=0.1, height=0.1
+        )
+        self.assertCounts(1, 1, 0)
+
+        annotation.label = self.label_b
+        annotation.save()
+        self.assertCounts(1, 0, 1)
+
+        annotation.delete()
+        self.assertCounts(0, 0, 0)
+
+    def test_image_delete_releases_label_usage(self):
+        Annotation.objects.create(image=self.image, label=self.label_a, x_center=0.5, y_center=0.5, width=0.1, height=0.1)
+        self.image.delete()
+        self.label_a.refresh_from_db()
+        self.assertEqual(self.label_a.usage_count, 0)
+
+    def test_refresh_counters(self):
+        Annotation.objects.bulk_create([
+            Annotation(image=self.image, label=self.label_b, x_center=0.5, y_center=0.5, width=0.1, height=0.1)
+            for _ in range(4)
+        ])
+        ImageFile.refresh_annotation_counts()
+        Label.refresh_usage_counts()
+        self.assertCounts(4, 0, 4)
+
+
+class AnnotationsApiTests(TestCase):
+    """アノテーションの差分保存API（追加・変更・削除と id_map、入力の検証）を確認"""
+
+    def setUp(self):
+        self.label_a = Label.objects.create(name='a')
+        self.label_b = Label.objects.create(name='b')
+        self.image = ImageFile.objects.create(filename='x.jpg', width=100, height=100)
+        self.other_image = ImageFile.objects.create(filename='y.jpg', width=100, height=100)
+        self.url = reverse('annotator:annotations_api', args=[self.image.id])
+
+    def post(self, payload, url=None):
+        body = payload if isinstance(payload, str) else json.dumps(payload)
+        return self.client.post(url or self.url, data=body, content_type='application/json')
+
+    def boxes(self, image=None):
+        return list(
+            Annotation.objects.filter(image=image or self.image).order_by('id')
+            .values_list('id', 'label_id', 'x_center')
+        )
+
+    def test_add_update_delete(self):
+        response = self.post({'added': [
+            _box(self.label_a, client_id='tmp-1', x_center=0.1),
+            _box(self.label_b, client_id='tmp-2', x_center=0.2),
+            _box(self.label_a, x_center=0.3),
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        created = [ann_id for ann_id, _, _ in self.boxes()]
+        self.assertEqual(data['id_map'], {'tmp-1': created[0], 'tmp-2': created[1]})
+        self.assertEqual([row['id'] for row in data['annotations']], created)
+        self.assertEqual(data['annotations'][1]['label_name'], 'b')
+
+        response = self.post({
+            'updated': [_box(self.label_b, id=created[0], x_center=0.9)],
+            'deleted': [created[1]],
+        })
+        self.assertEqual(response.json()['id_map'], {})
+        self.assertEqual(self.boxes(), [(created[0], self.label_b.id, 0.9), (created[2], self.label_a.id, 0.3)])
+        self.image.refresh_from_db()
+        self.assertTrue(self.image.is_annotated)
+        self.assertEqual(self.image.annotation_count, 2)
+
+        response = self.client.get(self.url)
+        self.assertEqual([row['id'] for row in response.json()['annotations']], [created[0], created[2]])
+
+    def test_ignores_other_images_and_deleted_annotations(self):
+        other = Annotation.objects.create(
+            image=self.other_image, label=self.label_a, x_center=0.5, y_center=0.5, width=0.1, height=0.1
+        )
+        response = self.post({
+            'updated': [_box(self.label_b, id=other.id), _box(self.label_b, id=99999)],
+            'deleted': [other.id, 99999],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.boxes(self.other_image), [(other.id, self.label_a.id, 0.5)])
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.annotation_count, 0)
+
+    def test_invalid_requests(self):
+        existing, removable = (
+            Annotation.objects.create(
+                image=self.image, label=self.label_a, x_center=x_center, y_center=0.5, width=0.1, height=0.1
+            )
+            for x_center in (0.5, 0.6)
+        )
+        for payload in (
+            '{not json',
+            {'added': [_box(self.label_a, label_id=99999)]},
+            {'added': [{'label_id': self.label_a.id, 'x_center': 0.5}]},
+            {'added': [_box(self.label_a, width='wide')]},
+            {'deleted': ['abc']},
+            # 変更の途中で失敗した場合は、先に処理した削除も取り消される
+            {'deleted': [removable.id], 'updated': [{'id': existing.id, 'label_id': self.label_a.id}]},
+        ):
+            response = self.post(payload)
+            self.assertEqual((response.status_code, response.json()['status']), (400, 'error'), payload)
+        self.assertEqual(self.boxes(), [(existing.id, self.label_a.id, 0.5), (removable.id, self.label_a.id, 0.6)])
+        self.assertEqual(self.client.get(reverse('annotator:annotations_api', args=[99999])).status_code, 404)
+
+    def test_autosave_reconcile_round_trip(self):
+        # 自動保存は応答を受け取れなかった送信を、GETの内容と値が一致するかで照合する
+        kept = Annotation.objects.create(
+            image=self.image, label=self.label_a, x_center=0.5, y_center=0.5, width=0.1, height=0.1
+        )
+        sent = _box(self.label_b, client_id=-1, x_center=0.123456789012, y_center=1 / 3, width=0.25, height=0.0625)
+        self.post({'added': [sent], 'deleted': [kept.id]})
+
+        rows = self.client.get(self.url).json()['annotations']
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(
+            {key: rows[0][key] for key in ('label_id', 'x_center', 'y_center', 'width', 'height')},
+            {key: value for key, value in sent.items() if key != 'client_id'}
+        )
+
+        # 照合後の再送（削除済みIDの削除と変更）は何も変えずに成功する
+        response = self.post({'updated': [_box(self.label_a, id=kept.id)], 'deleted': [kept.id]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['annotations'], rows)
+
+        response = self.client.get(reverse('annotator:annotate', args=[self.image.id]))
+        self.assertContains(response, 'id="autosave-status"')
+
+
+class IngestTests(TempDirMixin, TestCase):
+    """base_imagesの再スキャンで、新規・変更されたファイルだけを処理することを確認"""
+
+    def temp_settings(self):
+        return dict(BASE_IMAGES_DIR=self.tmpdir)
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(self.tmpdir / 'sub')
+        Image.new('RGB', (40, 30)).save(self.tmpdir / 'a.jpg')
+        Image.new('RGB', (20, 10)).save(self.tmpdir / 'sub' / 'b.png')
+        (self.tmpdir / 'notes.txt').write_text('not an image')
+
+    def load(self):
+        """取り込みを実行し、(登録件数, ヘッダーを読み込んだファイル) を返す"""
+        read_paths = []
+
+        def record(filepath):
+            read_paths.append(os.path.relpath(filepath, self.tmpdir).replace(os.sep, '/'))
+            return read_image_size(filepath)
+
+        with mock.patch('annotator.ingest.read_image_size', side_effect=record):
+            created = load_base_images()
+        return created, sorted(read_paths)
+
+    def test_rescan(self):
+        self.assertEqual(self.load(), (2, ['a.jpg', 'sub/b.png']))
+        self.assertEqual(
+            sorted(ImageFile.objects.values_list('filename', 'width', 'height')),
+            [('a.jpg', 40, 30), ('sub/b.png', 20, 10)]
+        )
+        # 変更のないファイルはヘッダーも読み込まない
+        self.assertEqual(self.load(), (0, []))
+
+        # 新しいファイルだけを読み込む
+        Image.new('RGB', (8, 8)).save(self.tmpdir / 'sub' / 'c.jpg')
+        self.assertEqual(self.load(), (1, ['sub/c.jpg']))
+
+        # 変更されたファイルはサイズを更新する（新規登録にはしない）
+        Image.new('RGB', (60, 50)).save(self.tmpdir / 'a.jpg')
+        os.utime(self.tmpdir / 'a.jpg', (1, 1))
+        self.assertEqual(self.load(), (0, ['a.jpg']))
+        self.assertEqual(ImageFile.objects.values_list('width', 'height').get(filename='a.jpg'), (60, 50))
+
+        # 消えたファイルは索引から削除する
+        os.remove(self.tmpdir / 'sub' / 'b.png')
+        self.assertEqual(self.load(), (0, []))
+        self.assertEqual(sorted(ScanEntry.objects.values_list('path', flat=True)), ['a.jpg', 'sub/c.jpg'])
+
+    def test_unreadable_file_is_not_registered(self):
+        (self.tmpdir / 'broken.jpg').write_bytes(b'not a jpeg')
+        self.assertEqual(self.load(), (2, ['a.jpg', 'broken.jpg', 'sub/b.png']))
+        self.assertFalse(ImageFile.objects.filter(filename='broken.jpg').exists())
+        self.assertEqual(self.load(), (0, []))
+
+
+class ImageListTests(TestCase):
+    """画像一覧APIのカーソルページングの境界と不正なパラメータを確認"""
+
+    def setUp(self):
+        label = Label.objects.create(name='object')
+        for i in range(5):
+            image = ImageFile.objects.create(filename=f'dir/img{i}.jpg', width=10, height=10, is_annotated=i % 2 == 0)
+            if i == 4:
+                Annotation.objects.create(image=image, label=label, **_box(label))
+        self.label = label
+        self.url = reverse('annotator:image_list')
+
+    def fetch_all(self, **params):
+        pages = []
+        cursor = None
+        while True:
+            data = self.client.get(self.url, {**params, **({'cursor': cursor} if cursor else {})}).json()
+            pages.append(data)
+            cursor = data['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_image_once(self):
+        for limit, page_count in ((2, 3), (5, 1), (4, 2), (1, 5)):
+            pages = self.fetch_all(limit=limit)
+            self.assertEqual(len(pages), page_count)
+            filenames = [image['filename'] for page in pages for image in page['images']]
+            self.assertEqual(filenames, [f'dir/img{i}.jpg' for i in range(5)])
+            # 件数は先頭ページのみ
+            self.assertEqual([page['count'] for page in pages], [5] + [None] * (page_count - 1))
+
+    def test_filters(self):
+        pages = self.fetch_all(limit=1, annotated='true')
+        self.assertEqual([page['images'][0]['filename'] for page in pages], ['dir/img0.jpg', 'dir/img2.jpg', 'dir/img4.jpg'])
+        data = self.client.get(self.url, {'label': self.label.id}).json()
+        self.assertEqual([image['filename'] for image in data['images']], ['dir/img4.jpg'])
+        self.assertEqual(self.client.get(self.url, {'prefix': 'other/'}).json()['images'], [])
+
+    def test_invalid_limit(self):
+        for limit in ('0', '-3'):
+            response = self.client.get(self.url, {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['images']), 1)
+            self.assertIsNotNone(response.json()['next_cursor'])
+        for params in ({'limit': 'abc'}, {'limit': '1.5'}, {'label': 'x'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+@override_settings(ANNOTATION_PREFETCH_COUNT=3, TILED_VIEW_MIN_SIDE=8192)
+class WorkspaceTests(TestCase):
+    """アノテーション画面の前後の画像と、先読みする画像の一覧を確認"""
+
+    def setUp(self):
+        self.images = [
+            ImageFile.objects.create(filename=f'img{i}.jpg', width=640, height=480) for i in range(6)
+        ]
+        # タイル表示する巨大画像は元画像を先読みしない
+        ImageFile.objects.filter(id=self.images[3].id).update(width=10000, height=8000)
+
+    def test_annotate_prefetch_targets(self):
+        response = self.client.get(reverse('annotator:annotate', args=[self.images[1].id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['id'], item['url']) for item in response.context['prefetch_images']],
+            [
+                (self.images[2].id, reverse('annotator:serve_image', args=['img2.jpg'])),
+                (self.images[3].id, None),
+                (self.images[4].id, reverse('annotator:serve_image', args=['img4.jpg'])),
+                (self.images[0].id, reverse('annotator:serve_image', args=['img0.jpg'])),
+            ]
+        )
+        self.assertEqual(response.context['next_image']['id'], self.images[2].id)
+        self.assertEqual(response.context['prev_image']['id'], self.images[0].id)
+
+        # 最後の画像は前の画像だけを先読みし、先読みを無効にしても前後の画像へは移動できる
+        response = self.client.get(reverse('annotator:annotate', args=[self.images[5].id]))
+        self.assertEqual([item['id'] for item in response.context['prefetch_images']], [self.images[4].id])
+        with override_settings(ANNOTATION_PREFETCH_COUNT=0):
+            response = self.client.get(reverse('annotator:annotate', args=[self.images[1].id]))
+        self.assertEqual(response.context['prefetch_images'], [])
+        self.assertEqual(response.context['next_image']['id'], self.images[2].id)
+
+
+    def test_workspace_api(self):
+        label = Label.objects.create(name='cat', color='#FF0000')
+        annotation = Annotation.objects.create(
+            image=self.images[2], label=label, x_center=0.5, y_center=0.4, width=0.2, height=0.1
+        )
+        data = self.client.get(reverse('annotator:image_workspace', args=[self.images[2].id])).json()
+        self.assertEqual(data['image'], {
+            'id': self.images[2].id, 'filename': 'img2.jpg', 'width': 640, 'height': 480, 'is_annotated': False,
+            'url': reverse('annotator:serve_image', args=['img2.jpg']), 'tiles': None,
+        })
+        self.assertEqual(data['annotations'], [{
+            'id': annotation.id, 'label_id': label.id, 'x_center': 0.5, 'y_center': 0.4, 'width': 0.2,
+            'height': 0.1, 'label_name': 'cat', 'label_color': '#FF0000',
+        }])
+        self.assertEqual((data['prev_id'], data['next_id']), (self.images[1].id, self.images[3].id))
+        self.assertEqual([item['id'] for item in data['prefetch']],
+                         [self.images[3].id, self.images[4].id, self.images[5].id, self.images[1].id])
+        self.assertEqual(data['annotate_url'], reverse('annotator:annotate', args=[self.images[2].id]))
+
+    def test_workspace_api_edges(self):
+        first = self.client.get(reverse('annotator:image_workspace', args=[self.images[0].id])).json()
+        self.assertEqual((first['prev_id'], first['next_id']), (None, self.images[1].id))
+        last = self.client.get(reverse('annotator:image_workspace', args=[self.images[5].id])).json()
+        self.assertEqual((last['prev_id'], last['next_id']), (self.images[4].id, None))
+
+        # 巨大画像はタイルのURLのテンプレートを返す
+        tiled = self.client.get(reverse('annotator:image_workspace', args=[self.images[3].id])).json()
+        self.assertEqual(tiled['image']['tiles']['url'], '/tiles/{level}/{col}/{row}/img3.jpg')
+
+        # 削除された画像のIDは次の画像を返さずに404
+        deleted_id = self.images[4].id
+        self.images[4].delete()
+        response = self.client.get(reverse('annotator:image_workspace', args=[deleted_id]))
+        self.assertEqual((response.status_code, response.json()['status']), (404, 'error'))
+
+
+class StreamingTests(TempDirMixin, TestCase):
+    """画像配信の Range・If-Range・条件付きリクエスト（304）の処理を確認"""
+
+    def temp_settings(self):
+        return dict(
+            BASE_IMAGES_DIR=self.tmpdir, THUMBNAIL_CACHE_DIR=self.tmpdir / 'thumbnails', IMAGE_SENDFILE_BACKEND=None
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(range(256)) * 4
+        (self.tmpdir / 'data.jpg').write_bytes(self.data)
+        (self.tmpdir / 'empty.jpg').write_bytes(b'')
+        self.url = reverse('annotator:serve_image', args=['data.jpg'])
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, **{f'HTTP_{key.upper()}': value for key, value in headers.items()})
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_ranges(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body, response['Accept-Ranges']), (200, self.data, 'bytes'))
+
+        for header, start, end in (('bytes=0-9', 0, 9), ('bytes=1000-', 1000, 1023), ('bytes=-24', 1000, 1023),
+                                   ('bytes=1020-5000', 1020, 1023)):
+            response, body = self.get(range=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(body, self.data[start:end + 1])
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/1024')
+            self.assertEqual(response['Content-Length'], str(end - start + 1))
+
+        for header in ('bytes=1024-', 'bytes=5-2', 'bytes=-0'):
+            response, _ = self.get(range=header)
+            self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */1024'), header)
+        # 複数範囲などの対応しない形式は全体を返す
+        self.assertEqual(self.get(range='bytes=0-1,5-6')[0].status_code, 200)
+
+    def test_empty_file(self):
+        url = reverse('annotator:serve_image', args=['empty.jpg'])
+        self.assertEqual(self.get(url)[0].status_code, 200)
+        for header in ('bytes=-5', 'bytes=0-'):
+            response, _ = self.get(url, range=header)
+            self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */0'), header)
+
+    def test_conditional_requests(self):
+        response, _ = self.get()
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.get(if_none_match=etag)[0].status_code, 304)
+        self.assertEqual(self.get(if_modified_since=last_modified)[0].status_code, 304)
+
+        # If-Range が一致すれば範囲、一致しなければ（更新された場合など）全体を返す
+        self.assertEqual(self.get(range='bytes=0-9', if_range=etag)[0].status_code, 206)
+        response, body = self.get(range='bytes=0-9', if_range='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.data))
+
+    def test_thumbnail_if_range(self):
+        Image.new('RGB', (40, 30)).save(self.tmpdir / 'photo.jpg')
+        url = reverse('annotator:serve_thumbnail', args=[80, 'photo.jpg'])
+        response, full = self.get(url)
+        response, body = self.get(url, range='bytes=0-9', if_range=response['ETag'])
+        self.assertEqual((response.status_code, body), (206, full[:10]))
+        self.assertEqual(self.get(url, range='bytes=0-9', if_range='"stale"')[0].status_code, 200)
+
+    async def test_asgi_range(self):
+        response = await self.async_client.get(self.url, headers={'Range': 'bytes=-24'})
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual((response.status_code, body), (206, self.data[-24:]))
+        response = await self.async_client.get(
+            reverse('annotator:serve_image', args=['empty.jpg']), headers={'Range': 'bytes=-5'}
+        )
+        self.assertEqual(response.status_code, 416)
+
+
+class AsyncViewTests(TempDirMixin, TestCase):
+    """I/O待ちの多い画面・APIが非同期ビューとして動作し、ASGIでも同じ結果を返すことを確認"""
+
+    def temp_settings(self):
+        return dict(BASE_IMAGES_DIR=self.tmpdir, PROJECT_ROOT=self.tmpdir, IMAGE_SENDFILE_BACKEND=None)
+
+    def setUp(self):
+        super().setUp()
+        self.label = Label.objects.create(name='cat')
+        self.image = ImageFile.objects.create(filename='photo.jpg', width=40, height=30)
+        Image.new('RGB', (40, 30)).save(self.tmpdir / 'photo.jpg')
+
+    def test_io_bound_views_are_async(self):
+        for name in ('index', 'image_list', 'annotate', 'image_workspace', 'save_annotations', 'annotations_api',
+                     'load_images', 'split_dataset', 'import_yolo', 'export_list', 'download_export', 'job_list',
+                     'job_status', 'serve_image', 'serve_thumbnail', 'serve_tile'):
+            self.assertTrue(iscoroutinefunction(getattr(views, name)), name)
+
+    async def test_annotations_over_asgi(self):
+        url = reverse('annotator:annotations_api', args=[self.image.id])
+        response = await self.async_client.post(
+            url, data=json.dumps({'added': [_box(self.label, client_id=1)]}), content_type='application/json'
+        )
+        created_id = response.json()['id_map']['1']
+        response = await self.async_client.get(url)
+        self.assertEqual([row['id'] for row in response.json()['annotations']], [created_id])
+        response = await self.async_client.get(reverse('annotator:image_workspace', args=[self.image.id]))
+        self.assertEqual(response.json()['annotations'][0]['label_name'], 'cat')
+
+    async def test_streaming_over_asgi(self):
+        response = await self.async_client.get(reverse('annotator:serve_image', args=['photo.jpg']))
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body, (self.tmpdir / 'photo.jpg').read_bytes())
+
+        # アーカイブの生成もイベントループを止めずにスレッドで進める
+        export_dir = self.tmpdir / 'output' / 'output_20260101_000000'
+        os.makedirs(export_dir)
+        (export_dir / 'data.yaml').write_text('names: [cat]\n')
+        response = await self.async_client.get(
+            reverse('annotator:download_export', args=['20260101_000000']), {'format': 'tar'}
+        )
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body), int(response['Content-Length']))
+        with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+            self.assertEqual(tar.getnames(), ['output_20260101_000000/data.yaml'])
+
+
+class ThumbnailTests(TempDirMixin, TestCase):
+    """サムネイルの作成・キャッシュの再利用・同時作成を確認"""
+
+    def temp_settings(self):
+        return dict(BASE_IMAGES_DIR=self.tmpdir / 'base_images', THUMBNAIL_CACHE_DIR=self.tmpdir / 'thumbnails')
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(self.tmpdir / 'base_images')
+        self.src_path = str(self.tmpdir / 'base_images' / 'photo.jpg')
+        Image.new('RGB', (400, 300), (0, 128, 255)).save(self.src_path)
+
+    def test_create_and_reuse(self):
+        path = thumbnails.get_thumbnail(self.src_path, 80)
+        with Image.open(path) as img:
+            self.assertEqual((img.format, img.size), ('JPEG', (107, 80)))
+        with mock.patch('annotator.thumbnails.make_thumbnail') as make:
+            self.assertEqual(thumbnails.get_thumbnail(self.src_path, 80), path)
+        make.assert_not_called()
+
+        # 元画像が変わるとキーが変わり、作り直される
+        Image.new('RGB', (300, 400)).save(self.src_path)
+        os.utime(self.src_path, ns=(0, 0))
+        with Image.open(thumbnails.get_thumbnail(self.src_path, 80)) as img:
+            self.assertEqual(img.size, (80, 107))
+
+    def test_concurrent_creation(self):
+        # 同じプロセスの2スレッドが同じサムネイルを同時に作成しても、一時ファイルが衝突しない
+        barrier = threading.Barrier(2)
+        make_thumbnail = thumbnails.make_thumbnail
+        tmp_paths = set()
+
+        def slow_make(src_path, dst_path, size):
+            tmp_paths.add(dst_path)
+            barrier.wait(timeout=5)
+            make_thumbnail(src_path, dst_path, size)
+
+        with mock.patch('annotator.thumbnails.make_thumbnail', side_effect=slow_make):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                paths = list(executor.map(lambda _: thumbnails.get_thumbnail(self.src_path, 200), range(2)))
+        self.assertEqual(len(tmp_paths), 2)
+        self.assertEqual(paths[0], paths[1])
+        with Image.open(paths[0]) as img:
+            self.assertEqual(img.size, (267, 200))
+        self.assertEqual([name for name in os.listdir(os.path.dirname(paths[0])) if name.endswith('.tmp')], [])
+
+    def test_view_uses_cache_and_etag(self):
+        url = reverse('annotator:serve_thumbnail', args=[200, 'photo.jpg'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(body[:2], b'\xff\xd8')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(reverse('annotator:serve_thumbnail', args=[123, 'photo.jpg'])).status_code, 404)
+
+
+class TileTests(TempDirMixin, TestCase):
+    """巨大画像のタイルの作成・キャッシュの再利用・配信を確認"""
+
+    def temp_settings(self):
+        return dict(
+            BASE_IMAGES_DIR=self.tmpdir / 'base_images', TILE_CACHE_DIR=self.tmpdir / 'tiles',
+            TILE_SIZE=64, TILED_VIEW_MIN_SIDE=200,
+        )
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(self.tmpdir / 'base_images')
+        self.src_path = str(self.tmpdir / 'base_images' / 'large.jpg')
+        Image.new('RGB', (300, 200), (0, 128, 255)).save(self.src_path)
+
+    def test_create_and_reuse(self):
+        self.assertEqual(tiles.level_count(300, 200), 4)
+        key = tiles.pyramid_key(self.src_path)
+        path = tiles.get_tile(self.src_path, 1, 2, 1)
+        # レベル1は150x100なので、右下のタイルは端の分だけの大きさ
+        with Image.open(path) as img:
+            self.assertEqual((img.format, img.size), ('JPEG', (22, 36)))
+        # 要求したレベルとそれより粗いレベルだけが作成される
+        pyramid_dir = self.tmpdir / 'tiles' / key[:2] / key
+        self.assertEqual(sorted(os.listdir(pyramid_dir)), ['1', '2', '3'])
+
+        with mock.patch('annotator.tiles.make_tile_levels') as make:
+            self.assertEqual(tiles.get_tile(self.src_path, 1, 2, 1), path)
+            tiles.get_tile(self.src_path, 3, 0, 0)
+        make.assert_not_called()
+
+        for level, col, row in ((4, 0, 0), (1, 3, 0), (0, 0, 4)):
+            with self.assertRaises(ValueError):
+                tiles.get_tile(self.src_path, level, col, row)
+
+    def test_locks_are_shared_per_key(self):
+        key = tiles.pyramid_key(self.src_path)
+        self.assertIs(tiles._lock_for(key), tiles._lock_for(key))
+        # 画像の数によらずロックの数は増えない
+        locks = {id(tiles._lock_for(f'{i:040x}')) for i in range(1000)}
+        self.assertLessEqual(len(locks), len(tiles._LOCKS))
+
+    def test_view(self):
+        url = reverse('annotator:serve_tile', args=[0, 4, 3, 'large.jpg'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as img:
+            self.assertEqual(img.size, (44, 8))
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('annotator:serve_tile', args=[0, 5, 0, 'large.jpg'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('annotator:serve_tile', args=[0, 0, 0, 'missing.jpg'])).status_code, 404)
+
+
+class ArchiveTests(TempDirMixin, TestCase):
+    """出力済みデータセットのZIP・tar配信（内容・圧縮方式・Content-Length と実際に送ったバイト数）を確認"""
+
+    def temp_settings(self):
+        return dict(PROJECT_ROOT=self.tmpdir)
+
+    def setUp(self):
+        super().setUp()
+        self.root = self.tmpdir / 'output' / 'output_20260101_000000'
+        os.makedirs(self.root / 'images' / 'train')
+        # ブロック境界の前後のサイズと、PAXヘッダーが必要な長い名前・非ASCIIの名前
+        self.files = {
+            'data.yaml': b'names: [a]\n',
+            'empty.txt': b'',
+            'images/train/511.jpg': b'x' * 511,
+            'images/train/512.jpg': b'y' * 512,
+            'images/train/513.jpg': b'z' * 513,
+            f'images/train/{"long" * 40}.jpg': os.urandom(70000),
+            'images/train/画像.jpg': b'jpeg',
+        }
+        for name, data in self.files.items():
+            (self.root / name).write_bytes(data)
+
+    def test_tar_size_matches_streamed_bytes(self):
+        response = self.client.get(reverse('annotator:download_export', args=['20260101_000000']), {'format': 'tar'})
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertEqual(archive.tar_size(self.root, self.root.name), len(body))
+
+        with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+            extracted = {
+                member.name[len(self.root.name) + 1:]: tar.extractfile(member).read() for member in tar.getmembers()
+            }
+        self.assertEqual(extracted, self.files)
+
+    def test_tar_size_for_each_file(self):
+        for name in self.files:
+            with self.subTest(name=name):
+                root = self.tmpdir / 'single'
+                os.makedirs(root / os.path.dirname(name), exist_ok=True)
+                shutil.copy(self.root / name, root / name)
+                body = b''.join(archive.stream_tar(root, 'single'))
+                self.assertEqual(archive.tar_size(root, 'single'), len(body))
+                shutil.rmtree(root)
+
+
+    def download(self, **params):
+        response = self.client.get(reverse('annotator:download_export', args=['20260101_000000']), params)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_zip_download(self):
+        for compression, expected in (
+            ('auto', lambda name: zipfile.ZIP_STORED if name.endswith('.jpg') else zipfile.ZIP_DEFLATED),
+            ('stored', lambda name: zipfile.ZIP_STORED),
+            ('deflate', lambda name: zipfile.ZIP_DEFLATED),
+        ):
+            response, body = self.download(compression=compression)
+            self.assertEqual(response['Content-Type'], 'application/zip')
+            self.assertEqual(response['Content-Disposition'], 'attachment; filename="output_20260101_000000.zip"')
+            with zipfile.ZipFile(io.BytesIO(body)) as archive_file:
+                self.assertIsNone(archive_file.testzip())
+                infos = {info.filename[len(self.root.name) + 1:]: info for info in archive_file.infolist()}
+                self.assertEqual({name: archive_file.read(info) for name, info in infos.items()}, self.files)
+            for name, info in infos.items():
+                self.assertEqual(info.compress_type, expected(name), (compression, name))
+
+    def test_export_list_and_invalid_requests(self):
+        os.makedirs(self.tmpdir / 'output' / 'output_20260102_000000')
+        os.makedirs(self.tmpdir / 'output' / 'not_an_export')
+        exports = self.client.get(reverse('annotator:export_list')).json()['exports']
+        self.assertEqual(
+            [(export['timestamp'], export['yaml_filename']) for export in exports],
+            [('20260102_000000', None), ('20260101_000000', 'data.yaml')]
+        )
+        self.assertEqual(exports[1]['download_url'], reverse('annotator:download_export', args=['20260101_000000']))
+
+        self.assertEqual(self.download(format='rar')[0].status_code, 400)
+        self.assertEqual(self.download(compression='bzip2')[0].status_code, 400)
+        for timestamp in ('20991231_000000', 'latest'):
+            response = self.client.get(reverse('annotator:download_export', args=[timestamp]))
+            self.assertEqual(response.status_code, 404, timestamp)
+
+
+class ImportYoloTests(TempDirMixin, TestCase):
+    """YOLOデータセットの取り込みで画像・アノテーション・集計値が正しく登録されることを確認"""
+
+    def temp_settings(self):
+        return dict(PROJECT_ROOT=self.tmpdir, BASE_IMAGES_DIR=self.tmpdir / 'base_images')
+
+    def setUp(self):
+        super().setUp()
+        self.dataset = self.tmpdir / 'dataset'
+        for split in ('train', 'val'):
+            os.makedirs(self.dataset / 'images' / split)
+            os.makedirs(self.dataset / 'labels' / split)
+        (self.dataset / 'data.yaml').write_text(
+            'path: .\ntrain: images/train\nval: images/val\nnames: [cat, dog]\n', encoding='utf-8'
+        )
+        for name, split, lines in [
+            ('a', 'train', ['0 0.5 0.5 0.2 0.2', '1 0.3 0.3 0.1 0.1']),
+            ('b', 'train', ['1 0.1 0.1 0.3 0.1 0.3 0.3', 'broken line']),  # 多角形は外接矩形に変換
+            ('c', 'val', []),  # 空のラベルファイルは対象物のない画像
+            ('d', 'val', None),  # ラベルファイルなしは未アノテーション
+        ]:
+            Image.new('RGB', (40, 30)).save(self.dataset / 'images' / split / f'{name}.jpg')
+            if lines is not None:
+                (self.dataset / 'labels' / split / f'{name}.txt').write_text('\n'.join(lines), encoding='utf-8')
+        Label.objects.create(name='dog', color='#000000')
+
+    def test_import(self):
+        result = import_yolo(self.dataset, prefix='imported')
+        self.assertEqual(result['images_created'], 4)
+        self.assertEqual(result['annotations_created'], 3)
+        self.assertEqual(result['labels_created'], 1)
+        self.assertEqual(result['invalid_lines'], 1)
+
+        images = {image.filename: image for image in ImageFile.objects.all()}
+        self.assertEqual(sorted(images), ['imported/train/a.jpg', 'imported/train/b.jpg',
+                                          'imported/val/c.jpg', 'imported/val/d.jpg'])
+        self.assertEqual(
+            [(images[f'imported/{name}.jpg'].annotation_count, images[f'imported/{name}.jpg'].is_annotated)
+             for name in ('train/a', 'train/b', 'val/c', 'val/d')],
+            [(2, True), (1, True), (0, True), (0, False)]
+        )
+        self.assertEqual((images['imported/train/a.jpg'].width, images['imported/train/a.jpg'].height), (40, 30))
+        self.assertTrue((self.tmpdir / 'base_images' / 'imported' / 'val' / 'd.jpg').exists())
+
+        polygon = Annotation.objects.get(image=images['imported/train/b.jpg'])
+        self.assertAlmostEqual(polygon.x_center, 0.2)
+        self.assertAlmostEqual(polygon.width, 0.2)
+        self.assertEqual(dict(Label.objects.values_list('name', 'usage_count')), {'cat': 1, 'dog': 2})
+
+    def test_reimport(self):
+        import_yolo(self.dataset, prefix='imported')
+        skipped = import_yolo(self.dataset, prefix='imported')
+        self.assertEqual(skipped.get('annotations_created', 0), 0)
+
+        import_yolo(self.dataset, prefix='imported', on_existing='replace')
+        self.assertEqual(Annotation.objects.count(), 3)
+        self.assertEqual(dict(Label.objects.values_list('name', 'usage_count')), {'cat': 1, 'dog': 2})
+
+        import_yolo(self.dataset, prefix='imported', on_existing='append')
+        self.assertEqual(Annotation.objects.count(), 6)
+        self.assertEqual(ImageFile.objects.get(filename='imported/train/a.jpg').annotation_count, 4)
+        self.assertEqual(dict(Label.objects.values_list('name', 'usage_count')), {'cat': 2, 'dog': 4})
+
+    def test_paths_outside_allowed_dirs(self):
+        outside = self.tmpdir / 'outside'
+        os.makedirs(outside / 'secret')
+        Image.new('RGB', (40, 30)).save(outside / 'secret' / 'private.jpg')
+        allowed = [self.dataset]
+
+        # YAMLの train が ../ や絶対パスで許可したフォルダの外を指している場合は取り込まない
+        for entry in ('../outside/secret', str(outside / 'secret')):
+            (self.dataset / 'data.yaml').write_text(f'train: {entry}\nnames: [cat]\n', encoding='utf-8')
+            with self.assertRaises(ValueError):
+                import_yolo(self.dataset, prefix='imported', allowed_dirs=allowed)
+        self.assertFalse(ImageFile.objects.exists())
+
+        # シンボリックリンクのフォルダはたどらない
+        (self.dataset / 'data.yaml').write_text('train: images/train\nnames: [cat, dog]\n', encoding='utf-8')
+        os.symlink(outside / 'secret', self.dataset / 'images' / 'train' / 'linked')
+        result = import_yolo(self.dataset, prefix='imported', allowed_dirs=allowed)
+        self.assertEqual(result['total_images'], 2)
+        self.assertFalse(ImageFile.objects.filter(filename__contains='private').exists())
+
+
+    def test_image_folders_outside_dataset(self):
+        # YAMLが隣のフォルダを指していても、画像は base_images/<prefix>/ の中に配置する
+        shared = self.tmpdir / 'shared'
+        for split in ('train', 'val'):
+            os.makedirs(shared / 'images' / split)
+            Image.new('RGB', (40, 30)).save(shared / 'images' / split / f'{split}.jpg')
+        (self.dataset / 'data.yaml').write_text(
+            'train: ../shared/images/train\nval: ../shared/images/val\nnames: [cat]\n', encoding='utf-8'
+        )
+        result = import_yolo(self.dataset, prefix='imported', allowed_dirs=[self.tmpdir])
+        self.assertEqual(result['images_created'], 2)
+        self.assertEqual(sorted(ImageFile.objects.values_list('filename', flat=True)),
+                         ['imported/train/train.jpg', 'imported/val/val.jpg'])
+        self.assertTrue((self.tmpdir / 'base_images' / 'imported' / 'train' / 'train.jpg').exists())
+        self.assertEqual(sorted(os.listdir(self.tmpdir / 'base_images')), ['imported'])
+
+        for prefix in ('../escaped', 'a/../../escaped'):
+            with self.assertRaises(ValueError):
+                import_yolo(self.dataset, prefix=prefix)
+        self.assertEqual(ImageFile.objects.count(), 2)
+
+
+class JobQueueTests(TestCase):
+    """ジョブの確保が重複せず、異常終了したワーカーのジョブが回収されることを確認"""
+
+    def test_claim_oldest_pending_job(self):
+        first = jobs.enqueue('load_images')
+        second = jobs.enqueue('load_images')
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual((claimed.status, claimed.attempts), (Job.STATUS_RUNNING, 1))
+        self.assertIsNotNone(claimed.heartbeat_at)
+        self.assertEqual(jobs.claim_next_job().id, second.id)
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_racing_claims(self):
+        first = jobs.enqueue('load_images')
+        second = jobs.enqueue('load_images')
+        claim_job = jobs.claim_job
+
+        def other_worker_wins(job_id):
+            # 待機中のジョブを見つけてから確保するまでの間に、別のワーカーが同じジョブを確保する
+            self.assertIsNotNone(claim_job(job_id))
+            return claim_job(job_id)
+
+        attempts = iter([other_worker_wins, claim_job])
+        with mock.patch('annotator.jobs.claim_job', side_effect=lambda job_id: next(attempts)(job_id)):
+            claimed = jobs.claim_next_job()
+        # 先を越されたジョブは1回だけ確保され、こちらは次のジョブを確保する
+        self.assertEqual(claimed.id, second.id)
+        self.assertEqual(Job.objects.get(id=first.id).attempts, 1)
+        self.assertIsNone(claim_job(first.id))
+
+    def test_reclaim_stale_jobs(self):
+        stale = timezone.now() - timedelta(seconds=jobs.STALE_AFTER + 1)
+        retry = jobs.enqueue('load_images')
+        give_up = jobs.enqueue('load_images')
+        alive = jobs.enqueue('load_images')
+        for job in (retry, give_up, alive):
+            jobs.claim_job(job.id)
+        Job.objects.filter(id__in=[retry.id, give_up.id]).update(heartbeat_at=stale)
+        Job.objects.filter(id=give_up.id).update(attempts=jobs.MAX_ATTEMPTS)
+
+        self.assertEqual(jobs.reclaim_stale_jobs(), (1, 1))
+        statuses = dict(Job.objects.values_list('id', 'status'))
+        self.assertEqual(
+            [statuses[retry.id], statuses[give_up.id], statuses[alive.id]],
+            [Job.STATUS_PENDING, Job.STATUS_ERROR, Job.STATUS_RUNNING]
+        )
+
+        # 回収されたジョブを元のワーカーが後から終えても、再実行中のジョブを上書きしない
+        original = Job.objects.get(id=retry.id)
+        original.status, original.attempts = Job.STATUS_RUNNING, 1
+        rerun = jobs.claim_job(retry.id)
+        with mock.patch.dict(jobs.JOB_HANDLERS, {'load_images': lambda params, progress: {'message': 'done'}}):
+            jobs.run_job(original)
+        self.assertEqual(Job.objects.get(id=retry.id).status, Job.STATUS_RUNNING)
+        with mock.patch.dict(jobs.JOB_HANDLERS, {'load_images': lambda params, progress: {'message': 'done'}}):
+            jobs.run_job(rerun)
+        self.assertEqual(Job.objects.get(id=retry.id).status, Job.STATUS_SUCCESS)
+
+
+    def test_progress_polling(self):
+        response = self.client.post(reverse('annotator:load_images'))
+        job_id = response.json()['job_id']
+        status_url = reverse('annotator:job_status', args=[job_id])
+        self.assertEqual(self.client.get(status_url).json()['job']['status'], Job.STATUS_PENDING)
+        polled = []
+
+        def handler(params, progress):
+            progress(1, 3)
+            progress(2, 3)  # 直前の保存から PROGRESS_INTERVAL 経っていないので保存しない
+            polled.append(self.client.get(status_url).json()['job'])
+            progress(3, 3)
+            return {'message': '3個の新しい画像を読み込みました'}
+
+        with mock.patch.dict(jobs.JOB_HANDLERS, {'load_images': handler}):
+            jobs.run_worker(once=True)
+        self.assertEqual(
+            (polled[0]['status'], polled[0]['progress_done'], polled[0]['progress_total']),
+            (Job.STATUS_RUNNING, 1, 3)
+        )
+        job = self.client.get(status_url).json()['job']
+        self.assertEqual(
+            (job['status'], job['progress_done'], job['message']), (Job.STATUS_SUCCESS, 3, '3個の新しい画像を読み込みました')
+        )
+        self.assertEqual([row['id'] for row in self.client.get(reverse('annotator:job_list')).json()['jobs']], [job_id])
+        self.assertEqual(self.client.get(reverse('annotator:job_status', args=[job_id + 1])).status_code, 404)
+
+    def test_failed_job_records_error(self):
+        job = jobs.enqueue('load_images')
+
+        def handler(params, progress):
+            raise FileNotFoundError('base_imagesフォルダが見つかりません')
+
+        with mock.patch.dict(jobs.JOB_HANDLERS, {'load_images': handler}):
+            jobs.run_worker(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.message), (Job.STATUS_ERROR, 'base_imagesフォルダが見つかりません'))
+        self.assertIsNotNone(job.finished_at)
+        with self.assertRaises(ValueError):
+            jobs.enqueue('unknown')
+
+    def test_worker_survives_database_errors(self):
+        job = jobs.enqueue('load_images')
+        claim_next_job = jobs.claim_next_job
+        failures = iter([OperationalError('database is locked'), OperationalError('connection lost')])
+
+        def flaky_claim():
+            # 最初の2回はデータベースに接続できない
+            error = next(failures, None)
+            if error is not None:
+                raise error
+            return claim_next_job()
+
+        with mock.patch('annotator.jobs.claim_next_job', side_effect=flaky_claim), \
+                mock.patch('annotator.jobs.time.sleep') as sleep, \
+                mock.patch('annotator.jobs.close_old_connections') as close_old_connections, \
+                mock.patch.dict(jobs.JOB_HANDLERS, {'load_images': lambda params, progress: {'message': 'done'}}):
+            jobs.run_worker(poll_interval=1, once=True)
+        # 再試行するたびに待つ時間を延ばす
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2])
+        self.assertEqual(Job.objects.get(id=job.id).status, Job.STATUS_SUCCESS)
+        # 取り出す前（4回）とジョブの後（1回）に古い接続を閉じる
+        self.assertEqual(close_old_connections.call_count, 5)
+
+
+def _load_main_module():
+    """プロジェクト直下の起動スクリプト（main.py）をモジュールとして読み込む"""
+    spec = importlib.util.spec_from_file_location('yolo_annotator_main', settings.PROJECT_ROOT / 'main.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ProductionLaunchTests(TempDirMixin, SimpleTestCase):
+    """本番モードの起動設定（秘密鍵・許可するホスト・サーバーのコマンド・DB接続）を確認"""
+
+    def setUp(self):
+        super().setUp()
+        self.main = _load_main_module()
+
+    def settings_value(self, name, **env):
+        """環境変数を指定して設定モジュールを新しいプロセスで読み込み、設定値を返す"""
+        # 実行中の環境の YOLO_* は引き継がない
+        base_env = {key: value for key, value in os.environ.items() if not key.startswith('YOLO_')}
+        env = {**base_env, 'DJANGO_SETTINGS_MODULE': 'yolo_annotator.settings', **env}
+        completed = subprocess.run(
+            [sys.executable, '-c', f'from django.conf import settings; print(repr(settings.{name}))'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        return completed.returncode, completed.stdout.strip(), completed.stderr
+
+    def test_secret_key_is_generated_once(self):
+        path = self.tmpdir / '.secret_key'
+        key = self.main.load_or_create_secret_key(path)
+        self.assertGreaterEqual(len(key), 50)
+        self.assertEqual(path.stat().st_mode & 0o777, 0o600)
+        self.assertEqual(self.main.load_or_create_secret_key(path), key)
+        path.write_text('')
+        self.assertNotEqual(self.main.load_or_create_secret_key(path), key)
+
+    def test_allowed_hosts(self):
+        self.assertEqual(self.main.default_allowed_hosts('127.0.0.1'), ['localhost', '127.0.0.1'])
+        self.assertEqual(self.main.default_allowed_hosts('192.168.0.5'), ['localhost', '127.0.0.1', '192.168.0.5'])
+        with mock.patch.object(self.main.socket, 'gethostbyname_ex',
+                               return_value=('annotator', ['annotator.lan'], ['192.168.0.5'])):
+            hosts = self.main.default_allowed_hosts('0.0.0.0')
+        self.assertEqual(hosts, ['localhost', '127.0.0.1', 'annotator', 'annotator.lan', '192.168.0.5'])
+        self.assertNotIn('*', hosts)
+
+    def test_production_command(self):
+        args = self.main.parse_args(['--production', '--bind', '0.0.0.0:9000', '--workers', '3',
+                                     '--server', 'gunicorn', '--interface', 'asgi'])
+        command = self.main.production_command(args)
+        self.assertEqual(command[command.index('--worker-class') + 1], 'uvicorn_worker.UvicornWorker')
+        self.assertIn('yolo_annotator.asgi:application', command)
+        args.interface = 'wsgi'
+        command = self.main.production_command(args)
+        self.assertEqual(command[command.index('--worker-class') + 1], 'gthread')
+        args.server = 'uvicorn'
+        command = self.main.production_command(args)
+        self.assertEqual(command[command.index('--host') + 1:command.index('--port') + 2], ['0.0.0.0', '--port', '9000'])
+
+    def test_settings_refuse_insecure_key(self):
+        returncode, _, stderr = self.settings_value('SECRET_KEY', YOLO_DEBUG='0', YOLO_SECRET_KEY='')
+        self.assertNotEqual(returncode, 0)
+        self.assertIn('ImproperlyConfigured', stderr)
+        self.assertEqual(self.settings_value('DEBUG', YOLO_DEBUG='0', YOLO_SECRET_KEY='x' * 50)[:2], (0, 'False'))
+
+    def test_conn_max_age_per_interface(self):
+        for interface, expected in (('asgi', '0'), ('wsgi', '60')):
+            self.assertEqual(self.settings_value('CONN_MAX_AGE', YOLO_INTERFACE=interface)[:2], (0, expected), interface)
+
+
+class SplittingTests(TestCase):
+    """分割がシードとファイル名だけで決まり、層化でまれなラベルも各分割に入ることを確認"""
+
+    def images(self, count, start=0):
+        return [(i, f'img_{i:05d}.jpg') for i in range(start, start + count)]
+
+    def test_deterministic_and_order_independent(self):
+        images = self.images(1000)
+        first = assign_splits(images, (0.7, 0.2, 0.1), seed=3)
+        again = assign_splits(list(reversed(images)), (0.7, 0.2, 0.1), seed=3)
+        self.assertEqual([(name, sorted(split)) for name, split in first],
+                         [(name, sorted(split)) for name, split in again])
+        self.assertEqual([name for name, _ in first], ['train', 'valid', 'test'])
+        # 比率どおり（ハッシュによる割り当てのため近似）
+        self.assertEqual([round(len(split), -2) for _, split in first], [700, 200, 100])
+
+        other_seed = assign_splits(images, (0.7, 0.2, 0.1), seed=4)
+        self.assertNotEqual(first, other_seed)
+
+    def test_existing_images_keep_their_split(self):
+        before = dict(
+            (image, name) for name, split in assign_splits(self.images(500), (0.8, 0.2, 0), seed=1)
+            for image in split
+        )
+        after = dict(
+            (image, name) for name, split in assign_splits(self.images(1500), (0.8, 0.2, 0), seed=1)
+            for image in split
+        )
+        self.assertTrue(all(after[image] == name for image, name in before.items()))
+
+    def test_stratified_split_includes_rare_labels(self):
+        common = Label.objects.create(name='common')
+        rare = Label.objects.create(name='rare')
+        images = []
+        for i in range(200):
+            image = ImageFile.objects.create(filename=f'img_{i:03d}.jpg', width=10, height=10, is_annotated=True)
+            Annotation.objects.create(image=image, label=common, x_center=0.5, y_center=0.5, width=0.1, height=0.1)
+            if i < 4:
+                # まれなラベルを含む画像は、そのラベルのグループになる
+                Annotation.objects.create(image=image, label=rare, x_center=0.5, y_center=0.5, width=0.1, height=0.1)
+            images.append((image.id, image.filename))
+
+        with self.assertNumQueries(1):
+            strata = fetch_strata([image_id for image_id, _ in images])
+        self.assertEqual(list(strata.values()).count(rare.id), 4)
+
+        splits = dict(split_images(images, 0.5, 0.25, seed=0, stratify=True))
+        for name in ('train', 'valid', 'test'):
+            self.assertTrue(any(strata[image_id] == rare.id for image_id, _ in splits[name]))
+        self.assertEqual([len(splits[name]) for name in ('train', 'valid', 'test')], [100, 50, 50])
+        self.assertEqual(split_images(images, 0.5, 0.25, seed=0, stratify=True), list(splits.items()))
+
+
+class LabelTransformTests(SimpleTestCase):
+    """NumPyによる一括の座標変換が、1ボックスずつの変換と同じ結果になることを確認"""
+
+    def setUp(self):
+        rng = random.Random(20)
+        self.target_size = 640
+        self.geometry = {}
+        rows = []
+        for image_id in rng.sample(range(1, 1000), 50):
+            original = (rng.randint(1, 8000), rng.randint(1, 8000))
+            scale = min(self.target_size / original[0], self.target_size / original[1], 1)
+            resized = (max(1, round(original[0] * scale)), max(1, round(original[1] * scale)))
+            paste = rng.choice([(0, 0), ((self.target_size - resized[0]) // 2, (self.target_size - resized[1]) // 2)])
+            self.geometry[image_id] = (original, resized, paste)
+            # 範囲外の座標も混ぜてクリップを確認（ボックスのない画像も含む）
+            for _ in range(rng.randint(0, 30)):
+                rows.append((image_id, rng.randint(1, 20), *(rng.uniform(-0.2, 1.2) for _ in range(4))))
+        rows.sort(key=lambda row: row[0])
+        self.boxes = np.array(rows, dtype=BOX_DTYPE)
+
+    def reference(self, row):
+        """1ボックスずつの変換（以前の書き出し処理と同じ計算）"""
+        image_id, label_id, x_center, y_center, width, height = row
+        (original_width, original_height), (resized_width, resized_height), (paste_x, paste_y) = self.geometry[image_id]
+        scale_x = resized_width / original_width
+        scale_y = resized_height / original_height
+        new_x_center = (x_center * original_width * scale_x + paste_x) / self.target_size
+        new_y_center = (y_center * original_height * scale_y + paste_y) / self.target_size
+        new_width = width * original_width * scale_x / self.target_size
+        new_height = height * original_height * scale_y / self.target_size
+        return label_id, *(max(0, min(1, value)) for value in (new_x_center, new_y_center, new_width, new_height))
+
+    def test_transform_matches_per_box_transform(self):
+        coords = transform_boxes(self.boxes, self.geometry, self.target_size)
+        for row, transformed in zip(self.boxes.tolist(), coords.tolist()):
+            self.assertEqual(tuple(transformed), self.reference(row)[1:])
+
+    def test_label_files_match_per_box_output(self):
+        tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmpdir)
+        label_paths = {image_id: tmpdir / 'labels' / 'train' / f'{image_id}.txt' for image_id in self.geometry}
+
+        coords = transform_boxes(self.boxes, self.geometry, self.target_size)
+        writer = YoloWriter(tmpdir, [], self.target_size)
+        for image_id, label_ids, image_coords in iter_image_boxes(label_paths, self.boxes, coords):
+            writer.write_image('train', image_id, f'{image_id}.jpg', label_ids, image_coords)
+
+        for image_id, label_path in label_paths.items():
+            # 以前の書き出し処理と同じ書式
+            expected = ''.join(
+                f"{label_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n"
+                for label_id, x, y, w, h in (
+                    self.reference(row) for row in self.boxes.tolist() if row[0] == image_id
+                )
+            )
+            self.assertEqual(label_path.read_text(), expected)
+
+    def test_empty(self):
+        boxes = np.array([], dtype=BOX_DTYPE)
+        self.assertEqual(transform_boxes(boxes, self.geometry, self.target_size).shape, (0, 4))
+        self.assertEqual(transform_boxes(boxes, {}, self.target_size).shape, (0, 4))
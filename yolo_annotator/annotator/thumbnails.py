@@ -0,0 +1,157 @@
+"""
+一覧表示用サムネイルのディスクキャッシュ
+サムネイルは元画像のパス・更新時刻・ファイルサイズと出力サイズから求めたキーで保存し、
+キャッシュ全体の容量が THUMBNAIL_CACHE_MAX_BYTES を超えたら最終アクセスの古いものから削除します（LRU）。
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .imaging import make_thumbnail
+
+logger = logging.getLogger(__name__)
+
+# 容量超過時は上限のこの割合まで削除する（削除処理が頻発しないよう余裕を持たせる）
+EVICT_TARGET_RATIO = 0.9
+
+# このプロセスで把握しているキャッシュ容量（初回アクセス時にディレクトリを走査して求める）
+_cache_bytes = None
+
+
+def thumbnail_key(src_path, size):
+    """元画像の状態と出力サイズからキャッシュキーを作成（ETagとしても使用）"""
+    stat = os.stat(src_path)
+    raw = f"{src_path}|{stat.st_mtime_ns}|{stat.st_size}|{size}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(settings.THUMBNAIL_CACHE_DIR, key[:2], key + '.jpg')
+
+
+def _iter_cache_files():
+    """キャッシュ内のファイルを (パス, サイズ, 最終アクセス時刻) で返す"""
+    cache_dir = settings.THUMBNAIL_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        return
+    with os.scandir(cache_dir) as subdirs:
+        for subdir in subdirs:
+            if not subdir.is_dir():
+                continue
+            with os.scandir(subdir.path) as entries:
+                for entry in entries:
+                    # 作成中の一時ファイルは削除対象にしない
+                    if entry.is_file() and not entry.name.endswith('.tmp'):
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime
+
+
+def cache_usage():
+    """キャッシュの合計容量（バイト）"""
+    return sum(size for _, size, _ in _iter_cache_files())
+
+
+def evict(max_bytes=None):
+    """容量上限を超えている場合、最終アクセスの古いサムネイルから削除"""
+    global _cache_bytes
+    max_bytes = settings.THUMBNAIL_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    files = list(_iter_cache_files())
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    if total > max_bytes:
+        target = max_bytes * EVICT_TARGET_RATIO
+        for path, size, _ in sorted(files, key=lambda f: f[2]):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        logger.info('サムネイルキャッシュを%d件削除しました', removed)
+    _cache_bytes = total
+    return removed
+
+
+def _record_write(nbytes):
+    """新しく書き込んだ容量を加算し、上限を超えたら削除処理を実行"""
+    global _cache_bytes
+    if _cache_bytes is None:
+        _cache_bytes = cache_usage()
+    else:
+        _cache_bytes += nbytes
+    if _cache_bytes > settings.THUMBNAIL_CACHE_MAX_BYTES:
+        evict()
+
+
+def get_thumbnail(src_path, size, key=None):
+    """サムネイルのパスを返す（キャッシュになければ作成）"""
+    key = key or thumbnail_key(src_path, size)
+    path = _cache_path(key)
+    if os.path.exists(path):
+        # LRU判定のため最終アクセス時刻として更新時刻を更新
+        now = time.time()
+        os.utime(path, (now, now))
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 同時リクエストで書きかけのファイルを配信しないよう、一時ファイルに書いてから置き換える
+    # （同じプロセスの別スレッドが同じサムネイルを作成することもあるため、スレッドごとに別のファイルにする）
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        make_thumbnail(src_path, tmp_path, size)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _record_write(os.path.getsize(path))
+    return path
+
+
+def _make_thumbnail_task(task):
+    src_path, dst_path, size = task
+    try:
+        make_thumbnail(src_path, dst_path, size)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def build_thumbnails(src_paths, sizes=None, workers=None, progress=None):
+    """サムネイルを事前に一括作成し、新しく作成した件数を返す"""
+    sizes = sizes or settings.THUMBNAIL_SIZES
+    tasks = []
+    cache_paths = []
+    for src_path in src_paths:
+        for size in sizes:
+            try:
+                path = _cache_path(thumbnail_key(src_path, size))
+            except OSError:
+                continue
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tasks.append((src_path, f"{path}.{os.getpid()}.tmp", size))
+                cache_paths.append(path)
+
+    created = 0
+    total = len(tasks)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_make_thumbnail_task, tasks, chunksize=16)
+        for done, (task, path, error) in enumerate(zip(tasks, cache_paths, results), 1):
+            src_path, tmp_path, size = task
+            if error is None:
+                os.replace(tmp_path, path)
+                _record_write(os.path.getsize(path))
+                created += 1
+            else:
+                logger.warning('サムネイル作成エラー %s: %s', src_path, error)
+            if progress:
+                progress(done, total)
+    return created
@@ -0,0 +1,193 @@
+"""
+巨大画像を表示するためのタイルピラミッドのディスクキャッシュ
+レベル0が原寸で、レベルが1つ上がるごとに縦横半分に縮小した画像を TILE_SIZE ピクセル四方のタイルに分割して保存します。
+タイルはレベル単位で、初めて要求されたときにそのレベルとそれより粗いレベルをまとめて作成します。
+キャッシュ全体の容量が TILE_CACHE_MAX_BYTES を超えたら、最終アクセスの古い画像のピラミッドから削除します（LRU）。
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image
+
+from .imaging import level_size, make_tile_levels
+
+logger = logging.getLogger(__name__)
+
+# 容量超過時は上限のこの割合まで削除する
+EVICT_TARGET_RATIO = 0.9
+
+# このプロセスで把握しているキャッシュ容量（初回の書き込み時にディレクトリを走査して求める）
+_cache_bytes = None
+
+# 同じ画像のタイルを複数のスレッドで同時に作成しないためのロック
+# 画像ごとに作ると際限なく増えるため、固定数のロックをキャッシュキーで振り分ける
+_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def is_tiled(width, height):
+    """タイル表示の対象となる大きさの画像か"""
+    return max(width, height) >= settings.TILED_VIEW_MIN_SIDE
+
+
+def level_count(width, height, tile_size=None):
+    """最も粗いレベルが1枚のタイルに収まるまでのレベル数"""
+    tile_size = tile_size or settings.TILE_SIZE
+    levels = 1
+    while max(level_size(width, height, levels - 1)) > tile_size:
+        levels += 1
+    return levels
+
+
+def tile_info(width, height, tile_url):
+    """アノテーション画面に渡すタイル表示の情報（タイル表示しない画像はNone）
+
+    tile_url は {level} {col} {row} を含むタイルのURLのテンプレートです。
+    """
+    if not is_tiled(width, height):
+        return None
+    return {
+        'tile_size': settings.TILE_SIZE,
+        'levels': level_count(width, height),
+        'url': tile_url,
+    }
+
+
+def pyramid_key(src_path):
+    """元画像の状態とタイルの設定からキャッシュキーを作成（ETagとしても使用）"""
+    stat = os.stat(src_path)
+    raw = f"{src_path}|{stat.st_mtime_ns}|{stat.st_size}|{settings.TILE_SIZE}|{settings.TILE_QUALITY}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _pyramid_dir(key):
+    return os.path.join(settings.TILE_CACHE_DIR, key[:2], key)
+
+
+def _lock_for(key):
+    return _LOCKS[int(key[:8], 16) % len(_LOCKS)]
+
+
+def _iter_pyramids():
+    """キャッシュ内のピラミッドを (パス, 最終アクセス時刻) で返す"""
+    cache_dir = settings.TILE_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        return
+    with os.scandir(cache_dir) as subdirs:
+        for subdir in subdirs:
+            if not subdir.is_dir():
+                continue
+            with os.scandir(subdir.path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        yield entry.path, entry.stat().st_mtime
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def cache_usage():
+    """キャッシュの合計容量（バイト）"""
+    return sum(_dir_size(path) for path, _ in _iter_pyramids())
+
+
+def evict(max_bytes=None):
+    """容量上限を超えている場合、最終アクセスの古い画像のピラミッドから削除"""
+    global _cache_bytes
+    max_bytes = settings.TILE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    pyramids = [(path, _dir_size(path), mtime) for path, mtime in _iter_pyramids()]
+    total = sum(size for _, size, _ in pyramids)
+    removed = 0
+    if total > max_bytes:
+        target = max_bytes * EVICT_TARGET_RATIO
+        for path, size, _ in sorted(pyramids, key=lambda p: p[2]):
+            if total <= target:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        logger.info('タイルキャッシュから画像%d件分を削除しました', removed)
+    _cache_bytes = total
+    return removed
+
+
+def _record_write(nbytes):
+    """新しく書き込んだ容量を加算し、上限を超えたら削除処理を実行"""
+    global _cache_bytes
+    if _cache_bytes is None:
+        _cache_bytes = cache_usage()
+    else:
+        _cache_bytes += nbytes
+    if _cache_bytes > settings.TILE_CACHE_MAX_BYTES:
+        evict()
+
+
+def _build_levels(src_path, pyramid_dir, level, levels):
+    """指定したレベルと、まだ作成されていないそれより粗いレベルのタイルを作成"""
+    missing = [
+        candidate for candidate in range(level, levels)
+        if not os.path.isdir(os.path.join(pyramid_dir, str(candidate)))
+    ]
+    if not missing:
+        return
+
+    # 書きかけのタイルを配信しないよう、一時フォルダに作成してからフォルダごと置き換える
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    tmp_dirs = {candidate: os.path.join(pyramid_dir, str(candidate) + suffix) for candidate in missing}
+    started = time.monotonic()
+    try:
+        written = make_tile_levels(src_path, tmp_dirs, settings.TILE_SIZE, settings.TILE_QUALITY)
+        for candidate, tmp_dir in tmp_dirs.items():
+            try:
+                os.rename(tmp_dir, os.path.join(pyramid_dir, str(candidate)))
+            except OSError:
+                # 別のプロセスが先に作成した
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        for tmp_dir in tmp_dirs.values():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    logger.info('タイル作成: %s レベル%s (%.1f秒)', src_path, missing, time.monotonic() - started)
+    _record_write(written)
+
+
+def get_tile(src_path, level, col, row, key=None):
+    """タイルのパスを返す（キャッシュになければそのレベルのタイルを作成）
+
+    画像の範囲外のタイルを指定した場合は ValueError を送出します。
+    """
+    key = key or pyramid_key(src_path)
+    pyramid_dir = _pyramid_dir(key)
+    path = os.path.join(pyramid_dir, str(level), f"{col}_{row}.jpg")
+    if os.path.exists(path):
+        # LRU判定のため最終アクセス時刻としてピラミッドのフォルダの更新時刻を更新
+        now = time.time()
+        os.utime(pyramid_dir, (now, now))
+        return path
+
+    with Image.open(src_path) as img:
+        width, height = img.size
+    levels = level_count(width, height)
+    if not 0 <= level < levels:
+        raise ValueError(f'レベルが範囲外です: {level}')
+    level_width, level_height = level_size(width, height, level)
+    if not (0 <= col * settings.TILE_SIZE < level_width and 0 <= row * settings.TILE_SIZE < level_height):
+        raise ValueError(f'タイルの位置が範囲外です: {col}, {row}')
+
+    os.makedirs(pyramid_dir, exist_ok=True)
+    with _lock_for(key):
+        _build_levels(src_path, pyramid_dir, level, levels)
+    return path
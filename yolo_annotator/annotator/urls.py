@@ -8,13 +8,23 @@ app_name = 'annotator'
 urlpatterns = [
     path('', views.index, name='index'),
     path('annotate/<int:image_id>/', views.annotate, name='annotate'),
+    path('api/images/', views.image_list, name='image_list'),
+    path('api/images/<int:image_id>/', views.image_workspace, name='image_workspace'),
     path('api/save_annotations/<int:image_id>/', views.save_annotations, name='save_annotations'),
+    path('api/annotations/<int:image_id>/', views.annotations_api, name='annotations_api'),
     path('api/load_images/', views.load_images, name='load_images'),
     path('api/split_dataset/', views.split_dataset, name='split_dataset'),
+    path('api/import_yolo/', views.import_yolo, name='import_yolo'),
+    path('api/exports/', views.export_list, name='export_list'),
+    path('api/exports/<str:timestamp>/download/', views.download_export, name='download_export'),
+    path('api/jobs/', views.job_list, name='job_list'),
+    path('api/jobs/<int:job_id>/', views.job_status, name='job_status'),
     path('api/add_label/', views.add_label, name='add_label'),
     path('api/delete_label/<int:label_id>/', views.delete_label, name='delete_label'),
     path('api/update_label/<int:label_id>/', views.update_label, name='update_label'),
-    path('images/<str:filename>', views.serve_image, name='serve_image'),
+    path('images/<path:filename>', views.serve_image, name='serve_image'),
+    path('thumbnails/<int:size>/<path:filename>', views.serve_thumbnail, name='serve_thumbnail'),
+    path('tiles/<int:level>/<int:col>/<int:row>/<path:filename>', views.serve_tile, name='serve_tile'),
 ]
 
 # 開発環境での画像ファイル配信
@@ -1,122 +1,376 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.http import JsonResponse, HttpResponse, Http404
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import Count, Q, Exists, OuterRef, F
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 import os
+import asyncio
 import json
+import base64
+import logging
 import shutil
-import random
-import mimetypes
-from .models import ImageFile, Label, Annotation
+from collections import Counter
+import yaml
+from .models import ImageFile, Label, Annotation, Job
+from . import archive, importer, jobs, splitting, streaming, thumbnails, tiles
+from .formats import EXPORT_FORMATS
+from .imaging import letterbox_options
 
+logger = logging.getLogger(__name__)
 
-def index(request):
-    """画像一覧ページ"""
-    images = ImageFile.objects.all().order_by('filename')
-    
-    # ラベルの使用回数を取得
-    labels = Label.objects.annotate(usage_count=Count('annotation')).order_by('name')
+
+async def index(request):
+    """画像一覧ページ（画像自体は一覧APIからページ単位で読み込む）"""
+    # ラベルの使用回数は Label.usage_count に保持しているので集計しない
+    labels = [label async for label in Label.objects.order_by('name')]
     
-    # アノテーション済み画像数を計算
-    annotated_count = images.filter(is_annotated=True).count()
+    # 総画像数とアノテーション済み画像数を1クエリで集計
+    stats = await ImageFile.objects.aaggregate(
+        total=Count('id'),
+        annotated=Count('id', filter=Q(is_annotated=True))
+    )
     
     return render(request, 'annotator/index.html', {
-        'images': images,
         'labels': labels,
-        'annotated_count': annotated_count
+        'image_count': stats['total'],
+        'annotated_count': stats['annotated'],
+        'page_size': IMAGE_PAGE_SIZE
     })
 
 
-def annotate(request, image_id):
+# 画像一覧APIの1ページあたりの件数
+IMAGE_PAGE_SIZE = 200
+IMAGE_PAGE_SIZE_MAX = 1000
+
+
+def _encode_cursor(filename):
+    return base64.urlsafe_b64encode(filename.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+
+
+async def image_list(request):
+    """画像一覧API（ファイル名順のカーソルページング・絞り込み対応）
+    
+    クエリパラメータ:
+        cursor: 前ページの next_cursor（省略時は先頭から）
+        limit: 取得件数
+        annotated: true / false でアノテーション済みかどうかを絞り込み
+        label: 指定したラベルIDのアノテーションを含む画像に絞り込み
+        prefix: ファイル名の前方一致で絞り込み
+    """
+    try:
+        # 1〜IMAGE_PAGE_SIZE_MAX の範囲に収める（0件のページでは次のカーソルを作れない）
+        limit = max(1, min(int(request.GET.get('limit', IMAGE_PAGE_SIZE)), IMAGE_PAGE_SIZE_MAX))
+        cursor = request.GET.get('cursor')
+        annotated = request.GET.get('annotated', '')
+        label_id = request.GET.get('label', '')
+        prefix = request.GET.get('prefix', '')
+        
+        images = ImageFile.objects.all()
+        if annotated in ('true', 'false'):
+            images = images.filter(is_annotated=(annotated == 'true'))
+        if label_id:
+            images = images.filter(Exists(
+                Annotation.objects.filter(image=OuterRef('pk'), label_id=int(label_id))
+            ))
+        if prefix:
+            images = images.filter(filename__startswith=prefix)
+        
+        # 件数は先頭ページでのみ返す（仮想スクロールの高さ計算用）
+        count = await images.acount() if not cursor else None
+        
+        if cursor:
+            images = images.filter(filename__gt=_decode_cursor(cursor))
+        rows = [
+            row async for row in images.order_by('filename')
+            .values('id', 'filename', 'width', 'height', 'is_annotated', 'annotation_count')[:limit + 1]
+        ]
+        
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        for row in rows:
+            row['thumbnail_url'] = reverse('annotator:serve_thumbnail', args=[200, row['filename']])
+            row['list_thumbnail_url'] = reverse('annotator:serve_thumbnail', args=[80, row['filename']])
+            row['annotate_url'] = reverse('annotator:annotate', args=[row['id']])
+        
+        return JsonResponse({
+            'status': 'success',
+            'images': rows,
+            'count': count,
+            'next_cursor': _encode_cursor(rows[-1]['filename']) if has_next else None
+        })
+    
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': f'パラメータが正しくありません: {str(e)}'}, status=400)
+
+
+# 画像の切り替えに必要な画像情報のフィールド
+WORKSPACE_IMAGE_FIELDS = ('id', 'filename', 'width', 'height', 'is_annotated')
+
+
+async def annotate(request, image_id):
     """アノテーション画面"""
-    image = get_object_or_404(ImageFile, id=image_id)
-    labels = Label.objects.all()
-    annotations = Annotation.objects.filter(image=image)
+    image = await aget_object_or_404(ImageFile, id=image_id)
+    labels = [label async for label in Label.objects.all()]
+    annotations = [
+        annotation async for annotation in Annotation.objects.filter(image=image).select_related('label')
+    ]
     
-    # 次の画像と前の画像を取得
-    next_image = ImageFile.objects.filter(id__gt=image_id).first()
-    prev_image = ImageFile.objects.filter(id__lt=image_id).order_by('-id').first()
+    # 次の画像（先読みする分も含めて1クエリで取得）と前の画像を取得
+    next_images = [
+        row async for row in ImageFile.objects.filter(id__gt=image_id).order_by('id')
+        .values(*WORKSPACE_IMAGE_FIELDS)[:max(1, settings.ANNOTATION_PREFETCH_COUNT)]
+    ]
+    prev_image = await _prev_image(image_id)
+    next_image = next_images[0] if next_images else None
     
     return render(request, 'annotator/annotate.html', {
         'image': image,
         'labels': labels,
         'annotations': annotations,
         'next_image': next_image,
-        'prev_image': prev_image
+        'prev_image': prev_image,
+        'prefetch_images': _prefetch_targets(next_images, prev_image),
+        'prefetch_cache_size': settings.ANNOTATION_PREFETCH_CACHE_SIZE,
+        'tiles': _tile_info(image.width, image.height, image.filename)
+    })
+
+
+async def _prev_image(image_id):
+    return await ImageFile.objects.filter(id__lt=image_id).order_by('-id').values(*WORKSPACE_IMAGE_FIELDS).afirst()
+
+
+def _tile_info(width, height, filename):
+    """タイル表示する巨大画像の場合、タイルのURLのテンプレートなどを返す"""
+    tile_url = reverse('annotator:serve_tile', args=[0, 0, 0, filename]).replace(
+        '/0/0/0/', '/{level}/{col}/{row}/', 1
+    )
+    return tiles.tile_info(width, height, tile_url)
+
+
+def _prefetch_targets(next_images, prev_image):
+    """バックグラウンドで先読みする画像（次の画像を優先し、前の画像は最後）
+    
+    タイル表示する巨大画像は元画像を先読みしない（url は None）。
+    """
+    prefetch_count = settings.ANNOTATION_PREFETCH_COUNT
+    targets = next_images[:prefetch_count] + ([prev_image] if prev_image and prefetch_count else [])
+    return [
+        {
+            'id': item['id'],
+            'url': None if tiles.is_tiled(item['width'], item['height'])
+            else reverse('annotator:serve_image', args=[item['filename']])
+        }
+        for item in targets
+    ]
+
+
+@require_http_methods(["GET"])
+async def image_workspace(request, image_id):
+    """アノテーション画面で画像を切り替えるためのデータ（画像情報・アノテーション・前後の画像）を返すAPI"""
+    # 表示する画像と次の画像（先読みする分を含む）を1クエリで取得
+    rows = [
+        row async for row in ImageFile.objects.filter(id__gte=image_id).order_by('id')
+        .values(*WORKSPACE_IMAGE_FIELDS)[:max(1, settings.ANNOTATION_PREFETCH_COUNT) + 1]
+    ]
+    if not rows or rows[0]['id'] != image_id:
+        return JsonResponse({'status': 'error', 'message': '画像が見つかりません'}, status=404)
+    
+    image, next_images = rows[0], rows[1:]
+    prev_image = await _prev_image(image_id)
+    image['url'] = reverse('annotator:serve_image', args=[image['filename']])
+    image['tiles'] = _tile_info(image['width'], image['height'], image['filename'])
+    
+    return JsonResponse({
+        'status': 'success',
+        'image': image,
+        'annotations': [row async for row in _annotations_state(image_id)],
+        'prev_id': prev_image['id'] if prev_image else None,
+        'next_id': next_images[0]['id'] if next_images else None,
+        'prefetch': _prefetch_targets(next_images, prev_image),
+        'annotate_url': reverse('annotator:annotate', args=[image_id]),
     })
 
 
 @csrf_exempt
 @require_http_methods(["POST"]) # POSTリクエストのみを許可
-def save_annotations(request, image_id):
-    """アノテーションデータを保存"""
-    image = get_object_or_404(ImageFile, id=image_id)
+async def save_annotations(request, image_id):
+    """アノテーションデータを保存（画像のアノテーションを全て置き換える）"""
+    image = await aget_object_or_404(ImageFile, id=image_id)
     
     try:
         data = json.loads(request.body)
-        annotations_data = data.get('annotations', [])
-        
-        # 既存のアノテーションを削除
+        await sync_to_async(_replace_annotations)(image, data.get('annotations', []))
+        return JsonResponse({'status': 'success'})
+    
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+
+def _replace_annotations(image, annotations_data):
+    """画像のアノテーションを全て置き換える（トランザクションは非同期のORMで使えないため同期関数で実行）"""
+    labels = _resolve_labels(annotations_data)
+    
+    with transaction.atomic():
+        # 既存のアノテーションを削除（ラベルの使用回数を減らす分を先に集計）
+        label_deltas = Counter()
+        for row in Annotation.objects.filter(image=image).values('label_id').annotate(count=Count('id')).order_by():
+            label_deltas[row['label_id']] -= row['count']
         Annotation.objects.filter(image=image).delete()
         
-        # 新しいアノテーションを保存
-        for ann_data in annotations_data:
-            label = get_object_or_404(Label, id=ann_data['label_id'])
-            Annotation.objects.create(
-                image=image,
-                label=label,
-                x_center=ann_data['x_center'],
-                y_center=ann_data['y_center'],
-                width=ann_data['width'],
-                height=ann_data['height']
-            )
+        # 新しいアノテーションをまとめて保存
+        created = Annotation.objects.bulk_create([
+            _build_annotation(image, labels, ann_data) for ann_data in annotations_data
+        ])
+        label_deltas.update(annotation.label_id for annotation in created)
+        Label.add_usage(label_deltas)
         
         # 画像をアノテーション済みにマーク
         image.is_annotated = True
+        image.annotation_count = len(created)
         image.save()
+
+
+ANNOTATION_FIELDS = ('x_center', 'y_center', 'width', 'height')
+
+
+def _resolve_labels(*annotation_lists):
+    """アノテーションで使われているラベルを1クエリで取得"""
+    label_ids = {int(ann_data['label_id']) for annotations in annotation_lists for ann_data in annotations}
+    labels = Label.objects.in_bulk(label_ids)
+    missing = label_ids - set(labels)
+    if missing:
+        raise ValueError(f'ラベルが見つかりません: {sorted(missing)}')
+    return labels
+
+
+def _build_annotation(image, labels, ann_data):
+    annotation = Annotation(image=image, label=labels[int(ann_data['label_id'])])
+    for field in ANNOTATION_FIELDS:
+        setattr(annotation, field, float(ann_data[field]))
+    return annotation
+
+
+def _annotations_state(image):
+    """画像（インスタンスまたはID）のアノテーションをクライアント用のJSON形式で返すクエリセット"""
+    return Annotation.objects.filter(image=image).order_by('id').values(
+        'id', 'label_id', 'x_center', 'y_center', 'width', 'height',
+        label_name=F('label__name'), label_color=F('label__color')
+    )
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+async def annotations_api(request, image_id):
+    """アノテーションの取得（GET）と差分保存（POST）
+    
+    POSTの形式:
+        added: 追加するアノテーション（client_id に一時IDを指定）
+        updated: 変更するアノテーション（id を指定）
+        deleted: 削除するアノテーションIDのリスト
+    
+    保存後のアノテーション一覧と、一時IDから保存後のIDへの対応（id_map）を返します。
+    """
+    image = await aget_object_or_404(ImageFile, id=image_id)
+    
+    if request.method == 'GET':
+        return JsonResponse({'status': 'success', 'annotations': [row async for row in _annotations_state(image)]})
+    
+    try:
+        data = json.loads(request.body)
+        added = data.get('added', [])
+        updated = data.get('updated', [])
+        deleted = [int(ann_id) for ann_id in data.get('deleted', [])]
+        created = await sync_to_async(_apply_annotation_changes)(image, added, updated, deleted)
         
-        return JsonResponse({'status': 'success'})
+        id_map = {
+            str(ann_data['client_id']): annotation.id
+            for ann_data, annotation in zip(added, created)
+            if 'client_id' in ann_data
+        }
+        
+        return JsonResponse({
+            'status': 'success',
+            'annotations': [row async for row in _annotations_state(image)],
+            'id_map': id_map
+        })
     
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'JSONデータの形式が正しくありません'}, status=400)
+    except (KeyError, TypeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': f'アノテーションデータが正しくありません: {str(e)}'}, status=400)
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)})
 
 
-def load_images(request):
-    """base_imagesフォルダから画像を読み込み"""
-    try:
-        base_images_dir = settings.BASE_IMAGES_DIR
-        if not os.path.exists(base_images_dir):
-            os.makedirs(base_images_dir)
-            return JsonResponse({'status': 'error', 'message': 'base_imagesフォルダが見つかりません'})
-        
-        # 画像ファイルを検索
-        image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
-        image_files = [f for f in os.listdir(base_images_dir) 
-                      if f.lower().endswith(image_extensions)]
-        
-        created_count = 0
-        for filename in image_files:
-            if not ImageFile.objects.filter(filename=filename).exists():
-                filepath = os.path.join(base_images_dir, filename)
-                try:
-                    from PIL import Image
-                    with Image.open(filepath) as img:
-                        width, height = img.size
-                    
-                    ImageFile.objects.create(
-                        filename=filename,
-                        width=width,
-                        height=height
-                    )
-                    created_count += 1
-                except Exception as e:
-                    print(f"Error processing {filename}: {e}")
+def _apply_annotation_changes(image, added, updated, deleted):
+    """アノテーションの追加・変更・削除をまとめて保存し、作成したアノテーションを返す"""
+    labels = _resolve_labels(added, updated)
+    
+    with transaction.atomic():
+        # 画像のアノテーション数とラベルの使用回数の増減
+        count_delta = 0
+        label_deltas = Counter()
+        
+        if deleted:
+            targets = Annotation.objects.filter(image=image, id__in=deleted)
+            removed = list(targets.values_list('label_id', flat=True))
+            targets.delete()
+            count_delta -= len(removed)
+            label_deltas.subtract(removed)
+        
+        if updated:
+            existing = Annotation.objects.filter(image=image).in_bulk([int(ann['id']) for ann in updated])
+            now = timezone.now()
+            changed = []
+            for ann_data in updated:
+                annotation = existing.get(int(ann_data['id']))
+                if annotation is None:
+                    continue  # 他の保存で削除済み
+                label_deltas[annotation.label_id] -= 1
+                annotation.label = labels[int(ann_data['label_id'])]
+                label_deltas[annotation.label_id] += 1
+                for field in ANNOTATION_FIELDS:
+                    setattr(annotation, field, float(ann_data[field]))
+                annotation.updated_at = now
+                changed.append(annotation)
+            Annotation.objects.bulk_update(changed, ['label'] + list(ANNOTATION_FIELDS) + ['updated_at'])
+        
+        created = Annotation.objects.bulk_create([
+            _build_annotation(image, labels, ann_data) for ann_data in added
+        ])
+        count_delta += len(created)
+        label_deltas.update(annotation.label_id for annotation in created)
+        Label.add_usage(label_deltas)
         
+        # 画像をアノテーション済みにマーク
+        ImageFile.objects.filter(id=image.id).update(
+            is_annotated=True,
+            annotation_count=F('annotation_count') + count_delta,
+            updated_at=timezone.now()
+        )
+    
+    return created
+
+
+async def load_images(request):
+    """base_imagesフォルダからの画像読み込みをジョブとして登録"""
+    try:
+        job = await sync_to_async(jobs.enqueue)('load_images')
         return JsonResponse({
-            'status': 'success', 
-            'message': f'{created_count}個の新しい画像を読み込みました'
+            'status': 'success',
+            'job_id': job.id,
+            'message': '画像の読み込みを開始しました'
         })
     
     except Exception as e:
@@ -125,167 +379,142 @@ def load_images(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def split_dataset(request):
-    """データセットをtrain/validに分割し、学習用YAMLファイルを生成"""
+async def split_dataset(request):
+    """データセット分割（train/valid/testとYAML生成）をジョブとして登録"""
     try:
         data = json.loads(request.body)
         split_ratio = float(data.get('split_ratio', 0.8))  # デフォルト8:2
+        test_ratio = float(data.get('test_ratio', 0))
+        seed = int(data.get('seed', 0))  # 同じシードなら同じ分割
+        stratify = bool(data.get('stratify', False))
+        letterbox = data.get('letterbox') or {}  # settings.EXPORT_LETTERBOX を上書きする変換設定
         target_size = int(data.get('image_size', 640))  # デフォルト640x640
+        formats = data.get('formats') or ['yolo']  # 複数指定時も画像の変換は1回
+        dry_run = bool(data.get('dry_run', False))  # 一部の画像で試して出力サイズと処理時間を見積もる
+        if isinstance(formats, str):
+            formats = [formats]
+        
+        unknown = [name for name in formats if name not in EXPORT_FORMATS]
+        if unknown:
+            return JsonResponse({'status': 'error', 'message': f'未知の出力形式です: {", ".join(map(str, unknown))}'})
+        try:
+            splitting.split_ratios(split_ratio, test_ratio)
+            letterbox_options(**{**settings.EXPORT_LETTERBOX, **letterbox})
+        except (TypeError, ValueError) as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
         
         # アノテーション済みの画像のみを対象
-        annotated_images = ImageFile.objects.filter(is_annotated=True)
-        
-        if not annotated_images.exists():
+        if not await ImageFile.objects.filter(is_annotated=True).aexists():
             return JsonResponse({'status': 'error', 'message': 'アノテーション済みの画像がありません'})
         
-        # 現在の日時を取得してフォルダ名に使用
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # 日付付きの出力フォルダを作成
-        dated_output_dir = settings.PROJECT_ROOT / 'output' / f'output_{timestamp}'
-        train_images_dir = dated_output_dir / 'images' / 'train'
-        valid_images_dir = dated_output_dir / 'images' / 'valid'
-        train_labels_dir = dated_output_dir / 'labels' / 'train'
-        valid_labels_dir = dated_output_dir / 'labels' / 'valid'
-        
-        # ランダムに分割
-        images_list = list(annotated_images)
-        random.shuffle(images_list)
-        
-        train_count = int(len(images_list) * split_ratio)
-        train_images = images_list[:train_count]
-        valid_images = images_list[train_count:]
-        
-        # 画像処理に必要なライブラリをインポート
-        from PIL import Image, ImageOps
-        
-        # ファイルをコピー・リサイズ
-        for images, target_img_dir, target_label_dir in [
-            (train_images, train_images_dir, train_labels_dir),
-            (valid_images, valid_images_dir, valid_labels_dir)
-        ]:
-            os.makedirs(target_img_dir, exist_ok=True)
-            os.makedirs(target_label_dir, exist_ok=True)
-            
-            for image in images:
-                # 画像ファイルを読み込み
-                src_img_path = os.path.join(settings.BASE_IMAGES_DIR, image.filename)
-                dst_img_path = os.path.join(target_img_dir, image.filename)
-                
-                # 画像をリサイズ・パディング
-                with Image.open(src_img_path) as img:
-                    # RGBに変換（必要に応じて）
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    
-                    original_width, original_height = img.size
-                    
-                    # 画像をターゲットサイズに合わせてリサイズ（アスペクト比を保持）
-                    img.thumbnail((target_size, target_size), Image.Resampling.LANCZOS)
-                    resized_width, resized_height = img.size
-                    
-                    # 正方形のキャンバスを作成（白でパディング）
-                    new_img = Image.new('RGB', (target_size, target_size), (255, 255, 255))
-                    
-                    # 画像をキャンバスの左上に配置
-                    paste_x = 0
-                    paste_y = 0
-                    new_img.paste(img, (paste_x, paste_y))
-                    
-                    # リサイズした画像を保存
-                    new_img.save(dst_img_path, quality=95)
-                    
-                    # スケール比とオフセットを計算
-                    scale_x = resized_width / original_width
-                    scale_y = resized_height / original_height
-                    offset_x = paste_x / target_size
-                    offset_y = paste_y / target_size
-                
-                # ラベルファイルを作成（座標を変換）
-                label_filename = os.path.splitext(image.filename)[0] + '.txt'
-                label_path = os.path.join(target_label_dir, label_filename)
-                
-                with open(label_path, 'w') as f:
-                    annotations = Annotation.objects.filter(image=image)
-                    for ann in annotations:
-                        # 元の座標を取得
-                        orig_x_center = ann.x_center
-                        orig_y_center = ann.y_center
-                        orig_width = ann.width
-                        orig_height = ann.height
-                        
-                        # 元の画像サイズでの絶対座標に変換
-                        abs_x_center = orig_x_center * original_width
-                        abs_y_center = orig_y_center * original_height
-                        abs_width = orig_width * original_width
-                        abs_height = orig_height * original_height
-                        
-                        # リサイズ後の絶対座標に変換
-                        new_abs_x_center = abs_x_center * scale_x + paste_x
-                        new_abs_y_center = abs_y_center * scale_y + paste_y
-                        new_abs_width = abs_width * scale_x
-                        new_abs_height = abs_height * scale_y
-                        
-                        # 新しい画像サイズでの相対座標に変換
-                        new_x_center = new_abs_x_center / target_size
-                        new_y_center = new_abs_y_center / target_size
-                        new_width = new_abs_width / target_size
-                        new_height = new_abs_height / target_size
-                        
-                        # 座標が範囲内に収まるようにクリップ
-                        new_x_center = max(0, min(1, new_x_center))
-                        new_y_center = max(0, min(1, new_y_center))
-                        new_width = max(0, min(1, new_width))
-                        new_height = max(0, min(1, new_height))
-                        
-                        # YOLO形式で出力
-                        f.write(f"{ann.label.id} {new_x_center:.6f} {new_y_center:.6f} {new_width:.6f} {new_height:.6f}\n")
-        
-        # YAMLファイルを生成（日付付きフォルダ内に）
-        yaml_dir = dated_output_dir
-        os.makedirs(yaml_dir, exist_ok=True)
-        
-        # ファイル名に日時を含める
-        yaml_filename = f"dataset_{target_size}x{target_size}_{timestamp}.yaml"
-        yaml_path = os.path.join(yaml_dir, yaml_filename)
-        
-        # ラベルの情報を取得
-        all_labels = Label.objects.all().order_by('id')
-        label_names = {label.id: label.name for label in all_labels}
-        
-        # データセットのルートパスを日付付きフォルダからの相対パスで設定
-        # データセットのルートパスはmanage.pyからの相対パスで設定
-        dataset_root = f"../output/output_{timestamp}"
-        
-        # YAMLファイルの内容を作成
-        yaml_content = f"""# Train/val/test sets as 1) dir: path/to/imgs, 2) file: path/to/imgs.txt, or 3) list: [path/to/imgs1, path/to/imgs2, ..]
-path: {dataset_root} # dataset root dir
-train: images/train # train images
-val: images/valid # val images
-test: # test images (optional)
-
-# Classes
-names:
-"""
-        
-        # クラス名の部分を追加
-        for label_id, label_name in label_names.items():
-            yaml_content += f"  {label_id}: {label_name}\n"
-        
-        # YAMLファイルを保存
-        with open(yaml_path, 'w', encoding='utf-8') as f:
-            f.write(yaml_content)
+        # 画像処理はワーカープロセスのエクスポートエンジンで実行
+        job = await sync_to_async(jobs.enqueue)('split_dataset', {
+            'split_ratio': split_ratio, 'test_ratio': test_ratio, 'seed': seed, 'stratify': stratify,
+            'image_size': target_size, 'formats': formats, 'letterbox': letterbox, 'dry_run': dry_run
+        })
         
         return JsonResponse({
             'status': 'success',
-            'message': f'データセットを分割しました (train: {len(train_images)}, valid: {len(valid_images)})\n画像サイズ: {target_size}x{target_size}\n出力フォルダ: output_{timestamp}\nYAMLファイルを生成しました: {yaml_filename}'
+            'job_id': job.id,
+            'message': 'エクスポートの見積もりを開始しました' if dry_run else 'データセットの分割を開始しました'
         })
     
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)})
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+async def import_yolo(request):
+    """YOLO形式データセットの取り込みをジョブとして登録"""
+    try:
+        data = json.loads(request.body)
+        path = str(data.get('path', '')).strip()
+        prefix = str(data.get('prefix') or '').strip() or None
+        on_existing = data.get('on_existing', 'skip')
+        
+        if not path:
+            return JsonResponse({'status': 'error', 'message': 'フォルダを指定してください'})
+        if on_existing not in importer.ON_EXISTING_CHOICES:
+            return JsonResponse({'status': 'error', 'message': f'on_existing の値が正しくありません: {on_existing}'})
+        if not importer.path_within(path, settings.IMPORT_ALLOWED_DIRS):
+            return JsonResponse({'status': 'error', 'message': 'このフォルダからは取り込めません'})
+        if not await asyncio.to_thread(os.path.isdir, path):
+            return JsonResponse({'status': 'error', 'message': f'フォルダが見つかりません: {path}'})
+        # YAMLの path・train などが取り込みを許可したフォルダの外を指していないか確認（ジョブでも再確認する）
+        try:
+            await asyncio.to_thread(importer.read_dataset_yaml, path, settings.IMPORT_ALLOWED_DIRS)
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+        
+        job = await sync_to_async(jobs.enqueue)('import_yolo', {
+            'path': os.path.realpath(path), 'prefix': prefix, 'on_existing': on_existing
+        })
+        return JsonResponse({
+            'status': 'success',
+            'job_id': job.id,
+            'message': 'YOLOデータセットの取り込みを開始しました'
+        })
+    
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+
+async def export_list(request):
+    """出力済みのデータセット一覧を返す"""
+    exports = await asyncio.to_thread(archive.list_exports)
+    for export in exports:
+        export['download_url'] = reverse('annotator:download_export', args=[export['timestamp']])
+    return JsonResponse({'status': 'success', 'exports': exports})
+
+
+@require_http_methods(["GET"])
+async def download_export(request, timestamp):
+    """出力済みのデータセット（画像・ラベル・YAML）をZIPまたはtarでストリーミング配信
+    
+    クエリパラメータ:
+        format: zip（既定） / tar
+        compression: ZIPの圧縮方式。auto（既定、JPEG・PNGは無圧縮でそれ以外は圧縮） / stored / deflate
+    """
+    archive_format = request.GET.get('format', 'zip')
+    compression = request.GET.get('compression', 'auto')
+    if archive_format not in archive.ARCHIVE_FORMATS or compression not in archive.COMPRESSION_MODES:
+        return JsonResponse({'status': 'error', 'message': 'format または compression の指定が正しくありません'}, status=400)
+    
+    root = await asyncio.to_thread(archive.export_dir, timestamp)
+    if root is None:
+        raise Http404("出力フォルダが見つかりません")
+    
+    base_name = root.name
+    if archive_format == 'tar':
+        # tarは無圧縮なので全体のサイズを先に計算できる
+        size = await asyncio.to_thread(archive.tar_size, root, base_name)
+        response = streaming.stream_iterator(request, archive.stream_tar(root, base_name), 'application/x-tar')
+        response['Content-Length'] = str(size)
+    else:
+        response = streaming.stream_iterator(
+            request, archive.stream_zip(root, base_name, compression), 'application/zip'
+        )
+    response['Content-Disposition'] = f'attachment; filename="{base_name}.{archive_format}"'
+    # nginxなどのリバースプロキシでバッファリングさせない
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def job_list(request):
+    """最近のジョブ一覧を返す"""
+    return JsonResponse({
+        'status': 'success',
+        'jobs': [job.to_dict() async for job in Job.objects.order_by('-id')[:20]]
+    })
+
+
+async def job_status(request, job_id):
+    """ジョブの進捗を返す（ポーリング用）"""
+    job = await aget_object_or_404(Job, id=job_id)
+    return JsonResponse({'status': 'success', 'job': job.to_dict()})
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def add_label(request):
@@ -329,7 +558,7 @@ def delete_label(request, label_id):
         label = get_object_or_404(Label, id=label_id)
         
         # このラベルを使用しているアノテーションがあるかチェック
-        annotation_count = Annotation.objects.filter(label=label).count()
+        annotation_count = label.usage_count
         if annotation_count > 0:
             return JsonResponse({
                 'status': 'error', 
@@ -394,39 +623,140 @@ def update_label(request, label_id):
         return JsonResponse({'status': 'error', 'message': f'ラベルの更新に失敗しました: {str(e)}'})
 
 
-def serve_image(request, filename):
-    """base_images フォルダから画像を配信"""
-    print(f"=== 画像リクエスト受信: {filename} ===")
+def _resolve_image_path(filename):
+    """base_images内の画像の絶対パスを返す（存在しない・フォルダ外を指す場合は404）"""
+    file_path = os.path.join(settings.BASE_IMAGES_DIR, filename)
+    
+    # サブフォルダの画像も配信するため、base_imagesの外を指すパスは拒否
+    base_dir = os.path.realpath(settings.BASE_IMAGES_DIR)
+    if os.path.commonpath([base_dir, os.path.realpath(file_path)]) != base_dir:
+        raise Http404("画像が見つかりません")
+    
+    if not os.path.isfile(file_path):
+        raise Http404("画像が見つかりません")
     
+    return file_path
+
+
+def _stat_image(filename):
+    """画像の絶対パスと os.stat の結果を返す（ファイルシステムを参照するためスレッドで実行）"""
+    file_path = _resolve_image_path(filename)
+    return file_path, os.stat(file_path)
+
+
+def _not_modified(request, etag, last_modified=None):
+    """条件付きリクエストに該当する場合は304（または412）のレスポンスを返す"""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        _set_validators(response, etag, last_modified)
+    return response
+
+
+def _set_validators(response, etag, last_modified=None):
+    """ETag と Last-Modified ヘッダーを設定"""
+    response.headers.setdefault('ETag', etag)
+    if last_modified is not None:
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+
+
+@require_http_methods(["GET", "HEAD"])
+async def serve_image(request, filename):
+    """base_images フォルダから画像をストリーミング配信（Range・条件付きリクエスト対応）
+    
+    ファイルの確認と読み込みはスレッドで行い、イベントループを止めずに多数の同時リクエストを処理します。
+    """
     try:
-        file_path = os.path.join(settings.BASE_IMAGES_DIR, filename)
-        print(f"ファイルパス: {file_path}")
-        print(f"BASE_IMAGES_DIR: {settings.BASE_IMAGES_DIR}")
-        
-        if not os.path.exists(file_path):
-            print(f"ファイルが見つかりません: {file_path}")
-            raise Http404("画像が見つかりません")
-        
-        print(f"ファイル存在確認: OK")
-        
-        with open(file_path, 'rb') as f:
-            content = f.read()
-        
-        content_type, _ = mimetypes.guess_type(file_path)
-        if content_type is None:
-            content_type = 'application/octet-stream'
-        
-        print(f"画像配信成功: {filename}, サイズ: {len(content)}, content-type: {content_type}")
-        response = HttpResponse(content, content_type=content_type)
-        response['Cache-Control'] = 'max-age=3600'  # 1時間キャッシュ
-        response['Access-Control-Allow-Origin'] = '*'
-        response['Access-Control-Allow-Methods'] = 'GET'
-        response['Access-Control-Allow-Headers'] = 'Content-Type'
+        file_path, stat = await asyncio.to_thread(_stat_image, filename)
+    except OSError:
+        raise Http404("画像が見つかりません")
+    
+    etag = streaming.stat_etag(stat)
+    last_modified = int(stat.st_mtime)
+    response = _not_modified(request, etag, last_modified)
+    if response is not None:
         return response
-        
+    
+    try:
+        response = streaming.stream_file(
+            request, file_path,
+            etag=etag,
+            sendfile_path=filename,
+            size=stat.st_size
+        )
+    except OSError as e:
+        logger.error('画像配信エラー %s: %s', filename, e)
+        raise Http404("画像の読み込みに失敗しました")
+    
+    logger.debug('画像配信: %s (status=%s)', filename, response.status_code)
+    _set_validators(response, etag, last_modified)
+    response['Cache-Control'] = 'max-age=3600'  # 1時間キャッシュ
+    response['Access-Control-Allow-Origin'] = '*'
+    response['Access-Control-Allow-Methods'] = 'GET'
+    response['Access-Control-Allow-Headers'] = 'Content-Type, Range'
+    return response
+
+
+def _thumbnail_source(filename, size):
+    file_path = _resolve_image_path(filename)
+    return file_path, thumbnails.thumbnail_key(file_path, size)
+
+
+@require_http_methods(["GET", "HEAD"])
+async def serve_thumbnail(request, size, filename):
+    """一覧表示用のサムネイルを配信（キャッシュになければスレッドで作成）"""
+    if size not in settings.THUMBNAIL_SIZES:
+        raise Http404("サムネイルサイズが不正です")
+    
+    try:
+        file_path, key = await asyncio.to_thread(_thumbnail_source, filename, size)
+    except OSError:
+        raise Http404("画像が見つかりません")
+    
+    etag = quote_etag(key)
+    response = _not_modified(request, etag)
+    if response is not None:
+        return response
+    
+    try:
+        thumbnail_path = await asyncio.to_thread(thumbnails.get_thumbnail, file_path, size, key)
     except Exception as e:
-        print(f"画像配信エラー: {str(e)}")
-        raise Http404(f"画像の読み込みに失敗しました: {str(e)}")
+        logger.warning('サムネイル作成エラー %s: %s', filename, e)
+        raise Http404("サムネイルを作成できません")
+    
+    response = streaming.stream_file(request, thumbnail_path, etag=etag)
+    _set_validators(response, etag)
+    response['Cache-Control'] = 'max-age=3600'  # 1時間キャッシュ（以降はETagで再検証）
+    return response
 
 
+def _tile_source(filename):
+    file_path = _resolve_image_path(filename)
+    return file_path, tiles.pyramid_key(file_path)
 
+
+@require_http_methods(["GET", "HEAD"])
+async def serve_tile(request, level, col, row, filename):
+    """巨大画像のタイルを配信（キャッシュになければスレッドで作成）"""
+    try:
+        file_path, key = await asyncio.to_thread(_tile_source, filename)
+    except OSError:
+        raise Http404("画像が見つかりません")
+    
+    etag = quote_etag(f"{key}-{level}-{col}-{row}")
+    response = _not_modified(request, etag)
+    if response is not None:
+        return response
+    
+    try:
+        tile_path = await asyncio.to_thread(tiles.get_tile, file_path, level, col, row, key)
+    except ValueError as e:
+        raise Http404(str(e))
+    except Exception as e:
+        logger.warning('タイル作成エラー %s: %s', filename, e)
+        raise Http404("タイルを作成できません")
+    
+    response = streaming.stream_file(request, tile_path, etag=etag)
+    _set_validators(response, etag)
+    response['Cache-Control'] = 'max-age=86400'  # 元画像が変わるとETagが変わるため長めにキャッシュ
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yolo_annotator.settings')
+# settings.CONN_MAX_AGE の既定値をASGI向けにする（設定の読み込み前に指定）
+os.environ['YOLO_INTERFACE'] = 'asgi'
 
 application = get_asgi_application()
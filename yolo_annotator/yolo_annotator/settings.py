@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -20,12 +23,19 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-*j(-9z+&iz7t5*tb6vvqizfoyz9ht(9+dg_b9lvubumwe%610t'
+INSECURE_SECRET_KEY = 'django-insecure-*j(-9z+&iz7t5*tb6vvqizfoyz9ht(9+dg_b9lvubumwe%610t'
+SECRET_KEY = os.environ.get('YOLO_SECRET_KEY', INSECURE_SECRET_KEY)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# 本番モード（main.py --production）では YOLO_DEBUG=0 で起動します
+DEBUG = os.environ.get('YOLO_DEBUG', '1') != '0'
+
+# 公開されている既定の秘密鍵のまま本番モードで起動しない（main.py は鍵を生成して YOLO_SECRET_KEY に設定します）
+if not DEBUG and SECRET_KEY == INSECURE_SECRET_KEY:
+    raise ImproperlyConfigured('YOLO_DEBUG=0 では YOLO_SECRET_KEY に秘密鍵を設定してください')
 
-ALLOWED_HOSTS = []
+# カンマ区切りで指定（DEBUG時は空でもlocalhostからアクセス可能）
+ALLOWED_HOSTS = [host for host in os.environ.get('YOLO_ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -74,12 +84,54 @@ WSGI_APPLICATION = 'yolo_annotator.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# 既定はSQLite。環境変数 YOLO_DB_ENGINE=postgresql でPostgreSQLに切り替えます
+# （接続先は POSTGRES_DB / POSTGRES_USER / POSTGRES_PASSWORD / POSTGRES_HOST / POSTGRES_PORT）。
+DB_ENGINE = os.environ.get('YOLO_DB_ENGINE', 'sqlite')
+
+# 接続を使い回す秒数（0: リクエストごとに接続し直す / None: 無期限）
+# ASGIではリクエストごとに別のスレッドで同期処理が実行され、使い回す接続がスレッドごとに残り続けるため、
+# ASGI（asgi.py が YOLO_INTERFACE=asgi を設定）の既定値は0、WSGI（runserver・gthread）は60秒です。
+INTERFACE = os.environ.get('YOLO_INTERFACE', 'wsgi')
+CONN_MAX_AGE = int(os.environ.get('YOLO_DB_CONN_MAX_AGE', '0' if INTERFACE == 'asgi' else '60'))
+
+# SQLiteの調整（YOLO_SQLITE_TUNING=0 でSQLiteの既定の動作に戻す）
+SQLITE_TUNING = os.environ.get('YOLO_SQLITE_TUNING', '1') != '0'
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'yolo_annotator'),
+            'USER': os.environ.get('POSTGRES_USER', 'yolo_annotator'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
-}
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('YOLO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # 書き込むトランザクションは開始時にロックを取得し、途中でのロック昇格による失敗を防ぐ
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'} if SQLITE_TUNING else {},
+        }
+    }
+else:
+    raise ValueError(f'YOLO_DB_ENGINE に未対応の値が指定されています: {DB_ENGINE}')
+
+# SQLiteの接続ごとに設定するPRAGMA（annotator.db.configure_sqlite で適用）
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',       # 読み込みと書き込みを同時に実行できるようにする
+    'busy_timeout': 20000,       # ロック中は最大20秒待ってから「database is locked」にする
+    'synchronous': 'NORMAL',     # WALではコミットごとのfsyncを省略しても破損しない
+    'mmap_size': 268435456,      # 256MBまでメモリマップで読み込む
+} if SQLITE_TUNING else {}
 
 
 # Password validation
@@ -120,6 +172,19 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     BASE_DIR / "annotator" / "static",
 ]
+# collectstatic の出力先（本番モードではここからWhiteNoiseが配信）
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# 本番ではファイル名にハッシュを付けてgzip/brotli圧縮したファイルを作成し、
+# ハッシュ付きのファイルには1年間のキャッシュヘッダーを付けて配信する
+if not DEBUG:
+    # 静的ファイルを圧縮済みファイル・長期キャッシュ付きで配信（DEBUG時はrunserverが配信）
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      'whitenoise.middleware.WhiteNoiseMiddleware')
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+    }
 
 # Media files (user uploaded images)
 MEDIA_URL = '/media/'
@@ -136,6 +201,50 @@ TRAIN_LABELS_DIR = PROJECT_ROOT / 'output' / 'labels' / 'train'
 VALID_LABELS_DIR = PROJECT_ROOT / 'output' / 'labels' / 'valid'
 TRAINING_YAML_DIR = PROJECT_ROOT / 'output' / 'training_yaml'
 
+# 一覧表示用サムネイルのキャッシュ
+THUMBNAIL_CACHE_DIR = PROJECT_ROOT / 'cache' / 'thumbnails'
+THUMBNAIL_SIZES = (80, 200)  # リスト表示・グリッド表示で使用する短辺のピクセル数
+THUMBNAIL_CACHE_MAX_BYTES = 512 * 1024 * 1024  # キャッシュ容量の上限（超過時は古いものから削除）
+
+# エクスポート用にリサイズした画像のキャッシュ（出力フォルダへはハードリンクする）
+EXPORT_CACHE_DIR = PROJECT_ROOT / 'cache' / 'export'
+EXPORT_CACHE_MAX_BYTES = 10 * 1024 * 1024 * 1024  # キャッシュ容量の上限（超過時は古いものから削除）
+
+# エクスポート画像の変換設定（imaging.letterbox_options の引数、省略した項目は既定値）
+# 変更するとエクスポートキャッシュのキーも変わる。速度と画質の比較は benchmark_letterbox コマンドで確認できる
+EXPORT_LETTERBOX = {
+    'resample': 'lanczos',  # nearest / box / bilinear / hamming / bicubic / lanczos
+    'padding': 'top-left',  # top-left / center
+    'fill': '#FFFFFF',
+    'quality': 95,
+    'draft': True,  # JPEGを縮小した解像度で直接デコード
+    'reducing_gap': 2.0,  # 出力サイズの2倍までは reduce で縮小してからリサンプリング（None で無効）
+    'output_format': 'keep',  # keep / jpeg / png / webp
+}
+
+# 画面から取り込めるYOLOデータセットの場所（このフォルダ以下のみ指定可能。管理コマンドは制限なし）
+IMPORT_ALLOWED_DIRS = [PROJECT_ROOT]
+
+# 画像配信をWebサーバーに委譲する場合の設定
+# None: Djangoがストリーミング配信 / 'x-accel-redirect': nginx / 'x-sendfile': Apache (mod_xsendfile)
+IMAGE_SENDFILE_BACKEND = None
+# X-Accel-Redirect で使用する nginx の internal location（base_imagesを指すように設定）
+IMAGE_SENDFILE_URL_PREFIX = '/protected/base_images/'
+
+# アノテーション画面で先読みする後続画像の枚数と、ブラウザ側で保持する先読みキャッシュの件数
+ANNOTATION_PREFETCH_COUNT = 3
+ANNOTATION_PREFETCH_CACHE_SIZE = 8
+
+# 巨大画像（長辺がTILED_VIEW_MIN_SIDE以上）はタイルピラミッドに分割して表示する
+TILED_VIEW_MIN_SIDE = 8192
+TILE_SIZE = 256
+TILE_QUALITY = 85
+TILE_CACHE_DIR = PROJECT_ROOT / 'cache' / 'tiles'
+TILE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # キャッシュ容量の上限（超過時は古い画像のタイルから削除）
+
+# PILで開ける画像の最大画素数（既定値では航空写真や病理画像が「解凍爆弾」として拒否されるため引き上げる）
+IMAGE_MAX_PIXELS = 2_000_000_000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 